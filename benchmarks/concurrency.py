@@ -0,0 +1,176 @@
+"""Benchmark de escrituras concurrentes con cada perfil de configuración.
+
+Uso:
+    python -m benchmarks.concurrency [--writers 1 2 4 8] [--readers 0] [--duration 5]
+                                     [--profiles development production] [--database URL]
+
+Simula varios workers de gunicorn: cada escritor es un proceso con su propia app
+que reporta averías (POST /stations/<id>/breakdowns/report) en bucle durante
+--duration segundos. Opcionalmente hay lectores que consultan la ficha de una
+estación a la vez. Por cada perfil y número de escritores se muestra el número
+de escrituras por segundo, la latencia p50/p95/p99 y los errores por bloqueo
+("database is locked").
+
+Con SQLite se usa un fichero temporal nuevo por perfil, porque el modo WAL queda
+guardado en el propio fichero. Con --database postgresql://... se usa esa base
+de datos (debe estar vacía) para todos los perfiles.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+N_STATIONS = 50
+BENCH_USER = 'bench_admin'
+BENCH_PASSWORD = 'bench'
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+def setup_database(profile):
+    """Crea el usuario y las estaciones sobre las que escriben los workers."""
+    from toolkit import create_app, db
+    from toolkit.models import User
+    from toolkit.station_models import Station
+    from toolkit.summary import refresh_summaries
+
+    app = create_app(profile)
+    with app.app_context():
+        if User.query.filter_by(username=BENCH_USER).first() is None:
+            admin = User(username=BENCH_USER, email='bench_admin@example.com', is_admin=True)
+            admin.set_password(BENCH_PASSWORD)
+            db.session.add(admin)
+            db.session.flush()
+            stations = [
+                Station(name=f'Estación {i:03d}', island='Tenerife', municipality='Municipio 1',
+                        location='Benchmark', created_by=admin.id)
+                for i in range(N_STATIONS)
+            ]
+            db.session.add_all(stations)
+            db.session.flush()
+            # Los resúmenes se crean antes para que los workers sólo los actualicen
+            refresh_summaries([station.id for station in stations])
+            db.session.commit()
+        station_ids = [station_id for (station_id,) in db.session.query(Station.id)]
+        db.engine.dispose()
+    return station_ids
+
+
+def worker(profile, role, station_ids, start_at, duration, seed):
+    """Proceso escritor o lector. Devuelve (rol, latencias en ms, errores de bloqueo, otros errores)."""
+    from sqlalchemy.exc import OperationalError
+    from toolkit import create_app, db
+
+    app = create_app(profile)
+    app.config['TESTING'] = True
+    # El log por petición de la instrumentación SQL (perfil de desarrollo) no interesa aquí
+    logging.getLogger('toolkit.sql').setLevel(logging.WARNING)
+    client = app.test_client()
+    client.post('/auth/login', data={'username': BENCH_USER, 'password': BENCH_PASSWORD})
+    rng = random.Random(seed)
+
+    latencies, locked, failed = [], 0, 0
+    time.sleep(max(0, start_at - time.time()))
+    deadline = start_at + duration
+    while time.time() < deadline:
+        station_id = rng.choice(station_ids)
+        started = time.perf_counter()
+        try:
+            if role == 'writer':
+                response = client.post(f'/stations/{station_id}/breakdowns/report', data={
+                    'title': 'Avería concurrente', 'description': 'Benchmark', 'severity': 'media',
+                })
+            else:
+                response = client.get(f'/stations/{station_id}')
+        except OperationalError as e:
+            if 'locked' in str(e) or 'busy' in str(e):
+                locked += 1
+            else:
+                failed += 1
+            continue
+        if response.status_code >= 400:
+            failed += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    with app.app_context():
+        db.engine.dispose()
+    return role, latencies, locked, failed
+
+
+def run_round(pool, profile, station_ids, writers, readers, duration):
+    # Todos los procesos empiezan a la vez, después de crear su app e iniciar sesión
+    start_at = time.time() + 3
+    jobs = [(profile, 'writer', station_ids, start_at, duration, i) for i in range(writers)]
+    jobs += [(profile, 'reader', station_ids, start_at, duration, 1000 + i) for i in range(readers)]
+    results = pool.starmap(worker, jobs)
+
+    summary = {}
+    for role in ('writer', 'reader'):
+        latencies = [latency for r, lat, _, _ in results if r == role for latency in lat]
+        summary[role] = {
+            'ops': len(latencies),
+            'per_second': len(latencies) / duration,
+            'p50': statistics.median(latencies) if latencies else 0.0,
+            'p95': percentile(latencies, 95) if latencies else 0.0,
+            'p99': percentile(latencies, 99) if latencies else 0.0,
+            'locked': sum(lock for r, _, lock, _ in results if r == role),
+            'failed': sum(fail for r, _, _, fail in results if r == role),
+        }
+    return summary
+
+
+def run(writer_counts=(1, 2, 4, 8), readers=0, duration=5.0, profiles=('development', 'production'), database=None):
+    print(f'{"perfil":12} {"escritores":>10} {"escr./s":>8} {"p50":>8} {"p95":>8} {"p99":>8} '
+          f'{"bloqueos":>9} {"errores":>8}' + (f' {"lect./s":>8} {"p95 lect.":>9}' if readers else ''))
+
+    ok = True
+    for profile in profiles:
+        if database:
+            url = database
+        else:
+            url = f'sqlite:///{os.path.join(tempfile.mkdtemp(prefix="toolkit-concurrency-"), "bench.db")}'
+        # config.py lee DATABASE_URL al importarse: cada proceso hijo lo hereda
+        os.environ['DATABASE_URL'] = url
+
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(1) as pool:
+            station_ids = pool.apply(setup_database, (profile,))
+        with context.Pool(max(writer_counts) + readers) as pool:
+            for writers in writer_counts:
+                result = run_round(pool, profile, station_ids, writers, readers, duration)
+                w, r = result['writer'], result['reader']
+                line = (f'{profile:12} {writers:10d} {w["per_second"]:8.1f} {w["p50"]:8.1f} {w["p95"]:8.1f} '
+                        f'{w["p99"]:8.1f} {w["locked"]:9d} {w["failed"]:8d}')
+                if readers:
+                    line += f' {r["per_second"]:8.1f} {r["p95"]:9.1f}'
+                print(line)
+                if profile == 'production' and (w['locked'] or w['failed'] or r['locked'] or r['failed']):
+                    ok = False
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rendimiento de escrituras concurrentes por perfil de configuración')
+    parser.add_argument('--writers', type=int, nargs='+', default=[1, 2, 4, 8], help='número de escritores por ronda')
+    parser.add_argument('--readers', type=int, default=0, help='lectores concurrentes en cada ronda')
+    parser.add_argument('--duration', type=float, default=5.0, help='segundos por ronda')
+    parser.add_argument('--profiles', nargs='+', default=['development', 'production'],
+                        help='perfiles de config.py a comparar')
+    parser.add_argument('--database', help='URL de la base de datos (por defecto, un SQLite temporal por perfil)')
+    args = parser.parse_args(argv)
+    # Termina con código 1 si el perfil de producción tiene errores por bloqueo
+    return 0 if run(args.writers, args.readers, args.duration, args.profiles, args.database) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
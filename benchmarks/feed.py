@@ -0,0 +1,141 @@
+"""Benchmark del canal de cambios en tiempo real (GET /events/stations, toolkit.feed).
+
+Uso:
+    python -m benchmarks.feed [--clients 100] [--changes 200] [--stations 50]
+
+Crea una base de datos SQLite temporal, abre --clients conexiones SSE (la mitad
+sin filtro y la otra mitad filtrando por una estación) y reporta --changes
+averías repartidas entre las estaciones. Comprueba que cada cliente recibe
+exactamente los eventos que le corresponden, mide el retraso entre la respuesta
+del reporte y la llegada del evento y cuenta las consultas del hilo difusor.
+Termina con código 1 si falta o sobra algún evento, si el p95 del retraso supera
+su presupuesto o si las consultas de lectura crecen con el número de clientes.
+"""
+import argparse
+import math
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_USER = 'bench_admin'
+
+# Presupuestos: p95 del retraso de entrega en ms y lecturas del difusor por cambio
+DELIVERY_P95_MS = 500
+MAX_READS_PER_CHANGE = 1.5
+
+
+def setup(n_stations):
+    from sqlalchemy import insert
+    from toolkit import db
+    from toolkit.models import User
+    from toolkit.station_models import Station
+
+    admin = User(username=BENCH_USER, email='bench_admin@example.com', is_admin=True)
+    admin.set_password('bench')
+    db.session.add(admin)
+    db.session.flush()
+    db.session.execute(insert(Station), [{
+        'id': i, 'name': f'Estación {i:04d}', 'island': 'Tenerife', 'municipality': 'Municipio 1',
+        'location': 'Benchmark', 'created_by': admin.id
+    } for i in range(1, n_stations + 1)])
+    db.session.commit()
+
+
+def listen(app, url, received, ready):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': BENCH_USER, 'password': 'bench'})
+    response = client.get(url, buffered=False)
+    ready.release()
+    for chunk in response.response:
+        chunk = chunk if isinstance(chunk, str) else chunk.decode()
+        if chunk.startswith('id:'):
+            received.put((time.perf_counter(), chunk))
+
+
+def run(n_clients=100, n_changes=200, n_stations=50):
+    from sqlalchemy import event
+    from toolkit import create_app, db
+
+    app = create_app('production')
+    app.config.update(SQL_INSTRUMENTATION=False, FEED_MAX_SUBSCRIBERS=n_clients + 10)
+    with app.app_context():
+        setup(n_stations)
+        # Consultas del hilo difusor (las peticiones se cuentan aparte)
+        reads = {'feed': 0}
+
+        def count(*args, **kwargs):
+            if threading.current_thread().name == 'change-feed':
+                reads['feed'] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+
+    clients = []
+    ready = threading.Semaphore(0)
+    for i in range(n_clients):
+        station_id = None if i % 2 == 0 else 1 + i % n_stations
+        url = '/events/stations' + (f'?station={station_id}' if station_id else '')
+        received = queue.Queue()
+        threading.Thread(target=listen, args=(app, url, received, ready), daemon=True).start()
+        clients.append((station_id, received))
+    for _ in range(n_clients):
+        ready.acquire()
+
+    writer = app.test_client()
+    writer.post('/auth/login', data={'username': BENCH_USER, 'password': 'bench'})
+    sent = []
+    started = time.perf_counter()
+    for i in range(n_changes):
+        station_id = 1 + i % n_stations
+        response = writer.post(f'/stations/{station_id}/breakdowns/report',
+                               data={'title': f'Avería {i}', 'description': 'Benchmark', 'severity': 'media'})
+        if response.status_code != 302:
+            raise SystemExit(f'HTTP {response.status_code}')
+        sent.append((time.perf_counter(), station_id))
+    elapsed = time.perf_counter() - started
+    time.sleep(app.config['FEED_POLL_SECONDS'] + 1)
+
+    ok = True
+    delays, missing, extra = [], 0, 0
+    for station_id, received in clients:
+        expected = [(at, sid) for at, sid in sent if station_id is None or sid == station_id]
+        events = []
+        while not received.empty():
+            events.append(received.get())
+        missing += max(0, len(expected) - len(events))
+        extra += max(0, len(events) - len(expected))
+        delays.extend((arrived - at) * 1000 for (at, _), (arrived, _) in zip(expected, events))
+
+    delays.sort()
+    p95 = delays[max(0, math.ceil(0.95 * len(delays)) - 1)] if delays else float('inf')
+    reads_per_change = reads['feed'] / n_changes
+    print(f'{n_changes} cambios en {elapsed:.1f} s, {n_clients} clientes, {len(delays)} eventos entregados')
+    print(f'retraso p50 {delays[len(delays) // 2] if delays else 0:.1f} ms, p95 {p95:.1f} ms')
+    print(f'lecturas del difusor: {reads["feed"]} ({reads_per_change:.2f} por cambio)')
+    if missing or extra:
+        print(f'eventos que faltan: {missing}, eventos de más: {extra}')
+        ok = False
+    if p95 > DELIVERY_P95_MS:
+        print(f'p95 > {DELIVERY_P95_MS} ms')
+        ok = False
+    if reads_per_change > MAX_READS_PER_CHANGE:
+        print(f'más de {MAX_READS_PER_CHANGE} lecturas por cambio')
+        ok = False
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Canal de cambios en tiempo real con muchos clientes')
+    parser.add_argument('--clients', type=int, default=100, help='conexiones SSE abiertas')
+    parser.add_argument('--changes', type=int, default=200, help='averías que se reportan')
+    parser.add_argument('--stations', type=int, default=50, help='estaciones de la flota')
+    args = parser.parse_args(argv)
+    # config.py lee DATABASE_URL al importarse
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='toolkit-feed-'), 'bench.db')
+    return 0 if run(args.clients, args.changes, args.stations) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
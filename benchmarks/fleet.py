@@ -0,0 +1,185 @@
+"""Generador de una flota sintética de estaciones para los benchmarks."""
+import random
+from datetime import datetime, timedelta
+from toolkit import db
+from toolkit.models import User
+from toolkit.station_models import (
+    Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, StationHistory, SENSOR_CALIBRATING
+)
+
+ISLANDS = ['Tenerife', 'Gran Canaria', 'Lanzarote', 'Fuerteventura', 'La Palma', 'La Gomera', 'El Hierro']
+SEVERITIES = ['baja', 'media', 'alta', 'crítica']
+SENSOR_TYPES = ['temperatura', 'humedad', 'presión', 'viento', 'lluvia']
+SENSOR_STATUSES = ['operativo', 'operativo', 'operativo', 'averiado', SENSOR_CALIBRATING]
+INTERVENTION_TYPES = ['mantenimiento', 'reparacion', 'calibracion', 'instalacion', 'inspeccion']
+ACTIONS = ['updated', 'status_changed', 'sensor_added', 'breakdown_reported', 'breakdown_resolved',
+           'intervention_scheduled', 'intervention_completed', 'router_configured', 'detail_added']
+WORDS = ['sensor', 'batería', 'panel', 'solar', 'cable', 'antena', 'router', 'caseta', 'mástil',
+         'fuga', 'corrosión', 'humedad', 'viento', 'calibración', 'revisión', 'firmware', 'cráter']
+
+# Tamaño de la flota con scale=1
+FLEET_SIZE = {
+    'stations': 1000,
+    'breakdowns': 50000,
+    'interventions': 50000,
+    'history': 500000,
+}
+
+BATCH_SIZE = 10000
+
+
+def _text(rng, words=8):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(model.__table__.insert(), rows[start:start + BATCH_SIZE])
+
+
+def _insert_generated(model, total, make_row):
+    # Inserta por lotes sin tener todas las filas en memoria a la vez
+    for start in range(0, total, BATCH_SIZE):
+        db.session.execute(
+            model.__table__.insert(),
+            [make_row(i) for i in range(start, min(start + BATCH_SIZE, total))]
+        )
+
+
+def seed_fleet(scale=1.0, seed=1234):
+    """Llena la base de datos de la aplicación actual con una flota sintética.
+
+    Devuelve un dict con los ids útiles para los benchmarks.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    sizes = {name: max(1, int(size * scale)) for name, size in FLEET_SIZE.items()}
+
+    def when(max_days=5 * 365):
+        return now - timedelta(seconds=rng.randint(0, max_days * 86400))
+
+    admin = User(username='bench_admin', email='bench_admin@example.com', is_admin=True)
+    admin.set_password('bench')
+    technician = User(username='bench_tech', email='bench_tech@example.com', is_admin=False)
+    technician.set_password('bench')
+    db.session.add_all([admin, technician])
+    db.session.commit()
+    user_ids = [admin.id, technician.id]
+
+    n_stations = sizes['stations']
+    locations = [(rng.uniform(27.6, 29.4), rng.uniform(-18.2, -13.4)) for _ in range(n_stations)]
+    _insert(Station, [{
+        'id': i,
+        'name': f'Estación {i:05d}',
+        'island': rng.choice(ISLANDS),
+        'municipality': f'Municipio {rng.randint(1, 40)}',
+        'location': _text(rng, 4),
+        'coordinates': f'{locations[i - 1][0]:.5f}, {locations[i - 1][1]:.5f}',
+        'latitude': round(locations[i - 1][0], 5),
+        'longitude': round(locations[i - 1][1], 5),
+        'how_to_get': _text(rng, 12),
+        'required_vehicle': rng.choice(['normal', '4x4']),
+        'measurement_type': rng.choice(['Gases', 'Térmica', 'Geodesia', 'Gravimetría', 'Sísmica']),
+        'status': rng.choice(['activa', 'activa', 'activa', 'mantenimiento', 'averiada', 'inactiva']),
+        'created_by': admin.id,
+        'created_at': when(),
+        'updated_at': now,
+    } for i in range(1, n_stations + 1)])
+
+    _insert(Sensor, [{
+        'station_id': station_id,
+        'sensor_type': rng.choice(SENSOR_TYPES),
+        'model': f'Modelo {rng.randint(1, 20)}',
+        'serial_number': f'SN{station_id:05d}{n}',
+        'status': rng.choice(SENSOR_STATUSES),
+        'installation_date': when(),
+        'last_calibration': when(400),
+        'created_at': now,
+        'updated_at': now,
+    } for station_id in range(1, n_stations + 1) for n in range(rng.randint(1, 5))])
+
+    _insert(Router, [{
+        'station_id': station_id,
+        'model': f'Router {rng.randint(1, 5)}',
+        'ip_address': f'10.{station_id // 65536}.{(station_id // 256) % 256}.{station_id % 256}',
+        'status': rng.choice(['online', 'online', 'offline', 'mantenimiento']),
+        'created_at': now,
+        'updated_at': now,
+    } for station_id in range(1, n_stations + 1)])
+
+    _insert(TechnicalDetail, [{
+        'station_id': station_id,
+        'detail_type': rng.choice(['alimentación', 'conectividad', 'estructura']),
+        'key': f'Detalle {n}',
+        'value': _text(rng, 6),
+        'created_at': now,
+        'updated_at': now,
+    } for station_id in range(1, n_stations + 1) for n in range(3)])
+
+    def breakdown_row(i):
+        reported = when()
+        resolved = rng.random() < 0.9
+        return {
+            'station_id': rng.randint(1, n_stations),
+            'title': _text(rng, 3),
+            'description': _text(rng, 15),
+            'severity': rng.choice(SEVERITIES),
+            'reported_date': reported,
+            'resolved': resolved,
+            'resolved_date': reported + timedelta(hours=rng.randint(1, 500)) if resolved else None,
+            'resolution_notes': _text(rng, 6) if resolved else None,
+            'reported_by': rng.choice(user_ids),
+            'resolved_by': rng.choice(user_ids) if resolved else None,
+            'created_at': reported,
+            'updated_at': reported,
+        }
+    _insert_generated(Breakdown, sizes['breakdowns'], breakdown_row)
+
+    def intervention_row(i):
+        created = when()
+        done = rng.random() < 0.9
+        return {
+            'station_id': rng.randint(1, n_stations),
+            'intervention_type': rng.choice(INTERVENTION_TYPES),
+            'title': _text(rng, 3),
+            'description': _text(rng, 15),
+            'intervention_date': created + timedelta(days=rng.randint(0, 30)) if done else None,
+            'technician_name': 'bench_tech' if done else None,
+            'performed_by': rng.choice(user_ids),
+            'created_at': created,
+            'updated_at': created,
+        }
+    _insert_generated(Intervention, sizes['interventions'], intervention_row)
+
+    def history_row(i):
+        return {
+            'station_id': rng.randint(1, n_stations),
+            'action': rng.choice(ACTIONS),
+            'description': _text(rng, 5),
+            'changed_by': rng.choice(user_ids),
+            'created_at': when(),
+        }
+    _insert_generated(StationHistory, sizes['history'], history_row)
+
+    db.session.commit()
+    fleet = {
+        'admin_id': admin.id,
+        'technician_id': technician.id,
+        'stations': n_stations,
+        'sizes': sizes,
+    }
+
+    # Tablas derivadas: resúmenes, agregados de fiabilidad, índice de búsqueda e índice espacial
+    from toolkit.summary import rebuild_summaries
+    from toolkit.reliability import rebuild_rollups
+    from toolkit.search_index import rebuild_search_index
+    from toolkit.geo import rebuild_spatial_index
+    from toolkit.changelog import rebuild_change_log
+    rebuild_summaries()
+    rebuild_rollups()
+    rebuild_search_index()
+    rebuild_spatial_index()
+    rebuild_change_log()
+    db.session.commit()
+
+    return fleet
@@ -0,0 +1,170 @@
+"""Benchmark del sondeo de routers (toolkit.poller) contra routers simulados.
+
+Uso:
+    python -m benchmarks.routers [--routers 1000] [--timeout 0.5] [--concurrency 200] [--budget 5]
+
+Crea una base de datos SQLite temporal con un router por estación. Cada router
+tiene una dirección de loopback propia (127.1.x.y) y un servidor TCP simulado
+escucha en las que deben estar online; las demás rechazan la conexión. Una parte
+usa direcciones de TEST-NET-1 (192.0.2.0/24), que no responden y agotan el timeout.
+
+Se hacen tres sondeos: el primero marca como offline los routers caídos, antes
+del segundo se cambia el estado de algunos routers simulados y el tercero no
+debe encontrar cambios. Termina con código 1 si algún sondeo tarda más de
+--budget segundos o si los cambios de estado (y el historial) no coinciden con
+los esperados.
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_USER = 'bench_admin'
+
+
+class FakeRouters:
+    """Servidores TCP en un hilo con su propio bucle de eventos, uno por dirección online."""
+
+    def __init__(self, port):
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.servers = {}
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fake-routers', daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    async def _handle(reader, writer):
+        writer.close()
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _set_online(self, addresses):
+        addresses = set(addresses)
+        for address in set(self.servers) - addresses:
+            server = self.servers.pop(address)
+            server.close()
+            await server.wait_closed()
+        for address in addresses - set(self.servers):
+            self.servers[address] = await asyncio.start_server(self._handle, address, self.port, reuse_address=True)
+
+    def set_online(self, addresses):
+        self._call(self._set_online(addresses))
+
+    def stop(self):
+        self.set_online([])
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def address(i, unreachable):
+    if unreachable:
+        return f'192.0.2.{i % 254 + 1}'
+    return f'127.1.{i // 250}.{i % 250 + 1}'
+
+
+def setup(n_routers, unreachable_share, rng):
+    """Crea el usuario, las estaciones y los routers. Devuelve {router_id: dirección}."""
+    from sqlalchemy import insert
+    from toolkit import db
+    from toolkit.models import User
+    from toolkit.station_models import Station, Router
+    from toolkit.summary import refresh_summaries
+
+    admin = User(username=BENCH_USER, email='bench_admin@example.com', is_admin=True)
+    admin.set_password('bench')
+    db.session.add(admin)
+    db.session.flush()
+    db.session.execute(insert(Station), [{
+        'id': i, 'name': f'Estación {i:04d}', 'island': 'Tenerife', 'municipality': 'Municipio 1',
+        'location': 'Benchmark', 'created_by': admin.id
+    } for i in range(1, n_routers + 1)])
+    addresses = {i: address(i, rng.random() < unreachable_share) for i in range(1, n_routers + 1)}
+    db.session.execute(insert(Router), [{
+        'id': i, 'station_id': i, 'model': 'Router', 'ip_address': addresses[i], 'status': 'online'
+    } for i in range(1, n_routers + 1)])
+    refresh_summaries(range(1, n_routers + 1))
+    db.session.commit()
+    return admin.id, addresses
+
+
+def run(n_routers=1000, timeout=0.5, concurrency=200, budget=5.0, unreachable_share=0.05, seed=1234):
+    from toolkit import create_app, db
+    from toolkit.poller import poll_routers
+    from toolkit.station_models import Router, StationHistory
+    from toolkit.summary import rebuild_summaries
+
+    rng = random.Random(seed)
+    app = create_app('production')
+    app.config['SQL_INSTRUMENTATION'] = False
+    port = free_port()
+    fake = FakeRouters(port)
+    ok = True
+    try:
+        with app.app_context():
+            user_id, addresses = setup(n_routers, unreachable_share, rng)
+            loopback = [router_id for router_id, host in addresses.items() if host.startswith('127.')]
+            online = set(rng.sample(loopback, int(len(loopback) * 0.8)))
+
+            def sweep(label, expected_changes):
+                nonlocal ok
+                fake.set_online([addresses[router_id] for router_id in online])
+                history_before = StationHistory.query.count()
+                started = time.perf_counter()
+                result = poll_routers(user_id, port=port, timeout=timeout, concurrency=concurrency)
+                total = time.perf_counter() - started
+                history = StationHistory.query.count() - history_before
+                statuses = dict(db.session.query(Router.id, Router.status))
+                wrong = sum(1 for router_id in addresses
+                            if statuses[router_id] != ('online' if router_id in online else 'offline'))
+                status = 'ok'
+                if total > budget:
+                    status = f'{total:.2f} s > {budget} s'
+                elif result.changed != expected_changes or history != expected_changes or wrong:
+                    status = f'esperados {expected_changes} cambios, {wrong} estado(s) incorrecto(s)'
+                ok = ok and status == 'ok'
+                print(f'{label:24} {result.checked:8d} {result.online:7d} {result.offline:8d} '
+                      f'{result.changed:8d} {history:9d} {result.elapsed:9.2f} {total:8.2f}  {status}')
+
+            print(f'{"sondeo":24} {"routers":>8} {"online":>7} {"offline":>8} {"cambios":>8} '
+                  f'{"historial":>9} {"sondeo s":>9} {"total s":>8}')
+            sweep('inicial', n_routers - len(online))
+            flipped = rng.sample(loopback, max(1, len(loopback) // 10))
+            online ^= set(flipped)
+            sweep('con cambios', len(flipped))
+            sweep('sin cambios', 0)
+
+            drift = rebuild_summaries(verify_only=True)
+            if drift:
+                print(f'{len(drift)} resumen(es) desactualizado(s)')
+                ok = False
+    finally:
+        fake.stop()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sondeo de routers contra routers simulados')
+    parser.add_argument('--routers', type=int, default=1000, help='número de routers')
+    parser.add_argument('--timeout', type=float, default=0.5, help='segundos por router')
+    parser.add_argument('--concurrency', type=int, default=200, help='conexiones simultáneas')
+    parser.add_argument('--budget', type=float, default=5.0, help='segundos máximos por sondeo')
+    args = parser.parse_args(argv)
+    # config.py lee DATABASE_URL al importarse
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='toolkit-routers-'), 'bench.db')
+    return 0 if run(args.routers, args.timeout, args.concurrency, args.budget) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
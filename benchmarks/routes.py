@@ -0,0 +1,387 @@
+"""Benchmark de las rutas de station.py y auth.py sobre una flota sintética.
+
+Uso:
+    python -m benchmarks.routes [--scale 1.0] [--iterations 20] [--database ruta.db]
+
+Crea una base de datos SQLite temporal, la llena con benchmarks.fleet, recorre
+todas las rutas con el cliente de pruebas de Flask y mide latencia (p50/p95/p99)
+y número de consultas SQL por petición. Termina con código 1 si alguna ruta
+supera su presupuesto de consultas o de latencia.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Registros por petición en los casos de operaciones masivas
+BULK_SIZE = 20
+
+# Presupuestos por endpoint: (máximo de consultas por petición, p95 máximo en ms).
+# Las latencias corresponden a la flota completa (scale=1).
+BUDGETS = {
+    'auth.login': (1, 400),
+    'auth.login_form': (1, 50),
+    'auth.logout': (1, 50),
+    'auth.list_users': (2, 100),
+    'auth.create_user_form': (1, 50),
+    'auth.create_user': (4, 400),
+    'auth.delete_user': (2, 100),
+    'stations.list_stations': (1, 150),
+    'stations.list_stations_filtered': (1, 100),
+    'stations.view_station': (8, 100),
+    'stations.view_station_details': (3, 100),
+    'stations.create_station_form': (1, 50),
+    'stations.create_station': (16, 150),
+    'stations.edit_station_form': (1, 50),
+    'stations.edit_station': (10, 100),
+    # Sin runner (JOB_WORKER=0) el borrado es síncrono: índice de búsqueda, cascada de unos
+    # 700 registros por estación y registro de cambios. Con runner sólo se encola
+    'stations.delete_station': (14, 400),
+    'stations.add_sensor_form': (1, 50),
+    'stations.add_sensor': (8, 100),
+    'stations.edit_sensor_form': (2, 50),
+    'stations.edit_sensor': (9, 100),
+    'stations.delete_sensor': (8, 100),
+    'stations.configure_router_form': (2, 50),
+    'stations.configure_router': (7, 100),
+    'stations.add_technical_detail_form': (1, 50),
+    'stations.add_technical_detail': (7, 100),
+    'stations.edit_technical_detail_form': (2, 50),
+    'stations.edit_technical_detail': (8, 100),
+    'stations.delete_technical_detail': (7, 100),
+    'stations.report_breakdown_form': (1, 50),
+    'stations.report_breakdown': (12, 100),
+    'stations.resolve_breakdown_form': (2, 50),
+    'stations.resolve_breakdown': (12, 100),
+    'stations.schedule_intervention_form': (1, 50),
+    'stations.schedule_intervention': (10, 100),
+    'stations.complete_intervention_form': (1, 50),
+    'stations.complete_intervention': (9, 100),
+    'stations.add_intervention_form': (1, 50),
+    'stations.add_intervention': (8, 100),
+    'stations.view_history': (3, 100),
+    'stations.delete_history_record': (4, 100),
+    'stations.view_breakdowns_history': (2, 100),
+    'stations.delete_breakdown': (8, 100),
+    'stations.view_interventions_history': (2, 100),
+    'stations.delete_intervention': (7, 100),
+    'stations.export_station_records': (3, 200),
+    # Consultas fijas: resúmenes, versiones, agregados, índice de búsqueda y registro de
+    # cambios se escriben en lote. Al resolver, además, un UPDATE de contadores por cada
+    # combinación de severidades resueltas (como mucho uno por estación afectada)
+    'stations.bulk_resolve_breakdowns': (13 + BULK_SIZE, 200),
+    'stations.bulk_complete_interventions': (13, 200),
+    'stations.bulk_delete_breakdowns': (13, 200),
+    'stations.bulk_delete_interventions': (13, 200),
+    'triage.index': (6, 150),
+    'triage.index_interventions': (2, 100),
+    'stations.nearby': (1, 50),
+    'stations.nearest': (4, 50),
+    'stations.nearest_to_station': (5, 50),
+    'analytics.dashboard': (2, 300),
+    'analytics.kpis': (2, 300),
+    # Cambios de una página: el registro, el cursor mínimo y una consulta por tipo de registro
+    'sync.changes': (8, 200),
+    'sync.changes_delta': (8, 150),
+    # Lote de 10 operaciones: cada una cuesta como su ruta web
+    'sync.push': (11 * 10, 300),
+    # API JSON: la consulta de versiones y, si hay que responder, una por relación incluida
+    'api.list_stations': (2, 100),
+    'api.list_stations_include': (6, 200),
+    'api.list_stations_not_modified': (1, 50),
+    'api.get_station': (6, 50),
+    'api.get_station_not_modified': (1, 30),
+    'api.station_breakdowns': (2, 50),
+}
+
+# Casos que se ejecutan sin sesión iniciada
+ANONYMOUS_CASES = {'auth.login_form', 'auth.login'}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def build_cases(ctx):
+    """Casos de benchmark: (nombre, método, url(i), datos(i)[, cabeceras(i, cliente)]).
+
+    ctx contiene listas de ids de la flota que los casos consumen (una por iteración)
+    para que las rutas de escritura actúen siempre sobre registros distintos.
+    """
+    from toolkit.changelog import current_seq
+
+    n = ctx['stations']
+
+    def station(i):
+        # Repartido por toda la flota; las últimas estaciones se reservan para delete_station
+        return 1 + (i * 37) % (n - ctx['iterations'] - 1)
+
+    def recent_cursor(i, client):
+        # Las rutas de escritura anteriores también registran cambios: el cursor se toma
+        # justo antes de medir para que el cliente pida sólo los últimos 200
+        with client.application.app_context():
+            ctx['sync_cursor'] = max(0, current_seq() - 200)
+
+    station_form = {
+        'name': 'Estación editada', 'island': 'Tenerife', 'municipality': 'Municipio 1',
+        'location': 'Ubicación', 'coordinates': '28.3, -16.5', 'status': 'activa',
+    }
+
+    return [
+        ('auth.login_form', 'GET', lambda i: '/auth/login', None),
+        ('auth.list_users', 'GET', lambda i: '/auth/users', None),
+        ('auth.create_user_form', 'GET', lambda i: '/auth/create-user', None),
+        ('auth.create_user', 'POST', lambda i: '/auth/create-user',
+         lambda i: {'username': f'bench_user_{i}', 'email': f'bench_user_{i}@example.com', 'password': 'x'}),
+        ('auth.delete_user', 'POST', lambda i: f'/auth/delete-user/{ctx["new_user_ids"][i]}', None),
+        ('stations.list_stations', 'GET', lambda i: '/stations/', None),
+        ('stations.list_stations_filtered', 'GET', lambda i: '/stations/?island=Tenerife&status=activa', None),
+        ('stations.view_station', 'GET', lambda i: f'/stations/{station(i)}', None),
+        ('stations.view_station_details', 'GET', lambda i: f'/stations/{station(i)}/details', None),
+        ('stations.create_station_form', 'GET', lambda i: '/stations/new', None),
+        ('stations.create_station', 'POST', lambda i: '/stations/new',
+         lambda i: dict(station_form, name=f'Nueva estación {i}')),
+        ('stations.edit_station_form', 'GET', lambda i: f'/stations/{station(i)}/edit', None),
+        ('stations.edit_station', 'POST', lambda i: f'/stations/{station(i)}/edit',
+         lambda i: dict(station_form, name=f'Estación editada {i}')),
+        ('stations.add_sensor_form', 'GET', lambda i: f'/stations/{station(i)}/sensors/add', None),
+        ('stations.add_sensor', 'POST', lambda i: f'/stations/{station(i)}/sensors/add',
+         lambda i: {'sensor_type': 'viento', 'model': 'Bench', 'status': 'operativo'}),
+        ('stations.edit_sensor_form', 'GET',
+         lambda i: '/stations/{}/sensors/{}/edit'.format(*ctx['sensors'][i]), None),
+        ('stations.edit_sensor', 'POST',
+         lambda i: '/stations/{}/sensors/{}/edit'.format(*ctx['sensors'][i]),
+         lambda i: {'sensor_type': 'viento', 'model': 'Bench', 'status': 'averiado'}),
+        ('stations.delete_sensor', 'POST',
+         lambda i: '/stations/{}/sensors/{}/delete'.format(*ctx['sensors'][i]), None),
+        ('stations.configure_router_form', 'GET', lambda i: f'/stations/{station(i)}/router', None),
+        ('stations.configure_router', 'POST', lambda i: f'/stations/{station(i)}/router',
+         lambda i: {'model': 'Router bench', 'ip_address': '10.0.0.1', 'status': 'offline'}),
+        ('stations.add_technical_detail_form', 'GET', lambda i: f'/stations/{station(i)}/details/add', None),
+        ('stations.add_technical_detail', 'POST', lambda i: f'/stations/{station(i)}/details/add',
+         lambda i: {'detail_type': 'alimentación', 'key': 'Bench', 'value': 'Solar'}),
+        ('stations.edit_technical_detail_form', 'GET',
+         lambda i: '/stations/{}/details/{}/edit'.format(*ctx['details'][i]), None),
+        ('stations.edit_technical_detail', 'POST',
+         lambda i: '/stations/{}/details/{}/edit'.format(*ctx['details'][i]),
+         lambda i: {'detail_type': 'alimentación', 'key': 'Bench', 'value': 'Red eléctrica'}),
+        ('stations.delete_technical_detail', 'POST',
+         lambda i: '/stations/{}/details/{}/delete'.format(*ctx['details'][i]), None),
+        ('stations.report_breakdown_form', 'GET', lambda i: f'/stations/{station(i)}/breakdowns/report', None),
+        ('stations.report_breakdown', 'POST', lambda i: f'/stations/{station(i)}/breakdowns/report',
+         lambda i: {'title': 'Avería bench', 'description': 'Sin datos', 'severity': 'alta'}),
+        ('stations.resolve_breakdown_form', 'GET',
+         lambda i: f'/stations/breakdowns/{ctx["open_breakdowns"][i]}/resolve', None),
+        ('stations.resolve_breakdown', 'POST',
+         lambda i: f'/stations/breakdowns/{ctx["open_breakdowns"][i]}/resolve',
+         lambda i: {'resolution_notes': 'Resuelta en benchmark'}),
+        ('stations.schedule_intervention_form', 'GET',
+         lambda i: f'/stations/{station(i)}/interventions/schedule', None),
+        ('stations.schedule_intervention', 'POST', lambda i: f'/stations/{station(i)}/interventions/schedule',
+         lambda i: {'intervention_type': 'mantenimiento', 'title': 'Revisión bench', 'description': 'd'}),
+        ('stations.complete_intervention_form', 'GET',
+         lambda i: f'/stations/interventions/{ctx["pending_interventions"][i]}/complete', None),
+        ('stations.complete_intervention', 'POST',
+         lambda i: f'/stations/interventions/{ctx["pending_interventions"][i]}/complete', lambda i: {}),
+        ('stations.add_intervention_form', 'GET', lambda i: f'/stations/{station(i)}/interventions/add', None),
+        ('stations.add_intervention', 'POST', lambda i: f'/stations/{station(i)}/interventions/add',
+         lambda i: {'intervention_type': 'reparacion', 'title': 'Reparación bench', 'description': 'd'}),
+        ('stations.view_history', 'GET', lambda i: f'/stations/{station(i)}/history', None),
+        ('stations.delete_history_record', 'POST',
+         lambda i: f'/stations/history/{ctx["history"][i]}/delete', None),
+        ('stations.view_breakdowns_history', 'GET', lambda i: f'/stations/{station(i)}/breakdowns/history', None),
+        ('stations.delete_breakdown', 'POST',
+         lambda i: f'/stations/breakdowns/{ctx["resolved_breakdowns"][i]}/delete', None),
+        ('stations.view_interventions_history', 'GET',
+         lambda i: f'/stations/{station(i)}/interventions/history', None),
+        ('stations.delete_intervention', 'POST',
+         lambda i: f'/stations/interventions/{ctx["completed_interventions"][i]}/delete', None),
+        ('stations.bulk_resolve_breakdowns', 'POST', lambda i: '/stations/breakdowns/bulk-resolve',
+         lambda i: {'ids': ctx['bulk_open_breakdowns'][i], 'resolution_notes': 'Resueltas en bloque'}),
+        ('stations.bulk_complete_interventions', 'POST', lambda i: '/stations/interventions/bulk-complete',
+         lambda i: {'ids': ctx['bulk_pending_interventions'][i]}),
+        ('stations.bulk_delete_breakdowns', 'POST', lambda i: '/stations/breakdowns/bulk-delete',
+         lambda i: {'ids': ctx['bulk_resolved_breakdowns'][i]}),
+        ('stations.bulk_delete_interventions', 'POST', lambda i: '/stations/interventions/bulk-delete',
+         lambda i: {'ids': ctx['bulk_completed_interventions'][i]}),
+        ('stations.nearby', 'GET', lambda i: f'/stations/nearby?lat={28 + i % 10 * 0.1:.1f}&lon=-16.5&radius_km=25', None),
+        ('stations.nearest', 'GET', lambda i: f'/stations/nearest?lat=28.3&lon={-17.5 + i % 10 * 0.3:.1f}&k=10', None),
+        ('stations.nearest_to_station', 'GET', lambda i: f'/stations/nearest?station_id={station(i)}&k=10', None),
+        ('triage.index', 'GET', lambda i: '/triage/?island=Tenerife', None),
+        ('triage.index_interventions', 'GET', lambda i: '/triage/?kind=interventions&required_vehicle=4x4', None),
+        ('analytics.dashboard', 'GET', lambda i: '/analytics/?group=station', None),
+        ('analytics.kpis', 'GET', lambda i: '/analytics/api/kpis?group=municipality&start=2020-01-01', None),
+        ('sync.changes', 'GET', lambda i: f'/sync/changes?since={i * 1000}', None),
+        ('sync.changes_delta', 'GET', lambda i: f'/sync/changes?since={ctx["sync_cursor"]}', None, recent_cursor),
+        ('sync.push', 'POST', lambda i: '/sync/push', lambda i: json.dumps({'operations': [
+            {'op': 'create', 'entity': 'breakdown', 'client_id': f'bench-{i}-{j}', 'station_id': station(i + j),
+             'fields': {'title': 'Avería sin conexión', 'description': 'd', 'severity': 'media'}}
+            for j in range(5)
+        ] + [
+            {'op': 'update', 'entity': 'sensor', 'id': sensor_id, 'base_seq': 10 ** 9, 'fields': {'status': 'averiado'}}
+            for _, sensor_id in ctx['sync_sensors'][i * 5:(i + 1) * 5]
+        ]})),
+        ('api.list_stations', 'GET', lambda i: f'/api/v1/stations?after={i * 37}', None),
+        ('api.list_stations_include', 'GET',
+         lambda i: f'/api/v1/stations?after={i * 37}&include=sensors,router,summary,open_breakdowns', None,
+         lambda i, client: {'Accept-Encoding': 'gzip'}),
+        ('api.list_stations_not_modified', 'GET', lambda i: f'/api/v1/stations?after={i * 37}', None,
+         lambda i, client: {'If-None-Match': client.get(f'/api/v1/stations?after={i * 37}').headers['ETag']}),
+        ('api.get_station', 'GET',
+         lambda i: f'/api/v1/stations/{station(i)}?include=sensors,router,technical_details,summary', None),
+        ('api.get_station_not_modified', 'GET', lambda i: f'/api/v1/stations/{station(i)}', None,
+         lambda i, client: {'If-None-Match': client.get(f'/api/v1/stations/{station(i)}').headers['ETag']}),
+        ('api.station_breakdowns', 'GET', lambda i: f'/api/v1/stations/{station(i)}/breakdowns?limit=50', None),
+        ('stations.export_station_records', 'GET',
+         lambda i: f'/stations/{station(i)}/export/history?format=csv', None),
+        ('stations.delete_station', 'POST', lambda i: f'/stations/{n - i}/delete', None),
+        ('auth.login', 'POST', lambda i: '/auth/login', lambda i: {'username': 'bench_admin', 'password': 'bench'}),
+        ('auth.logout', 'GET', lambda i: '/auth/logout', None),
+    ]
+
+
+def collect_ids(iterations):
+    """Ids de la flota que consumen los casos de escritura (uno por iteración)."""
+    from toolkit import db
+    from toolkit.models import User
+    from toolkit.station_models import Sensor, TechnicalDetail, Breakdown, Intervention, StationHistory
+
+    def ids(query):
+        return [row[0] for row in query.limit(iterations).all()]
+
+    def batches(query):
+        # Lotes de BULK_SIZE ids para las operaciones masivas, sin solaparse con ids()
+        rows = [row[0] for row in query.offset(iterations).limit(iterations * BULK_SIZE).all()]
+        return [rows[i * BULK_SIZE:(i + 1) * BULK_SIZE] for i in range(iterations)]
+
+    new_users = [User(username=f'bench_delete_{i}', email=f'bench_delete_{i}@example.com') for i in range(iterations)]
+    for user in new_users:
+        user.set_password('x')
+    db.session.add_all(new_users)
+    db.session.commit()
+
+    return {
+        'new_user_ids': [user.id for user in new_users],
+        'sensors': [(s, i) for i, s in db.session.query(Sensor.id, Sensor.station_id).limit(iterations)],
+        'details': [(s, i) for i, s in db.session.query(TechnicalDetail.id, TechnicalDetail.station_id).limit(iterations)],
+        'open_breakdowns': ids(db.session.query(Breakdown.id).filter(Breakdown.resolved.is_(False))),
+        'resolved_breakdowns': ids(db.session.query(Breakdown.id).filter(Breakdown.resolved.is_(True))),
+        'pending_interventions': ids(db.session.query(Intervention.id).filter(Intervention.technician_name.is_(None))),
+        'completed_interventions': ids(db.session.query(Intervention.id).filter(Intervention.technician_name.isnot(None))),
+        'history': ids(db.session.query(StationHistory.id)),
+        # Sensores que modifica sync.push
+        'sync_sensors': [(s, i) for i, s in db.session.query(Sensor.id, Sensor.station_id).order_by(Sensor.id)
+                         .offset(iterations).limit(iterations * 5)],
+        'bulk_open_breakdowns': batches(db.session.query(Breakdown.id).filter(Breakdown.resolved.is_(False))),
+        'bulk_resolved_breakdowns': batches(db.session.query(Breakdown.id).filter(Breakdown.resolved.is_(True))),
+        'bulk_pending_interventions': batches(
+            db.session.query(Intervention.id).filter(Intervention.technician_name.is_(None))),
+        'bulk_completed_interventions': batches(
+            db.session.query(Intervention.id).filter(Intervention.technician_name.isnot(None))),
+    }
+
+
+def run(scale=1.0, iterations=20, database=None, only=None):
+    if database is None:
+        database = os.path.join(tempfile.mkdtemp(prefix='toolkit-bench-'), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(database)}'
+    # Sin runner en el proceso: sus consultas no deben contar en las rutas medidas
+    os.environ['JOB_WORKER'] = '0'
+
+    from sqlalchemy import event
+    from toolkit import create_app, db
+    from benchmarks.fleet import seed_fleet
+
+    app = create_app('production')
+    app.config['TESTING'] = True
+
+    with app.app_context():
+        started = time.perf_counter()
+        fleet = seed_fleet(scale=scale)
+        print(f'Flota generada en {time.perf_counter() - started:.1f} s: {fleet["sizes"]}')
+        ctx = dict(collect_ids(iterations), stations=fleet['stations'], iterations=iterations)
+        counter = QueryCounter()
+        event.listen(db.engine, 'before_cursor_execute', counter)
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench_admin', 'password': 'bench'})
+    # Las rutas de inicio de sesión se miden con un cliente sin sesión
+    anonymous = app.test_client()
+
+    results = []
+    for name, method, url, data, *headers in build_cases(ctx):
+        if only and name not in only:
+            continue
+        latencies, queries, statuses = [], [], set()
+        for i in range(iterations):
+            current = anonymous if name in ANONYMOUS_CASES else client
+            # Las cabeceras se preparan antes de medir (pueden hacer peticiones previas)
+            extra_headers = headers[0](i, current) if headers else None
+            counter.count = 0
+            started = time.perf_counter()
+            body = data(i) if data else None
+            # Los cuerpos ya serializados son JSON; los diccionarios, formularios
+            content_type = 'application/json' if isinstance(body, str) else None
+            response = current.open(url(i), method=method, data=body, content_type=content_type,
+                                    headers=extra_headers)
+            response.get_data()
+            latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(counter.count)
+            statuses.add(response.status_code)
+            if name == 'auth.login':
+                anonymous.get('/auth/logout')
+            if name == 'auth.logout':
+                client.post('/auth/login', data={'username': 'bench_admin', 'password': 'bench'})
+        results.append((name, latencies, queries, statuses))
+
+    return report(results)
+
+
+def report(results):
+    failures = []
+    print(f'{"ruta":45} {"p50":>8} {"p95":>8} {"p99":>8} {"consultas":>10}  estado')
+    for name, latencies, queries, statuses in results:
+        max_queries, max_p95 = BUDGETS.get(name, (None, None))
+        p95 = percentile(latencies, 95)
+        problems = []
+        if max_queries is not None and max(queries) > max_queries:
+            problems.append(f'consultas {max(queries)} > {max_queries}')
+        if max_p95 is not None and p95 > max_p95:
+            problems.append(f'p95 {p95:.1f} ms > {max_p95} ms')
+        if any(status >= 400 for status in statuses):
+            problems.append(f'HTTP {sorted(statuses)}')
+        print(f'{name:45} {statistics.median(latencies):8.1f} {p95:8.1f} {percentile(latencies, 99):8.1f} '
+              f'{max(queries):10d}  {"; ".join(problems) or "ok"}')
+        if problems:
+            failures.append(name)
+
+    if failures:
+        print(f'\n{len(failures)} ruta(s) fuera de presupuesto: {", ".join(failures)}')
+    return not failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de rutas con presupuestos de consultas y latencia')
+    parser.add_argument('--scale', type=float, default=1.0, help='tamaño de la flota (1.0 = 1000 estaciones)')
+    parser.add_argument('--iterations', type=int, default=20, help='peticiones por ruta')
+    parser.add_argument('--database', help='ruta del fichero SQLite (por defecto, uno temporal)')
+    parser.add_argument('--only', nargs='*', help='ejecutar sólo estas rutas')
+    args = parser.parse_args(argv)
+    return 0 if run(args.scale, args.iterations, args.database, args.only) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Benchmark de la ingesta de lecturas y de las series de los sensores (toolkit.timeseries).
+
+Uso:
+    python -m benchmarks.telemetry [--sensors 200] [--days 7] [--batch 5000] [--iterations 20]
+
+Crea una base de datos SQLite temporal con una estación cada cuatro sensores y
+envía a POST /telemetry/readings una lectura por sensor y minuto durante --days
+días, en lotes JSON de --batch lecturas. Después recalcula los agregados, envía
+un lote de lecturas atrasadas (que quedan pendientes de agregar) y compara las
+series de GET /telemetry/sensors/<id>/series con los valores calculados a partir
+de las lecturas. Termina con código 1 si alguna serie no coincide o si la ingesta
+o las consultas superan su presupuesto.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_USER = 'bench_admin'
+SENSORS_PER_STATION = 4
+SENSOR_TYPES = ['temperatura', 'humedad', 'presion', 'viento']
+
+# Presupuestos: lecturas por segundo en la ingesta y p95 en ms de las series
+MIN_READINGS_PER_SECOND = 20000
+SERIES_P95_MS = 50
+
+# Pasos que se consultan, con el agregado del que deben leerse
+STEPS = [('raw', 'raw'), ('5min', '1min'), ('1h', '1h'), ('6h', '1h'), ('1d', '1d')]
+
+START = 1_700_006_400  # 2023-11-15 00:00 UTC
+
+
+def setup(n_sensors):
+    from sqlalchemy import insert
+    from toolkit import db
+    from toolkit.models import User
+    from toolkit.station_models import Station, Sensor
+
+    admin = User(username=BENCH_USER, email='bench_admin@example.com', is_admin=True)
+    admin.set_password('bench')
+    db.session.add(admin)
+    db.session.flush()
+    n_stations = math.ceil(n_sensors / SENSORS_PER_STATION)
+    db.session.execute(insert(Station), [{
+        'id': i, 'name': f'Estación {i:04d}', 'island': 'Tenerife', 'municipality': 'Municipio 1',
+        'location': 'Benchmark', 'created_by': admin.id
+    } for i in range(1, n_stations + 1)])
+    db.session.execute(insert(Sensor), [{
+        'id': i, 'station_id': (i - 1) // SENSORS_PER_STATION + 1,
+        'sensor_type': SENSOR_TYPES[(i - 1) % SENSORS_PER_STATION], 'status': 'operativo'
+    } for i in range(1, n_sensors + 1)])
+    db.session.commit()
+
+
+def value(sensor_id, ts):
+    return round(15 + 10 * math.sin(ts / 86400 * 2 * math.pi + sensor_id) + (ts * 7919 + sensor_id) % 13 / 10, 2)
+
+
+def expected_series(readings, start, end, step):
+    """Puntos [inicio, mín, máx, media, lecturas] calculados a partir de las lecturas."""
+    buckets = {}
+    for ts, reading in readings:
+        if start <= ts < end:
+            buckets.setdefault(ts // step * step, []).append(reading)
+    return [[bucket, min(values), max(values), sum(values) / len(values), len(values)]
+            for bucket, values in sorted(buckets.items())]
+
+
+def same_points(got, expected):
+    if len(got) != len(expected):
+        return False
+    return all(
+        g[0] == e[0] and g[4] == e[4] and all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9) for a, b in zip(g[1:4], e[1:4]))
+        for g, e in zip(got, expected)
+    )
+
+
+def run(n_sensors=200, days=7, batch=5000, iterations=20, seed=1234):
+    from toolkit import create_app, db
+    from toolkit.timeseries import flush_readings, run_rollups
+
+    rng = random.Random(seed)
+    app = create_app('production')
+    app.config.update(SQL_INSTRUMENTATION=False, TELEMETRY_WORKER=False, TELEMETRY_BUFFER_ROWS=batch)
+    ok = True
+    with app.app_context():
+        setup(n_sensors)
+    client = app.test_client()
+    client.post('/auth/login', data={'username': BENCH_USER, 'password': 'bench'})
+
+    end = START + days * 86400
+    # Un minuto de cada diez se deja para el lote atrasado
+    late_minutes = set(range(START + 540, end, 600))
+    minutes = [ts for ts in range(START, end, 60) if ts not in late_minutes]
+    total = len(minutes) * n_sensors
+
+    def send(readings):
+        response = client.post('/telemetry/readings', data=json.dumps(readings), content_type='application/json')
+        if response.status_code != 202:
+            raise SystemExit(f'HTTP {response.status_code}: {response.get_data(as_text=True)[:500]}')
+
+    started = time.perf_counter()
+    pending = []
+    for ts in minutes:
+        pending.extend([sensor_id, ts, value(sensor_id, ts)] for sensor_id in range(1, n_sensors + 1))
+        while len(pending) >= batch:
+            send(pending[:batch])
+            del pending[:batch]
+    if pending:
+        send(pending)
+    with app.app_context():
+        flush_readings()
+    ingest_seconds = time.perf_counter() - started
+    rate = total / ingest_seconds
+
+    with app.app_context():
+        started = time.perf_counter()
+        intervals = run_rollups()
+        rollup_seconds = time.perf_counter() - started
+
+    status = 'ok' if rate >= MIN_READINGS_PER_SECOND else f'< {MIN_READINGS_PER_SECOND} lecturas/s'
+    ok = ok and status == 'ok'
+    print(f'ingesta: {total} lecturas en {ingest_seconds:.1f} s ({rate:,.0f} lecturas/s)  {status}')
+    print(f'agregados: {intervals} intervalo(s) pendiente(s) en {rollup_seconds:.1f} s')
+
+    # Lecturas atrasadas: quedan pendientes de agregar y las series deben incluirlas igualmente
+    late = [[sensor_id, ts, value(sensor_id, ts)] for ts in sorted(late_minutes) for sensor_id in range(1, n_sensors + 1)]
+    for start in range(0, len(late), batch):
+        send(late[start:start + batch])
+    with app.app_context():
+        flush_readings()
+
+    print(f'{"paso":8} {"origen":>7} {"puntos":>7} {"p50 ms":>8} {"p95 ms":>8}  estado')
+    for label, source in STEPS:
+        latencies, status, points = [], 'ok', 0
+        for i in range(iterations):
+            sensor_id = rng.randint(1, n_sensors)
+            span = 86400 if label == 'raw' else days * 86400
+            first = START + rng.randint(0, days * 86400 - span) // 60 * 60
+            started = time.perf_counter()
+            response = client.get(f'/telemetry/sensors/{sensor_id}/series?start={first}&end={first + span}&step={label}')
+            latencies.append((time.perf_counter() - started) * 1000)
+            data = response.get_json()
+            readings = [(ts, value(sensor_id, ts)) for ts in range(START, end, 60)]
+            if label == 'raw':
+                expected = [[ts, reading] for ts, reading in readings if first <= ts < first + span]
+                correct = data['points'] == expected
+            else:
+                step = data['step']
+                correct = same_points(data['points'], expected_series(readings, data['start'], data['end'], step))
+            if not correct:
+                status = 'la serie no coincide con las lecturas'
+            elif data['source'] != source:
+                status = f'leída de {data["source"]} (se esperaba {source})'
+            points = len(data['points'])
+        p95 = sorted(latencies)[max(0, math.ceil(0.95 * len(latencies)) - 1)]
+        if status == 'ok' and p95 > SERIES_P95_MS:
+            status = f'p95 > {SERIES_P95_MS} ms'
+        ok = ok and status == 'ok'
+        print(f'{label:8} {source:>7} {points:7d} {statistics.median(latencies):8.1f} {p95:8.1f}  {status}')
+
+    # Lectura atrasada en medio de intervalos ya agregados: el minuto, la hora y el día que
+    # la contienen se recalculan con todas sus lecturas, no sólo con las anteriores a ella
+    with app.app_context():
+        run_rollups()
+    sensor_id, late_ts = 1, START + 3 * 3600 + 1241
+    send([[sensor_id, late_ts, 99.0]])
+    with app.app_context():
+        flush_readings()
+        run_rollups()
+        status = check_rollups(sensor_id, late_ts, [(ts, value(sensor_id, ts)) for ts in range(START, end, 60)]
+                               + [(late_ts, 99.0)])
+    ok = ok and status == 'ok'
+    print(f'lectura atrasada ya agregada: {status}')
+    return ok
+
+
+def check_rollups(sensor_id, ts, readings):
+    """Compara los agregados guardados que contienen ts con los calculados a partir de las lecturas."""
+    from sqlalchemy import select
+    from toolkit import db
+    from toolkit.station_models import SensorRollup
+    from toolkit.timeseries import ROLLUP_RESOLUTIONS
+
+    for resolution in ROLLUP_RESOLUTIONS:
+        bucket = ts // resolution * resolution
+        row = db.session.execute(select(
+            SensorRollup.samples, SensorRollup.min_value, SensorRollup.max_value, SensorRollup.sum_value
+        ).where(SensorRollup.sensor_id == sensor_id, SensorRollup.resolution == resolution,
+                SensorRollup.bucket == bucket)).one_or_none()
+        got = [bucket, row.min_value, row.max_value, row.sum_value / row.samples, row.samples] if row else None
+        if got is None or not same_points([got], expected_series(readings, bucket, bucket + resolution, resolution)):
+            return f'el agregado de {resolution} s no coincide con las lecturas: {got}'
+    return 'ok'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Ingesta de lecturas y series de los sensores')
+    parser.add_argument('--sensors', type=int, default=200, help='número de sensores')
+    parser.add_argument('--days', type=int, default=7, help='días de lecturas (una por minuto)')
+    parser.add_argument('--batch', type=int, default=5000, help='lecturas por petición')
+    parser.add_argument('--iterations', type=int, default=20, help='consultas por paso')
+    args = parser.parse_args(argv)
+    # config.py lee DATABASE_URL al importarse
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='toolkit-telemetry-'), 'bench.db')
+    return 0 if run(args.sensors, args.days, args.batch, args.iterations) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
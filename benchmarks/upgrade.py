@@ -0,0 +1,277 @@
+"""Comprobación de la actualización del esquema (toolkit.migrations).
+
+Uso:
+    python -m benchmarks.upgrade
+
+Crea una base de datos SQLite temporal con el esquema inicial de la aplicación
+(el de antes de las migraciones versionadas) y unos pocos registros, arranca la
+aplicación sobre ella (create_app aplica las migraciones pendientes) y comprueba
+que llega a la última versión con las columnas, los índices y las claves foráneas
+de los modelos, que los resúmenes, los agregados de fiabilidad, el índice de
+búsqueda y las posiciones de las estaciones quedan calculados y que las páginas
+principales responden. Termina con código 1 si algo no coincide.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+
+BENCH_USER = 'admin'
+
+# Esquema inicial, tal y como lo creaba db.create_all() antes de la migración 1
+BASELINE_SCHEMA = [
+    """CREATE TABLE user (
+        id INTEGER NOT NULL,
+        username VARCHAR(80) NOT NULL,
+        email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(200) NOT NULL,
+        is_admin BOOLEAN,
+        created_at DATETIME,
+        created_by INTEGER,
+        PRIMARY KEY (id),
+        UNIQUE (username),
+        UNIQUE (email),
+        FOREIGN KEY(created_by) REFERENCES user (id)
+    )""",
+    """CREATE TABLE "Station" (
+        id INTEGER NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        island VARCHAR(50) NOT NULL,
+        municipality VARCHAR(100) NOT NULL,
+        location VARCHAR(200) NOT NULL,
+        coordinates VARCHAR(100),
+        contact VARCHAR(200),
+        how_to_get TEXT,
+        required_vehicle VARCHAR(20),
+        measurement_type VARCHAR(50),
+        status VARCHAR(20),
+        created_at DATETIME,
+        updated_at DATETIME,
+        created_by INTEGER NOT NULL,
+        PRIMARY KEY (id),
+        UNIQUE (name),
+        FOREIGN KEY(created_by) REFERENCES user (id)
+    )""",
+    """CREATE TABLE sensor (
+        id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        sensor_type VARCHAR(50) NOT NULL,
+        model VARCHAR(100),
+        serial_number VARCHAR(100),
+        status VARCHAR(20),
+        installation_date DATETIME,
+        last_calibration DATETIME,
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(station_id) REFERENCES "Station" (id)
+    )""",
+    """CREATE TABLE router (
+        id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        model VARCHAR(100) NOT NULL,
+        ip_address VARCHAR(45),
+        mac_address VARCHAR(17),
+        serial_number VARCHAR(100),
+        firmware_version VARCHAR(50),
+        status VARCHAR(20),
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(station_id) REFERENCES "Station" (id)
+    )""",
+    """CREATE TABLE technical_detail (
+        id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        detail_type VARCHAR(50) NOT NULL,
+        "key" VARCHAR(100) NOT NULL,
+        value TEXT NOT NULL,
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(station_id) REFERENCES "Station" (id)
+    )""",
+    """CREATE TABLE breakdown (
+        id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        title VARCHAR(200) NOT NULL,
+        description TEXT NOT NULL,
+        severity VARCHAR(20),
+        reported_date DATETIME,
+        resolved_date DATETIME,
+        resolved BOOLEAN,
+        resolution_notes TEXT,
+        reported_by INTEGER NOT NULL,
+        resolved_by INTEGER,
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(station_id) REFERENCES "Station" (id),
+        FOREIGN KEY(reported_by) REFERENCES user (id),
+        FOREIGN KEY(resolved_by) REFERENCES user (id)
+    )""",
+    """CREATE TABLE intervention (
+        id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        intervention_type VARCHAR(50) NOT NULL,
+        title VARCHAR(200) NOT NULL,
+        description TEXT NOT NULL,
+        intervention_date DATETIME,
+        technician_name VARCHAR(100),
+        performed_by INTEGER NOT NULL,
+        created_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(station_id) REFERENCES "Station" (id),
+        FOREIGN KEY(performed_by) REFERENCES user (id)
+    )""",
+    """CREATE TABLE station_history (
+        id INTEGER NOT NULL,
+        station_id INTEGER NOT NULL,
+        action VARCHAR(50) NOT NULL,
+        field_changed VARCHAR(100),
+        old_value TEXT,
+        new_value TEXT,
+        description TEXT,
+        changed_by INTEGER NOT NULL,
+        created_at DATETIME,
+        PRIMARY KEY (id),
+        FOREIGN KEY(station_id) REFERENCES "Station" (id),
+        FOREIGN KEY(changed_by) REFERENCES user (id)
+    )""",
+]
+
+SEED = [
+    "INSERT INTO user VALUES (1, 'admin', 'admin@example.com', '-', 1, '2024-01-01', NULL)",
+    "INSERT INTO \"Station\" VALUES (1, 'Estación 1', 'Tenerife', 'La Laguna', 'Montaña', '28.4853, -16.3201',"
+    " NULL, 'Pista forestal desde el mirador', '4x4', NULL, 'activa', '2024-01-01', '2024-01-01', 1)",
+    "INSERT INTO \"Station\" VALUES (2, 'Estación 2', 'Gran Canaria', 'Telde', 'Costa', 'sin coordenadas',"
+    " NULL, NULL, 'normal', NULL, 'averiada', '2024-01-01', '2024-01-01', 1)",
+    "INSERT INTO \"Station\" VALUES (3, 'Estación 3', 'Tenerife', 'Santa Cruz', 'Puerto', '28°27''49\"N 16°15''07\"W',"
+    " NULL, NULL, 'normal', NULL, 'activa', '2024-01-01', '2024-01-01', 1)",
+    "INSERT INTO sensor VALUES (1, 1, 'temperatura', 'T1', 'S-1', 'operativo', '2024-01-01', '2024-01-01',"
+    " '2024-01-01', '2024-01-01')",
+    "INSERT INTO sensor VALUES (2, 1, 'humedad', 'H1', 'S-2', 'en_calibracion', '2024-01-01', NULL,"
+    " '2024-01-01', '2024-01-01')",
+    "INSERT INTO router VALUES (1, 1, 'RUT955', '10.0.0.1', NULL, NULL, NULL, 'online', '2024-01-01', '2024-01-01')",
+    "INSERT INTO technical_detail VALUES (1, 1, 'alimentación', 'Tipo de alimentación', 'Solar',"
+    " '2024-01-01', '2024-01-01')",
+    "INSERT INTO breakdown VALUES (1, 2, 'Sin comunicación', 'El router no responde', 'alta', '2024-02-01 10:00:00',"
+    " NULL, 0, NULL, 1, NULL, '2024-02-01', '2024-02-01')",
+    "INSERT INTO breakdown VALUES (2, 1, 'Sensor bloqueado', 'Lecturas fijas', 'media', '2024-02-01 10:00:00',"
+    " '2024-02-02 10:00:00', 1, 'Reiniciado', 1, 1, '2024-02-01', '2024-02-02')",
+    "INSERT INTO intervention VALUES (1, 1, 'reparacion', 'Cambio de sensor', 'Sustitución', '2024-02-02',"
+    " 'Técnico', 1, '2024-02-02', '2024-02-02')",
+    "INSERT INTO intervention VALUES (2, 2, 'mantenimiento', 'Revisión', 'Programada', '2024-03-01',"
+    " NULL, 1, '2024-02-03', '2024-02-03')",
+    "INSERT INTO station_history VALUES (1, 1, 'created', NULL, NULL, NULL, 'Estación creada', 1, '2024-01-01')",
+]
+
+
+def create_baseline(path):
+    connection = sqlite3.connect(path)
+    try:
+        for statement in BASELINE_SCHEMA + SEED:
+            connection.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def check_schema(errors):
+    from sqlalchemy import inspect
+    from toolkit import db
+    from toolkit.migrations import MIGRATIONS, current_version
+
+    version = current_version()
+    if version != MIGRATIONS[-1][0]:
+        errors.append(f'versión {version}, se esperaba {MIGRATIONS[-1][0]}')
+    inspector = inspect(db.session.connection())
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            # Tablas virtuales y las que sólo se crean con su backend (FTS5, R*Tree)
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        missing = [column.name for column in table.columns if column.name not in columns]
+        if missing:
+            errors.append(f'{table.name}: faltan las columnas {", ".join(missing)}')
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing = sorted(index.name for index in table.indexes if index.name not in indexes)
+        if missing:
+            errors.append(f'{table.name}: faltan los índices {", ".join(missing)}')
+        for fk in inspector.get_foreign_keys(table.name):
+            declared = next((c for c in table.foreign_key_constraints if c.referred_table.name == fk['referred_table']),
+                            None)
+            if declared is not None and declared.ondelete and \
+                    (fk['options'].get('ondelete') or '').upper() != declared.ondelete.upper():
+                errors.append(f'{table.name}: la clave foránea hacia {fk["referred_table"]} no es {declared.ondelete}')
+
+
+def check_data(errors):
+    from toolkit import db
+    from toolkit.station_models import Station
+    from toolkit.summary import rebuild_summaries
+    from toolkit.reliability import rebuild_rollups
+    from toolkit.search_index import search
+    from toolkit.migrations import upgrade
+
+    drifted = rebuild_summaries(verify_only=True)
+    if drifted:
+        errors.append(f'resúmenes que no coinciden: {drifted}')
+    drifted = rebuild_rollups(verify_only=True)
+    if drifted:
+        errors.append(f'agregados de fiabilidad que no coinciden: {drifted}')
+    results, _ = search('pista forestal')
+    if [(result['kind'], result['record_id']) for result in results] != [('station', 1)]:
+        errors.append(f'búsqueda: {results}')
+    for station_id, latitude in [(1, 28.4853), (3, 28 + 27 / 60 + 49 / 3600)]:
+        station = db.session.get(Station, station_id)
+        if station.latitude is None or abs(station.latitude - latitude) > 1e-6:
+            errors.append(f'posición de la estación {station_id}: {station.latitude}, {station.longitude}')
+    applied = upgrade()
+    if applied:
+        errors.append(f'una segunda actualización vuelve a aplicar {applied}')
+
+
+def check_routes(app, errors):
+    from toolkit import db
+    from toolkit.models import User
+
+    with app.app_context():
+        user = db.session.get(User, 1)
+        user.set_password('bench')
+        db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': BENCH_USER, 'password': 'bench'})
+    for url in ['/stations/', '/stations/1', '/triage/', '/analytics/', '/api/v1/stations?include=sensors']:
+        response = client.get(url)
+        if response.status_code != 200:
+            errors.append(f'GET {url}: HTTP {response.status_code}')
+
+
+def run():
+    from toolkit import create_app
+
+    errors = []
+    app = create_app('production')
+    with app.app_context():
+        check_schema(errors)
+        check_data(errors)
+    check_routes(app, errors)
+    for error in errors:
+        print(error)
+    print('actualización desde el esquema inicial: ' + ('correcta' if not errors else f'{len(errors)} error(es)'))
+    return not errors
+
+
+def main(argv=None):
+    path = os.path.join(tempfile.mkdtemp(prefix='toolkit-upgrade-'), 'baseline.db')
+    create_baseline(path)
+    # config.py lee DATABASE_URL y JOB_WORKER al importarse
+    os.environ['DATABASE_URL'] = 'sqlite:///' + path
+    os.environ['JOB_WORKER'] = '0'
+    return 0 if run() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,12 +4,138 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'clave-secreta-desarrollo-cambiar-en-produccion'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///toolkit.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Aplicar las migraciones pendientes al arrancar (ver 'flask schema upgrade')
+    AUTO_MIGRATE = True
+    # Instrumentación SQL por petición (cabecera Server-Timing, detector de N+1, consultas lentas)
+    SQL_INSTRUMENTATION = False
+    SQL_N_PLUS_ONE_THRESHOLD = 10  # ejecuciones de la misma consulta en una petición
+    SQL_SLOW_QUERY_MS = 200  # None para desactivar el registro de consultas lentas
+    # Caché de usuarios del user_loader: 'local' (por proceso), 'shared' (coherente
+    # entre workers de la misma máquina) o None para consultar siempre la base de datos
+    USER_CACHE = os.environ.get('USER_CACHE', 'local')
+    USER_CACHE_TTL = 300  # segundos
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_PATH = os.environ.get('USER_CACHE_PATH')  # fichero de invalidación para 'shared'
+    # Caché de fragmentos de las páginas de estación: 'local' (LRU del proceso), 'file' (directorio compartido) o None
+    FRAGMENT_CACHE = os.environ.get('FRAGMENT_CACHE', 'local')
+    FRAGMENT_CACHE_TTL = 3600  # segundos
+    FRAGMENT_CACHE_SIZE = 2048
+    FRAGMENT_CACHE_PATH = os.environ.get('FRAGMENT_CACHE_PATH')  # directorio para 'file'
+    # PRAGMAs que se aplican a cada conexión SQLite nueva. foreign_keys activa las
+    # claves foráneas (SQLite no las comprueba por defecto) y con ellas ON DELETE CASCADE
+    # WAL: los trabajos en segundo plano escriben mientras otras conexiones leen
+    SQLITE_PRAGMAS = {'foreign_keys': 'ON', 'journal_mode': 'WAL'}
+    # Borrado de estaciones: lógico (se ocultan y sus registros se purgan por lotes)
+    # o inmediato (un DELETE con borrado en cascada en la base de datos)
+    STATION_SOFT_DELETE = os.environ.get('STATION_SOFT_DELETE') == '1'
+    STATION_PURGE_WORKER = True  # purgar con un trabajo en segundo plano; si no, con 'flask purge run'
+    STATION_PURGE_BATCH_SIZE = 1000
+    # Archivado del historial ('flask history archive'): los registros más antiguos
+    # se mueven a segmentos comprimidos por estación, que se eliminan tras la retención
+    HISTORY_ARCHIVE_AFTER_DAYS = 365
+    HISTORY_RETENTION_DAYS = None  # None para conservar el archivo indefinidamente
+    HISTORY_ARCHIVE_PATH = os.environ.get('HISTORY_ARCHIVE_PATH')  # por defecto instance/history
+    # Sondeo de routers ('flask routers poll|watch'): conexión TCP a ip_address:puerto
+    ROUTER_POLL_PORT = int(os.environ.get('ROUTER_POLL_PORT', 80))
+    ROUTER_POLL_TIMEOUT = 1.0  # segundos por router
+    ROUTER_POLL_CONCURRENCY = 200  # conexiones abiertas a la vez
+    ROUTER_POLL_INTERVAL = 60  # segundos entre sondeos
+    ROUTER_POLL_JITTER = 0.2  # variación aleatoria del intervalo (±20 %)
+    # Calibraciones ('flask calibration schedule'): días entre calibraciones por tipo de sensor
+    CALIBRATION_INTERVALS = {
+        'temperatura': 365,
+        'humedad': 365,
+        'presion': 730,
+        'viento': 365,
+        'direccion_viento': 365,
+        'lluvia': 180,
+        'radiacion': 365,
+        'uv': 365,
+    }
+    CALIBRATION_DEFAULT_INTERVAL = 365  # tipos que no están en CALIBRATION_INTERVALS
+    CALIBRATION_WINDOW_DAYS = 30  # se programan también las que vencen en este plazo
+    # Lecturas de los sensores (POST /telemetry/readings): se acumulan en un buffer por
+    # proceso y se escriben por lotes; un hilo escribe el buffer y recalcula los agregados
+    TELEMETRY_BUFFER_ROWS = 5000  # lecturas en el buffer que fuerzan la escritura
+    TELEMETRY_BUFFER_SECONDS = 5  # antigüedad máxima del buffer e intervalo del hilo
+    TELEMETRY_WORKER = True  # si no, los agregados se recalculan con 'flask telemetry rollup'
+    TELEMETRY_MAX_BATCH = 50000  # lecturas por petición
+    TELEMETRY_MAX_BODY_BYTES = 16 * 1024 * 1024
+    TELEMETRY_MAX_FUTURE_SECONDS = 300  # margen para relojes adelantados
+    TELEMETRY_MAX_POINTS = 5000  # puntos por serie
+    TELEMETRY_INGEST_TOKEN = os.environ.get('TELEMETRY_INGEST_TOKEN')  # 'Authorization: Bearer <token>'
+    # Sincronización de clientes sin conexión (/sync/changes y /sync/push)
+    SYNC_MAX_OPERATIONS = 500  # operaciones por lote enviado
+    SYNC_TOMBSTONE_DAYS = 90  # 'flask sync prune': los clientes más antiguos sincronizan desde cero
+    # Fuera de SQLite los seq pueden confirmarse desordenados: el cursor no avanza sobre los
+    # cambios de este margen, que se reenvían (una transacción más larga puede perderse)
+    SYNC_SETTLE_SECONDS = 30
+    # API JSON de sólo lectura (/api/v1): páginas de los listados y compresión de las respuestas
+    API_PAGE_SIZE = 100
+    API_MAX_PAGE_SIZE = 500
+    API_GZIP_MIN_BYTES = 1024  # las respuestas más pequeñas no se comprimen
+    API_GZIP_LEVEL = 6
+    # Cambios en tiempo real (/events/stations, Server-Sent Events): un hilo por proceso lee
+    # el historial y lo reparte a los clientes. Cada cliente ocupa una conexión abierta:
+    # con gunicorn hacen falta workers con hilos (--threads) o gevent
+    FEED_POLL_SECONDS = 2  # lectura periódica de los cambios de otros procesos
+    FEED_BATCH_SECONDS = 0.2  # las confirmaciones seguidas se leen juntas
+    FEED_BACKLOG = 1000  # eventos guardados para reanudar con Last-Event-ID
+    FEED_QUEUE_SIZE = 1000  # eventos pendientes por cliente antes de desconectarlo
+    FEED_KEEPALIVE_SECONDS = 15
+    FEED_RETRY_MS = 3000  # espera del navegador antes de reconectar
+    FEED_MAX_SUBSCRIBERS = 500
+    # Fuera de SQLite los ids del historial pueden confirmarse desordenados: se releen los
+    # creados en este margen (un cambio que tarde más en confirmarse no se difunde)
+    FEED_SETTLE_SECONDS = 30
+    # Trabajos en segundo plano (/jobs, runner.py): se guardan en la tabla job y los ejecuta
+    # un pool de hilos del proceso web (arranca con su primera petición) o, con JOB_WORKER=0,
+    # 'flask jobs work'; sin runner en el proceso, las estaciones se borran en la petición
+    JOB_WORKER = os.environ.get('JOB_WORKER', '1') == '1'
+    JOB_WORKERS = 2  # trabajos a la vez por proceso
+    JOB_POLL_SECONDS = 5  # reintentos pendientes y trabajos encolados por otros procesos
+    JOB_STALE_SECONDS = 120  # sin latido durante este tiempo, el trabajo se recupera
+    JOB_PROGRESS_SECONDS = 1  # como mucho una escritura de progreso por segundo
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_BASE_SECONDS = 10  # espera antes del primer reintento; se duplica en cada uno
+    JOB_RETRY_MAX_SECONDS = 600
+    JOB_RETENTION_DAYS = 7  # 'flask jobs prune'
+    JOB_FILES_PATH = os.environ.get('JOB_FILES_PATH')  # ficheros de los trabajos; por defecto instance/jobs
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    SQL_INSTRUMENTATION = True
 
 class ProductionConfig(Config):
     DEBUG = False
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION') == '1'
+    # Con varios workers de gunicorn, 'local' dejaría a un administrador degradado o
+    # eliminado con sus permisos en los demás workers hasta USER_CACHE_TTL
+    USER_CACHE = os.environ.get('USER_CACHE', 'shared')
+    
+    # SQLite: WAL permite lecturas concurrentes con una escritura y busy_timeout
+    # hace esperar a los writers en lugar de fallar con "database is locked"
+    SQLITE_PRAGMAS = {
+        **Config.SQLITE_PRAGMAS,
+        'synchronous': 'NORMAL',
+        'busy_timeout': 30000,  # ms
+        'mmap_size': 268435456,  # 256 MB
+        'cache_size': -65536,  # 64 MB (en KB si es negativo)
+    }
+    
+    if Config.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'connect_args': {'timeout': 30},
+        }
+    else:
+        # PostgreSQL (u otro servidor): pool por worker de gunicorn
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_timeout': 30,
+            'pool_pre_ping': True,
+            'pool_recycle': 1800,
+        }
 
 config = {
     'development': DevelopmentConfig,
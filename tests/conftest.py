@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+import pytest
+
+# config.py lee DATABASE_URL y JOB_WORKER al importarse
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='toolkit-tests-'), 'tests.db')
+os.environ['JOB_WORKER'] = '0'
+
+from toolkit import create_app, db  # noqa: E402
+from toolkit.models import User  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    # Cada prueba crea la aplicación y con ella cachés vacías (usuarios y fragmentos)
+    app = create_app('development')
+    app.config.update(TESTING=True)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', is_admin=True)
+        admin.set_password('admin')
+        db.session.add(admin)
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'admin'})
+    return client
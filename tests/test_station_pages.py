@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from toolkit import db
+from toolkit.station_models import Breakdown, Intervention
+
+STATION = {'island': 'Tenerife', 'municipality': 'La Laguna', 'location': 'Montaña', 'coordinates': '28.46, -16.25',
+           'status': 'activa'}
+
+# Consultas de cada página, sea cual sea el número de registros de la estación
+PAGE_QUERIES = {'/stations/{}': 8, '/stations/{}/details': 3}
+
+
+@contextmanager
+def count_queries(app):
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def create_station(client, name, records):
+    """Crea una estación con records sensores, detalles, averías (abiertas y resueltas),
+    intervenciones (pendientes y realizadas) y su historial. Devuelve su id."""
+    response = client.post('/stations/new', data=dict(STATION, name=name))
+    station_id = int(response.headers['Location'].rsplit('/', 1)[-1])
+    client.post(f'/stations/{station_id}/router', data={'model': 'RUT955', 'ip_address': '10.0.0.1', 'status': 'online'})
+    for i in range(records):
+        client.post(f'/stations/{station_id}/sensors/add',
+                    data={'sensor_type': 'temperatura', 'model': f'T{i}', 'status': 'operativo'})
+        client.post(f'/stations/{station_id}/details/add',
+                    data={'detail_type': 'alimentación', 'key': f'Clave {i}', 'value': 'Solar'})
+        for _ in range(2):
+            client.post(f'/stations/{station_id}/breakdowns/report',
+                        data={'title': f'Avería {i}', 'description': 'Sin datos', 'severity': 'alta'})
+            client.post(f'/stations/{station_id}/interventions/schedule',
+                        data={'intervention_type': 'mantenimiento', 'title': f'Revisión {i}', 'description': 'd'})
+    with client.application.app_context():
+        breakdown_ids = [row.id for row in Breakdown.query.filter_by(station_id=station_id).all()]
+        intervention_ids = [row.id for row in Intervention.query.filter_by(station_id=station_id).all()]
+        assert len(breakdown_ids) == len(intervention_ids) == 2 * records
+    # La mitad quedan resueltas o realizadas; el resto sigue abierto o pendiente
+    for breakdown_id in breakdown_ids[::2]:
+        client.post(f'/stations/breakdowns/{breakdown_id}/resolve', data={'resolution_notes': 'Resuelta'})
+    for intervention_id in intervention_ids[::2]:
+        client.post(f'/stations/interventions/{intervention_id}/complete', data={})
+    return station_id
+
+
+@pytest.mark.parametrize('path', sorted(PAGE_QUERIES))
+def test_station_page_queries(app, client, path):
+    counts = []
+    for name, records in [('Pocos registros', 1), ('Muchos registros', 8)]:
+        station_id = create_station(client, name, records)
+        with count_queries(app) as queries:
+            response = client.get(path.format(station_id))
+        assert response.status_code == 200
+        counts.append(len(queries))
+    # Con la caché de fragmentos vacía: el número de consultas no depende de los registros
+    assert counts == [PAGE_QUERIES[path]] * 2
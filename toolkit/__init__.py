@@ -17,6 +17,18 @@ def create_app(config_name='default'):
     db.init_app(app)
     login_manager.init_app(app)
     
+    from .engine import init_engine
+    init_engine(app)
+    
+    from .instrumentation import init_instrumentation
+    init_instrumentation(app)
+    
+    from .models import init_user_cache
+    init_user_cache(app)
+    
+    from .fragments import init_fragment_cache
+    init_fragment_cache(app)
+    
     # Registrar blueprints
     from .auth import auth as auth_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
@@ -27,8 +39,78 @@ def create_app(config_name='default'):
     from .station import stations as station_blueprint  # NUEVO
     app.register_blueprint(station_blueprint, url_prefix='/stations')  # NUEVO
     
-    # Crear tablas si no existen
+    from .search import search as search_blueprint
+    app.register_blueprint(search_blueprint, url_prefix='/search')
+    
+    from .triage import triage as triage_blueprint
+    app.register_blueprint(triage_blueprint, url_prefix='/triage')
+    
+    from .analytics import analytics as analytics_blueprint
+    app.register_blueprint(analytics_blueprint, url_prefix='/analytics')
+    
+    from .telemetry import telemetry as telemetry_blueprint
+    app.register_blueprint(telemetry_blueprint, url_prefix='/telemetry')
+    
+    from .sync import sync as sync_blueprint
+    app.register_blueprint(sync_blueprint, url_prefix='/sync')
+    
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint, url_prefix='/api/v1')
+    
+    from .events import events as events_blueprint
+    app.register_blueprint(events_blueprint, url_prefix='/events')
+    
+    from .jobs import jobs as jobs_blueprint
+    app.register_blueprint(jobs_blueprint, url_prefix='/jobs')
+    
+    # Comandos de mantenimiento (flask summaries rebuild|verify, flask schema upgrade|version|explain)
+    from .summary import summaries_cli
+    app.cli.add_command(summaries_cli)
+    
+    from .migrations import schema_cli, upgrade
+    app.cli.add_command(schema_cli)
+    
+    from .search_index import search_cli
+    app.cli.add_command(search_cli)
+    
+    from .importer import import_cli
+    app.cli.add_command(import_cli)
+    
+    from .reliability import reliability_cli
+    app.cli.add_command(reliability_cli)
+    
+    from .purge import purge_cli
+    app.cli.add_command(purge_cli)
+    
+    from .history import history_cli
+    app.cli.add_command(history_cli)
+    
+    from .poller import routers_cli
+    app.cli.add_command(routers_cli)
+    
+    from .calibration import calibration_cli
+    app.cli.add_command(calibration_cli)
+    
+    from .geo import geo_cli
+    app.cli.add_command(geo_cli)
+    
+    from .timeseries import telemetry_cli
+    app.cli.add_command(telemetry_cli)
+    
+    from .changelog import sync_cli
+    app.cli.add_command(sync_cli)
+    
+    # Tipos de trabajo en segundo plano (se registran al importar tasks)
+    from . import tasks
+    from .runner import jobs_cli, init_job_runner
+    app.cli.add_command(jobs_cli)
+    # El runner del proceso web arranca con la primera petición (y ejecuta los pendientes)
+    init_job_runner(app)
+    
+    # Crear tablas si no existen y aplicar migraciones pendientes
     with app.app_context():
         db.create_all()
+        if app.config['AUTO_MIGRATE']:
+            upgrade()
     
     return app
\ No newline at end of file
@@ -0,0 +1,64 @@
+from flask import Blueprint, render_template, request, jsonify, flash
+from flask_login import login_required
+from datetime import timedelta
+from .reliability import GROUPINGS, parse_range, reliability_report, station_kpis_page
+
+analytics = Blueprint('analytics', __name__)
+
+
+def _kpi_arguments():
+    start, end = parse_range(request.args.get('start') or None, request.args.get('end') or None)
+    group = request.args.get('group') if request.args.get('group') in GROUPINGS else 'island'
+    island = request.args.get('island') or None
+    return start, end, group, island
+
+# Panel de indicadores de fiabilidad
+@analytics.route('/')
+@login_required
+def dashboard():
+    try:
+        start, end, group, island = _kpi_arguments()
+    except ValueError:
+        flash('Fechas no válidas (formato AAAA-MM-DD)', 'danger')
+        start, end = parse_range()
+        group, island = 'island', None
+
+    after_id = next_id = None
+    if group == 'station':
+        # Una fila por estación: se pagina como el listado de estaciones
+        after_id = request.args.get('after', type=int)
+        fleet, _ = reliability_report(start, end, 'fleet', island)
+        rows, next_id = station_kpis_page(start, end, island, after_id)
+    else:
+        fleet, rows = reliability_report(start, end, group, island)
+    return render_template(
+        'analytics/dashboard.html',
+        fleet=fleet,
+        rows=rows,
+        after_id=after_id,
+        next_id=next_id,
+        start=start,
+        end=end,
+        group=group,
+        island=island,
+        one_day=timedelta(days=1)
+    )
+
+# Los mismos indicadores en JSON
+@analytics.route('/api/kpis')
+@login_required
+def kpis():
+    try:
+        start, end, group, island = _kpi_arguments()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    fleet, rows = reliability_report(start, end, group, island)
+    return jsonify({
+        'start': start.isoformat(),
+        'end': (end - timedelta(days=1)).isoformat(),
+        'group': group,
+        'island': island,
+        'fleet': fleet,
+        'rows': rows,
+    })
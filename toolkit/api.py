@@ -0,0 +1,145 @@
+import gzip
+from flask import Blueprint, current_app, request, jsonify, url_for
+from flask_login import login_required
+from .resources import (
+    API_VERSION, RESOURCE_MODELS, INCLUDES, STATION_RECORDS, resource_columns, parse_fields, parse_include,
+    make_etag, station_version, station_versions_page, load_stations, station_records_page
+)
+
+api = Blueprint('api', __name__)
+
+
+def _representation():
+    # Los parámetros de la petición (campos, relaciones, filtros, página) en forma canónica
+    return request.path, tuple(sorted(request.args.items(multi=True)))
+
+
+def _error(message, status=400):
+    return jsonify({'error': message}), status
+
+
+def _page_size():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    if not 1 <= limit <= current_app.config['API_MAX_PAGE_SIZE']:
+        raise ValueError(f'limit debe estar entre 1 y {current_app.config["API_MAX_PAGE_SIZE"]}')
+    return limit
+
+
+def _next_url(**position):
+    args = request.args.to_dict(flat=False)
+    args.update(position)
+    return url_for(request.endpoint, **request.view_args, **args)
+
+
+def _finish(response, etag, compressible):
+    response.set_etag(etag)
+    # Los clientes pueden guardar la respuesta, pero deben revalidarla siempre
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    if compressible:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def _not_modified(etag, compressible):
+    """Respuesta 304 si el cliente ya tiene la representación actual, o None."""
+    # Cada codificación tiene su propia ETag (fuerte); basta con que coincida una
+    for candidate in (etag, etag + '-gzip') if compressible else (etag,):
+        if request.if_none_match.contains_weak(candidate):
+            return _finish(current_app.response_class(status=304), candidate, compressible)
+    return None
+
+
+def _json(payload, etag, compressible=False):
+    body = current_app.json.dumps(payload).encode()
+    response = current_app.response_class(body, mimetype='application/json')
+    if (compressible and len(body) >= current_app.config['API_GZIP_MIN_BYTES']
+            and request.accept_encodings['gzip']):
+        response.set_data(gzip.compress(body, current_app.config['API_GZIP_LEVEL']))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gzip'
+    return _finish(response, etag, compressible)
+
+
+# Listado de estaciones
+@api.route('/stations')
+@login_required
+def list_stations():
+    try:
+        fields = parse_fields(request.args)
+        include = parse_include(request.args.get('include'))
+        limit = _page_size()
+    except ValueError as e:
+        return _error(str(e))
+    versions, next_id = station_versions_page(
+        island=request.args.get('island') or None,
+        municipality=request.args.get('municipality') or None,
+        status=request.args.get('status') or None,
+        after_id=request.args.get('after', type=int),
+        limit=limit
+    )
+    etag = make_etag(_representation(), [tuple(row) for row in versions])
+    response = _not_modified(etag, compressible=True)
+    if response is not None:
+        return response
+    stations = load_stations([row[0] for row in versions], fields, include)
+    return _json({
+        'data': stations,
+        'next': _next_url(after=next_id) if next_id else None
+    }, etag, compressible=True)
+
+
+# Una estación con sus relaciones
+@api.route('/stations/<int:station_id>')
+@login_required
+def get_station(station_id):
+    try:
+        fields = parse_fields(request.args)
+        include = parse_include(request.args.get('include'))
+    except ValueError as e:
+        return _error(str(e))
+    version = station_version(station_id)
+    if version is None:
+        return _error('Estación no encontrada', 404)
+    etag = make_etag(_representation(), tuple(version))
+    response = _not_modified(etag, compressible=False)
+    if response is not None:
+        return response
+    return _json({'data': load_stations([station_id], fields, include)[0]}, etag)
+
+
+# Historial de averías o intervenciones de una estación
+@api.route('/stations/<int:station_id>/<any(breakdowns, interventions):relation>')
+@login_required
+def station_records(station_id, relation):
+    try:
+        fields = parse_fields(request.args)
+        limit = _page_size()
+    except ValueError as e:
+        return _error(str(e))
+    version = station_version(station_id)
+    if version is None:
+        return _error('Estación no encontrada', 404)
+    etag = make_etag(_representation(), tuple(version))
+    response = _not_modified(etag, compressible=True)
+    if response is not None:
+        return response
+    records, next_cursor = station_records_page(
+        relation, station_id, fields, request.args.get('cursor'), limit
+    )
+    return _json({
+        'data': records,
+        'next': _next_url(cursor=next_cursor) if next_cursor else None
+    }, etag, compressible=True)
+
+
+# Descripción de los recursos: tipos para fields[tipo] y relaciones para include
+@api.route('/')
+@login_required
+def index():
+    return jsonify({
+        'version': API_VERSION,
+        'fields': {kind: resource_columns(kind) for kind in RESOURCE_MODELS},
+        'includes': {name: kind for name, (kind, _, _) in INCLUDES.items()},
+        'station_records': {name: kind for name, (kind, _) in STATION_RECORDS.items()},
+    })
@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.exc import IntegrityError
 from . import db
-from .models import User
+from . import models, fragments
+from .models import User, invalidate_user
 from .utils import admin_required
 
 auth = Blueprint('auth', __name__)
@@ -58,6 +60,7 @@ def create_user():
         
         db.session.add(new_user)
         db.session.commit()
+        invalidate_user(new_user.id)
         
         flash(f'Usuario {username} creado exitosamente', 'success')
         return redirect(url_for('auth.list_users'))
@@ -81,11 +84,26 @@ def delete_user(user_id):
     
     user = User.query.get_or_404(user_id)
     db.session.delete(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Las claves foráneas impiden borrar usuarios con estaciones o registros a su nombre
+        db.session.rollback()
+        flash(f'El usuario {user.username} tiene registros asociados y no se puede eliminar', 'danger')
+        return redirect(url_for('auth.list_users'))
+    invalidate_user(user_id)
     
     flash(f'Usuario {user.username} eliminado', 'success')
     return redirect(url_for('auth.list_users'))
 
+@auth.route('/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    stats = models.user_cache.stats() if models.user_cache is not None else None
+    fragment_stats = fragments.fragment_cache.stats() if fragments.fragment_cache is not None else None
+    return jsonify({'user_cache': stats, 'fragment_cache': fragment_stats})
+
 @auth.route('/logout')
 @login_required
 def logout():
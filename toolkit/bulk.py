@@ -0,0 +1,160 @@
+from datetime import datetime
+from sqlalchemy import delete, insert, select, update
+from . import db
+from .station_models import Breakdown, Intervention, StationHistory
+from .summary import refresh_summaries
+from .reliability import record_changes
+from .search_index import index_documents, remove_documents
+from .calibration import CALIBRATION_TYPE, mark_calibrated
+from .changelog import log_sync_changes
+
+# Máximo de ids por petición
+MAX_BULK_IDS = 500
+
+# Resultado de cada id
+RESOLVED = 'resolved'
+COMPLETED = 'completed'
+DELETED = 'deleted'
+ALREADY_RESOLVED = 'already_resolved'
+ALREADY_COMPLETED = 'already_completed'
+NOT_FOUND = 'not_found'
+
+
+def parse_ids(values):
+    """Convierte la lista de ids recibida (formulario o JSON) en enteros únicos, en orden.
+
+    Lanza ValueError si no es una lista, si algún id no es un entero o si hay demasiados.
+    """
+    # Una cadena o un objeto también son iterables: "12" actuaría sobre los ids 1 y 2
+    if not isinstance(values, list):
+        raise ValueError('Se esperaba una lista de ids')
+    try:
+        ids = list(dict.fromkeys(int(value) for value in values))
+    except (TypeError, ValueError):
+        raise ValueError('Ids no válidos')
+    if len(ids) > MAX_BULK_IDS:
+        raise ValueError(f'Como máximo {MAX_BULK_IDS} registros por operación')
+    return ids
+
+
+def _outcomes(model, ids, done, done_outcome, skipped_outcome):
+    # Los ids no modificados existen (ya estaban cerrados) o no existen
+    outcomes = {record_id: done_outcome for record_id in done}
+    remaining = [record_id for record_id in ids if record_id not in outcomes]
+    if remaining:
+        existing = set(db.session.scalars(select(model.id).where(model.id.in_(remaining))))
+        for record_id in remaining:
+            outcomes[record_id] = skipped_outcome if record_id in existing else NOT_FOUND
+    return {record_id: outcomes[record_id] for record_id in ids}
+
+
+def _log_changes(rows, user_id, now):
+    if rows:
+        db.session.execute(insert(StationHistory), [
+            dict(row, changed_by=user_id, created_at=now) for row in rows
+        ])
+
+
+def bulk_resolve_breakdowns(ids, user_id, resolution_notes=None):
+    """Resuelve las averías indicadas con un único UPDATE (sólo las que siguen activas).
+
+    Devuelve {id: resultado}. No confirma la transacción.
+    """
+    now = datetime.utcnow()
+    # La condición resolved IS false hace de bloqueo: si dos peticiones compiten,
+    # cada avería sólo la resuelve una de ellas
+    rows = db.session.execute(
+        update(Breakdown)
+        .where(Breakdown.id.in_(ids), Breakdown.resolved.is_(False))
+        .values(resolved=True, resolved_date=now, resolved_by=user_id,
+                resolution_notes=resolution_notes, updated_at=now)
+        .returning(Breakdown.id, Breakdown.station_id, Breakdown.severity, Breakdown.reported_date,
+                   Breakdown.title, Breakdown.description)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    _log_changes([{
+        'station_id': row.station_id,
+        'action': 'breakdown_resolved',
+        'description': f'Avería resuelta: {row.title}',
+    } for row in rows], user_id, now)
+
+    # Las sentencias masivas no pasan por la sesión: tablas derivadas a mano
+    refresh_summaries({row.station_id for row in rows})
+    record_changes(Breakdown, [(
+        (row.station_id, row.severity, row.reported_date, False, None),
+        (row.station_id, row.severity, row.reported_date, True, now),
+    ) for row in rows])
+    index_documents(db.session.connection(), 'breakdown', [
+        (row.id, row.station_id, row.title, '\n'.join([row.description or '', resolution_notes or '']))
+        for row in rows
+    ])
+    log_sync_changes(db.session.connection(), 'breakdown', [(row.id, row.station_id) for row in rows])
+    return _outcomes(Breakdown, ids, [row.id for row in rows], RESOLVED, ALREADY_RESOLVED)
+
+
+def bulk_complete_interventions(ids, user_id, username):
+    """Marca como realizadas las intervenciones programadas indicadas con un único UPDATE.
+
+    Devuelve {id: resultado}. No confirma la transacción.
+    """
+    now = datetime.utcnow()
+    rows = db.session.execute(
+        update(Intervention)
+        .where(Intervention.id.in_(ids), Intervention.technician_name.is_(None))
+        .values(intervention_date=now, technician_name=username, performed_by=user_id, updated_at=now)
+        .returning(Intervention.id, Intervention.station_id, Intervention.title, Intervention.intervention_type)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    calibrations = [row.id for row in rows if row.intervention_type == CALIBRATION_TYPE]
+    if calibrations:
+        mark_calibrated(calibrations, now)
+
+    _log_changes([{
+        'station_id': row.station_id,
+        'action': 'intervention_completed',
+        'description': f'Intervención realizada: {row.title}',
+    } for row in rows], user_id, now)
+
+    refresh_summaries({row.station_id for row in rows})
+    log_sync_changes(db.session.connection(), 'intervention', [(row.id, row.station_id) for row in rows])
+    return _outcomes(Intervention, ids, [row.id for row in rows], COMPLETED, ALREADY_COMPLETED)
+
+
+def bulk_delete_breakdowns(ids):
+    """Elimina las averías indicadas con un único DELETE. Devuelve {id: resultado}."""
+    rows = db.session.execute(
+        delete(Breakdown)
+        .where(Breakdown.id.in_(ids))
+        .returning(Breakdown.id, Breakdown.station_id, Breakdown.severity, Breakdown.reported_date,
+                   Breakdown.resolved, Breakdown.resolved_date)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    refresh_summaries({row.station_id for row in rows})
+    record_changes(Breakdown, [(
+        (row.station_id, row.severity, row.reported_date, row.resolved, row.resolved_date), None
+    ) for row in rows])
+    remove_documents(db.session.connection(), 'breakdown', [row.id for row in rows])
+    log_sync_changes(db.session.connection(), 'breakdown', [(row.id, row.station_id) for row in rows], deleted=True)
+    return _outcomes(Breakdown, ids, [row.id for row in rows], DELETED, NOT_FOUND)
+
+
+def bulk_delete_interventions(ids):
+    """Elimina las intervenciones indicadas con un único DELETE. Devuelve {id: resultado}."""
+    rows = db.session.execute(
+        delete(Intervention)
+        .where(Intervention.id.in_(ids))
+        .returning(Intervention.id, Intervention.station_id, Intervention.intervention_type,
+                   Intervention.created_at)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    refresh_summaries({row.station_id for row in rows})
+    record_changes(Intervention, [
+        ((row.station_id, row.intervention_type, row.created_at), None) for row in rows
+    ])
+    remove_documents(db.session.connection(), 'intervention', [row.id for row in rows])
+    log_sync_changes(db.session.connection(), 'intervention', [(row.id, row.station_id) for row in rows], deleted=True)
+    return _outcomes(Intervention, ids, [row.id for row in rows], DELETED, NOT_FOUND)
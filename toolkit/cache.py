@@ -0,0 +1,189 @@
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+
+class LRUCache:
+    """Caché en memoria del proceso con tamaño máximo (LRU) y caducidad (TTL)."""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or (self.ttl and item[1] < time.monotonic()):
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            expires = time.monotonic() + self.ttl if self.ttl else None
+            self._data[key] = (value, expires or float('inf'))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if isinstance(key, str) and key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'size': len(self._data), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+
+class SharedLRUCache(LRUCache):
+    """LRU local que se vacía cuando otro proceso invalida la caché.
+
+    Las invalidaciones se publican modificando un fichero compartido; cada proceso
+    comprueba su fecha y tamaño (un stat) antes de leer, así que varios workers
+    en la misma máquina se mantienen coherentes.
+    """
+
+    def __init__(self, path, max_size=1024, ttl=300):
+        super().__init__(max_size, ttl)
+        self.path = path
+        self.invalidations = 0
+        self._seen = self._stamp()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _sync(self):
+        stamp = self._stamp()
+        if stamp != self._seen:
+            self._seen = stamp
+            self.invalidations += 1
+            super().clear()
+
+    def _publish(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Se añade un byte en cada publicación para que el tamaño cambie aunque
+        # la resolución de la fecha del sistema de ficheros sea gruesa
+        mode = 'w' if (self._stamp() or (0, 0))[1] >= 4096 else 'a'
+        with open(self.path, mode) as f:
+            f.write('.')
+        # Ajustar una marca propia evita vaciar la caché local por nuestra propia publicación
+        self._seen = self._stamp()
+
+    def get(self, key, default=None):
+        self._sync()
+        return super().get(key, default)
+
+    def delete(self, key):
+        super().delete(key)
+        self._publish()
+
+    def delete_prefix(self, prefix):
+        super().delete_prefix(prefix)
+        self._publish()
+
+    def clear(self):
+        super().clear()
+        self._publish()
+
+    def stats(self):
+        return dict(super().stats(), invalidations=self.invalidations)
+
+
+class FileCache:
+    """Caché de textos en un directorio, compartida por los procesos de la máquina.
+
+    Cada entrada es un fichero cuyo nombre es la clave; la caducidad se mide con la
+    fecha de modificación y, al superar max_size entradas, se eliminan las más antiguas.
+    """
+
+    def __init__(self, path, max_size=1024, ttl=300):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, quote(str(key), safe=''))
+
+    def get(self, key, default=None):
+        filename = self._file(key)
+        try:
+            if self.ttl and os.stat(filename).st_mtime + self.ttl < time.time():
+                os.remove(filename)
+                raise FileNotFoundError(filename)
+            with open(filename, encoding='utf-8') as f:
+                value = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        # Se escribe en un temporal y se renombra para que nadie lea un fichero a medias
+        fd, temporary = tempfile.mkstemp(dir=self.path, prefix='.tmp-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(value)
+        os.replace(temporary, self._file(key))
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._prune()
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.path) if not entry.name.startswith('.')]
+
+    def _prune(self):
+        entries = self._entries()
+        if len(entries) <= self.max_size:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_size]:
+            self._remove(entry.path)
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+    def delete(self, key):
+        self._remove(self._file(key))
+
+    def delete_prefix(self, prefix):
+        prefix = quote(str(prefix), safe='')
+        for entry in self._entries():
+            if entry.name.startswith(prefix):
+                self._remove(entry.path)
+
+    def clear(self):
+        for entry in self._entries():
+            self._remove(entry.path)
+
+    def stats(self):
+        return {'size': len(self._entries()), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, insert, or_, select, union_all, update
+from . import db
+from .models import User
+from .station_models import Station, Sensor, Intervention, StationHistory, intervention_sensor
+from .summary import refresh_summaries
+from .changelog import log_sync_changes
+
+# Tipo de intervención de las calibraciones (el de los formularios de intervenciones)
+CALIBRATION_TYPE = 'calibracion'
+
+
+def calibration_settings(window_days=None):
+    """(intervalos por tipo, intervalo por defecto, plazo) en días, de la configuración."""
+    config = current_app.config
+    if window_days is None:
+        window_days = config['CALIBRATION_WINDOW_DAYS']
+    return config['CALIBRATION_INTERVALS'], config['CALIBRATION_DEFAULT_INTERVAL'], window_days
+
+
+def _due(column, horizon, days):
+    # Vence antes de horizon si la última calibración es anterior a horizon - intervalo
+    return or_(column.is_(None), column <= horizon - timedelta(days=days))
+
+
+def _other_types(column, known):
+    # Los tipos sin intervalo propio como rangos entre los conocidos: a diferencia
+    # de NOT IN, cada rango puede recorrerse con el índice
+    known = sorted(known)
+    if not known:
+        return [column.isnot(None)]
+    ranges = [column < known[0], column > known[-1]]
+    ranges += [and_(column > low, column < high) for low, high in zip(known, known[1:])]
+    return ranges
+
+
+def due_sensors_query(intervals, default_interval, window_days, now=None):
+    """Sensores con la calibración vencida o que vence en window_days días.
+
+    Es una sola consulta: un UNION ALL con una rama por tipo (o rango de tipos
+    sin intervalo propio), cada una resuelta con ix_sensor_calibration. Con un
+    OR en un único SELECT SQLite prefiere recorrer todos los sensores.
+    Los sensores que ya tienen una calibración programada pendiente no se incluyen.
+    """
+    horizon = (now or datetime.utcnow()) + timedelta(days=window_days)
+    branches = [
+        select(Sensor.id).where(Sensor.sensor_type == sensor_type, _due(Sensor.last_calibration, horizon, days))
+        for sensor_type, days in intervals.items()
+    ]
+    branches += [
+        select(Sensor.id).where(types, _due(Sensor.last_calibration, horizon, default_interval))
+        for types in _other_types(Sensor.sensor_type, intervals)
+    ]
+    due = union_all(*branches).subquery()
+    scheduled = select(intervention_sensor.c.sensor_id).join(
+        Intervention, Intervention.id == intervention_sensor.c.intervention_id
+    ).where(Intervention.technician_name.is_(None))
+    return select(
+        Sensor.id, Sensor.station_id, Sensor.sensor_type, Sensor.model, Sensor.serial_number,
+        Sensor.last_calibration, Station.name.label('station_name')
+    ).join(due, due.c.id == Sensor.id).join(Station, Station.id == Sensor.station_id).where(
+        Station.deleted_at.is_(None),
+        Sensor.id.notin_(scheduled)
+    )
+
+
+def due_date(sensor, intervals, default_interval):
+    """Fecha en que vence la calibración; None si el sensor no se ha calibrado nunca."""
+    if sensor.last_calibration is None:
+        return None
+    return sensor.last_calibration + timedelta(days=intervals.get(sensor.sensor_type, default_interval))
+
+
+def find_due_calibrations(window_days=None, now=None):
+    """Calibraciones pendientes agrupadas por estación, con una sola consulta.
+
+    Devuelve una lista de (station_id, nombre, [(sensor, vencimiento)]).
+    """
+    intervals, default_interval, window_days = calibration_settings(window_days)
+    # Sin ORDER BY en la consulta (obligaría a recorrer los sensores por estación)
+    sensors = sorted(
+        db.session.execute(due_sensors_query(intervals, default_interval, window_days, now)),
+        key=lambda sensor: (sensor.station_id, sensor.id)
+    )
+    plans = {}
+    for sensor in sensors:
+        plan = plans.setdefault(sensor.station_id, (sensor.station_id, sensor.station_name, []))
+        plan[2].append((sensor, due_date(sensor, intervals, default_interval)))
+    return list(plans.values())
+
+
+def _sensor_line(sensor, due):
+    label = ' '.join(part for part in [sensor.sensor_type, sensor.model, sensor.serial_number and f'({sensor.serial_number})'] if part)
+    return f'- {label}: ' + (f'vence el {due:%d/%m/%Y}' if due else 'sin calibraciones registradas')
+
+
+def schedule_calibrations(plans, user_id):
+    """Crea una intervención de calibración pendiente por estación (sin confirmar).
+
+    Las intervenciones se insertan en una sola sentencia al hacer flush; los
+    sensores asociados y el historial, con un INSERT por lotes cada uno.
+    Devuelve las intervenciones creadas.
+    """
+    if not plans:
+        return []
+    now = datetime.utcnow()
+    interventions = [Intervention(
+        station_id=station_id,
+        intervention_type=CALIBRATION_TYPE,
+        title=f'Calibración de {len(sensors)} sensor(es)',
+        description='\n'.join(_sensor_line(sensor, due) for sensor, due in sensors),
+        intervention_date=None,
+        technician_name=None,
+        performed_by=user_id,
+        created_at=now
+    ) for station_id, _, sensors in plans]
+    db.session.add_all(interventions)
+    db.session.flush()
+
+    db.session.execute(insert(intervention_sensor), [
+        {'intervention_id': intervention.id, 'sensor_id': sensor.id}
+        for intervention, (_, _, sensors) in zip(interventions, plans) for sensor, _ in sensors
+    ])
+    db.session.execute(insert(StationHistory), [{
+        'station_id': intervention.station_id,
+        'action': 'intervention_scheduled',
+        'description': f'Intervención programada: {intervention.title}',
+        'changed_by': user_id,
+        'created_at': now,
+    } for intervention in interventions])
+    refresh_summaries({intervention.station_id for intervention in interventions})
+    return interventions
+
+
+def mark_calibrated(intervention_ids, when):
+    """Actualiza last_calibration de los sensores de las intervenciones indicadas (sin confirmar)."""
+    rows = db.session.execute(
+        update(Sensor)
+        .where(Sensor.id.in_(
+            select(intervention_sensor.c.sensor_id).where(intervention_sensor.c.intervention_id.in_(intervention_ids))
+        ))
+        .values(last_calibration=when, updated_at=when)
+        .returning(Sensor.id, Sensor.station_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    log_sync_changes(db.session.connection(), 'sensor', [tuple(row) for row in rows])
+
+
+calibration_cli = AppGroup('calibration', help='Programación de las calibraciones de sensores.')
+
+
+@calibration_cli.command('schedule')
+@click.option('--window', 'window_days', type=int, help='Días de antelación (por defecto CALIBRATION_WINDOW_DAYS)')
+@click.option('--user', 'username', help='Usuario que programa las intervenciones (por defecto, el primer admin)')
+@click.option('--dry-run', is_flag=True, help='Sólo mostrar las calibraciones pendientes, sin programarlas')
+def schedule_command(window_days, username, dry_run):
+    """Programa una intervención de calibración por estación con sensores pendientes."""
+    plans = find_due_calibrations(window_days)
+    for station_id, station_name, sensors in plans:
+        click.echo(f'{station_name} (estación {station_id}): {len(sensors)} sensor(es)')
+        for sensor, due in sensors:
+            click.echo(f'  {_sensor_line(sensor, due)}')
+    total = sum(len(sensors) for _, _, sensors in plans)
+    if dry_run:
+        click.echo(f'{total} sensor(es) en {len(plans)} estación(es) (no se ha programado nada)')
+        return
+
+    if username:
+        user = User.query.filter_by(username=username).first()
+    else:
+        user = User.query.filter_by(is_admin=True).order_by(User.id).first()
+    if user is None:
+        raise click.ClickException('No se encontró el usuario al que atribuir las intervenciones')
+    interventions = schedule_calibrations(plans, user.id)
+    db.session.commit()
+    click.echo(f'{len(interventions)} intervención(es) de calibración programadas para {total} sensor(es)')
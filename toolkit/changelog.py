@@ -0,0 +1,295 @@
+from datetime import date, datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, false, func, insert, literal, select
+from sqlalchemy.orm import Session
+from . import db
+from .station_models import (
+    Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, SyncChange, SyncPrune
+)
+
+# Registros que se sincronizan, por su nombre en la API. Las estaciones van primero:
+# los clientes aplican los cambios en este orden
+SYNC_MODELS = {
+    'station': Station,
+    'sensor': Sensor,
+    'router': Router,
+    'technical_detail': TechnicalDetail,
+    'breakdown': Breakdown,
+    'intervention': Intervention,
+}
+
+# Columnas que no se envían a los clientes (las estaciones eliminadas llegan como borrado)
+HIDDEN_COLUMNS = {'station': {'deleted_at'}}
+
+# Ids por sentencia al registrar o leer cambios
+CHANGE_CHUNK = 500
+
+# Cambios por página de la sincronización
+CHANGES_PER_PAGE = 1000
+
+
+def _entity_of(record):
+    for entity, model in SYNC_MODELS.items():
+        if type(record) is model:
+            return entity
+    return None
+
+
+def _station_of(entity, record):
+    return record.id if entity == 'station' else record.station_id
+
+
+# Registro de cambios
+
+def log_sync_changes(connection, entity, records, deleted=False):
+    """Registra el cambio (o el borrado) de registros dados como (record_id, station_id).
+
+    La fila anterior de cada registro se sustituye por una con un seq nuevo.
+    """
+    records = list(dict(records).items())
+    if not records:
+        return
+    now = datetime.utcnow()
+    if connection.dialect.name == 'sqlite':
+        # REPLACE borra la fila en conflicto (entity, record_id) e inserta otra con un seq nuevo
+        statement = insert(SyncChange.__table__).prefix_with('OR REPLACE')
+    else:
+        # ON CONFLICT toma el seq de la secuencia: un DELETE seguido de INSERT fallaría por
+        # la restricción única si otra transacción registra a la vez el mismo registro
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        statement = dialect_insert(SyncChange.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['entity', 'record_id'],
+            set_={
+                'seq': func.nextval(func.pg_get_serial_sequence(SyncChange.__tablename__, 'seq')),
+                **{column: statement.excluded[column] for column in ('station_id', 'deleted', 'changed_at')},
+            }
+        )
+    for start in range(0, len(records), CHANGE_CHUNK):
+        chunk = records[start:start + CHANGE_CHUNK]
+        connection.execute(statement, [
+            {'entity': entity, 'record_id': record_id, 'station_id': station_id,
+             'deleted': deleted, 'changed_at': now}
+            for record_id, station_id in chunk
+        ])
+
+
+def log_station_removed(connection, station_ids):
+    """Registra el borrado (lógico o definitivo) de estaciones.
+
+    La marca de la estación implica la de todos sus registros: los cambios
+    pendientes de éstos se descartan.
+    """
+    station_ids = list(station_ids)
+    if not station_ids:
+        return
+    connection.execute(delete(SyncChange.__table__).where(
+        SyncChange.station_id.in_(station_ids), SyncChange.entity != 'station'
+    ))
+    log_sync_changes(connection, 'station', [(station_id, station_id) for station_id in station_ids], deleted=True)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_change_log(session, flush_context):
+    """Registra los cambios hechos a través de la sesión en la misma transacción."""
+    changed, removed, removed_stations = {}, {}, []
+
+    for record in session.deleted:
+        entity = _entity_of(record)
+        if entity == 'station':
+            removed_stations.append(record.id)
+        elif entity:
+            removed.setdefault(entity, []).append((record.id, record.station_id))
+
+    for record in list(session.new) + list(session.dirty):
+        entity = _entity_of(record)
+        if not entity or (record not in session.new and not session.is_modified(record, include_collections=False)):
+            continue
+        if entity == 'station' and record.deleted_at is not None:
+            removed_stations.append(record.id)
+        else:
+            changed.setdefault(entity, []).append((record.id, _station_of(entity, record)))
+
+    if not (changed or removed or removed_stations):
+        return
+    connection = session.connection()
+    for entity, records in changed.items():
+        log_sync_changes(connection, entity, records)
+    for entity, records in removed.items():
+        log_sync_changes(connection, entity, records, deleted=True)
+    log_station_removed(connection, removed_stations)
+
+
+def rebuild_change_log():
+    """Registra de nuevo todos los registros existentes, conservando las marcas de borrado.
+
+    Los cursores de los clientes siguen siendo válidos: reciben otra vez todos los
+    registros (con seq nuevos). Devuelve los registros registrados.
+    """
+    db.session.execute(delete(SyncChange).where(SyncChange.deleted.is_(False)))
+    now = datetime.utcnow()
+    total = 0
+    for entity, model in SYNC_MODELS.items():
+        rows = select(
+            literal(entity), model.id, model.id if entity == 'station' else model.station_id,
+            false(), func.coalesce(model.updated_at, now)
+        ).select_from(model)
+        if entity != 'station':
+            rows = rows.join(Station, Station.id == model.station_id)
+        rows = rows.where(Station.deleted_at.is_(None)).order_by(model.id)
+        total += db.session.execute(insert(SyncChange).from_select(
+            ['entity', 'record_id', 'station_id', 'deleted', 'changed_at'], rows
+        )).rowcount
+    db.session.commit()
+    return total
+
+
+def prune_tombstones(days):
+    """Elimina las marcas de borrado anteriores a days días. Devuelve las eliminadas.
+
+    Los clientes con un cursor anterior a la última marca eliminada tienen que
+    volver a sincronizar desde cero (changes_since lo indica con reset).
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    through = db.session.scalar(
+        select(func.max(SyncChange.seq)).where(SyncChange.deleted.is_(True), SyncChange.changed_at < cutoff)
+    )
+    if through is None:
+        return 0
+    pruned = db.session.execute(
+        delete(SyncChange).where(SyncChange.deleted.is_(True), SyncChange.seq <= through)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.add(SyncPrune(pruned_through=through, tombstones=pruned))
+    db.session.commit()
+    return pruned
+
+
+# Lectura de cambios
+
+def current_seq():
+    return db.session.scalar(select(func.max(SyncChange.seq))) or 0
+
+
+def min_cursor():
+    """Cursor más antiguo con el que se pueden pedir cambios (0 si no se han eliminado marcas)."""
+    return db.session.scalar(select(func.max(SyncPrune.pruned_through))) or 0
+
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def record_to_dict(entity, record):
+    hidden = HIDDEN_COLUMNS.get(entity, ())
+    return {
+        column.key: _value(getattr(record, column.key))
+        for column in SYNC_MODELS[entity].__table__.columns if column.key not in hidden
+    }
+
+
+def load_records(entity, record_ids):
+    """{id: datos} de los registros existentes (las estaciones eliminadas no cuentan).
+
+    Se leen sólo las columnas que se envían, sin crear objetos del ORM, y una
+    página de cambios lee cada tipo de registro en una sola consulta.
+    """
+    model = SYNC_MODELS[entity]
+    hidden = HIDDEN_COLUMNS.get(entity, ())
+    columns = [column for column in model.__table__.columns if column.key not in hidden]
+    record_ids = list(record_ids)
+    records = {}
+    for start in range(0, len(record_ids), CHANGES_PER_PAGE):
+        query = select(*columns).where(model.id.in_(record_ids[start:start + CHANGES_PER_PAGE]))
+        if entity == 'station':
+            query = query.where(Station.deleted_at.is_(None))
+        for row in db.session.execute(query):
+            records[row.id] = {key: _value(value) for key, value in row._mapping.items()}
+    return records
+
+
+def record_seqs(entity, record_ids):
+    """{id: seq} del último cambio registrado de cada registro."""
+    record_ids = list(record_ids)
+    seqs = {}
+    for start in range(0, len(record_ids), CHANGE_CHUNK):
+        seqs.update(db.session.execute(
+            select(SyncChange.record_id, SyncChange.seq)
+            .where(SyncChange.entity == entity, SyncChange.record_id.in_(record_ids[start:start + CHANGE_CHUNK]))
+        ).all())
+    return seqs
+
+
+def changes_since(cursor, limit=CHANGES_PER_PAGE):
+    """Cambios posteriores al cursor, en orden de seq.
+
+    Devuelve (cambios, cursor siguiente, hay_más, reset). Cada cambio es
+    (seq, entity, record_id, datos), con datos None si el registro se ha
+    borrado. Con reset el cursor era demasiado antiguo: los cambios son los de
+    una sincronización desde cero y el cliente debe descartar sus datos.
+    """
+    reset = 0 < cursor < min_cursor()
+    if reset:
+        cursor = 0
+    rows = db.session.execute(
+        select(SyncChange.seq, SyncChange.entity, SyncChange.record_id, SyncChange.deleted)
+        .where(SyncChange.seq > cursor).order_by(SyncChange.seq).limit(limit + 1)
+    ).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = rows[-1].seq if rows else cursor
+    if rows and db.session.get_bind().dialect.name != 'sqlite':
+        # Los seq se asignan al escribir y se ven al confirmar: fuera de SQLite un seq
+        # menor puede confirmarse después. El cursor no pasa de los cambios de los
+        # últimos SYNC_SETTLE_SECONDS, que el cliente recibe (y aplica) otra vez
+        cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['SYNC_SETTLE_SECONDS'])
+        settled = db.session.scalar(
+            select(SyncChange.seq).where(SyncChange.changed_at < cutoff).order_by(SyncChange.seq.desc()).limit(1)
+        ) or 0
+        next_cursor = max(cursor, min(next_cursor, settled))
+
+    live = {}
+    for row in rows:
+        if not row.deleted and row.entity in SYNC_MODELS:
+            live.setdefault(row.entity, []).append(row.record_id)
+    records = {entity: load_records(entity, record_ids) for entity, record_ids in live.items()}
+
+    changes = []
+    for row in rows:
+        # Un registro que ya no existe (o cuya estación se ha eliminado) se envía como borrado
+        record = None if row.deleted else records.get(row.entity, {}).get(row.record_id)
+        changes.append((row.seq, row.entity, row.record_id, record))
+    return changes, next_cursor, more, reset
+
+
+sync_cli = AppGroup('sync', help='Registro de cambios de la sincronización de clientes sin conexión.')
+
+
+@sync_cli.command('rebuild')
+def rebuild_command():
+    """Vuelve a registrar todos los registros (los clientes los reciben de nuevo)."""
+    click.echo(f'{rebuild_change_log()} registros registrados')
+
+
+@sync_cli.command('prune')
+@click.option('--days', type=int, default=None, help='Días (por defecto SYNC_TOMBSTONE_DAYS)')
+def prune_command(days):
+    """Elimina las marcas de borrado antiguas."""
+    days = days if days is not None else current_app.config['SYNC_TOMBSTONE_DAYS']
+    click.echo(f'{prune_tombstones(days)} marcas de borrado eliminadas (anteriores a {days} días)')
+
+
+@sync_cli.command('stats')
+def stats_command():
+    """Muestra el tamaño del registro de cambios."""
+    for entity, live, tombstones in db.session.execute(
+        select(SyncChange.entity, func.count().filter(SyncChange.deleted.is_(False)),
+               func.count().filter(SyncChange.deleted.is_(True)))
+        .group_by(SyncChange.entity).order_by(SyncChange.entity)
+    ):
+        click.echo(f'{entity}: {live} registros, {tombstones} marcas de borrado')
+    click.echo(f'Último seq: {current_seq()}; cursor mínimo: {min_cursor()}')
@@ -0,0 +1,34 @@
+from sqlalchemy import event
+from . import db
+
+
+def init_engine(app):
+    """Aplica el perfil de conexión de la configuración al motor de la base de datos.
+
+    En SQLite ejecuta SQLITE_PRAGMAS en cada conexión nueva del pool (los PRAGMA
+    como synchronous o busy_timeout son por conexión). El resto de opciones del
+    pool llegan a través de SQLALCHEMY_ENGINE_OPTIONS.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+    if engine.url.database in (None, '', ':memory:'):
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+    # Cada app tiene su propio motor y aún no ha abierto conexiones
+    event.listen(engine, 'connect', set_pragmas)
+
+
+def sqlite_settings(connection, names=('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size')):
+    """Valores actuales de los PRAGMA de una conexión SQLite."""
+    return {name: connection.exec_driver_sql(f'PRAGMA {name}').scalar() for name in names}
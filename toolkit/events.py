@@ -0,0 +1,56 @@
+from flask import Blueprint, current_app, request, jsonify, Response
+from flask_login import login_required
+from . import db
+from .feed import change_broadcaster
+
+events = Blueprint('events', __name__)
+
+
+def _last_event_id():
+    # EventSource envía la cabecera al reconectar; la primera conexión puede usar ?last_event_id=
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if value is None or value == '':
+        return None
+    last_event_id = int(value)
+    if last_event_id < 0:
+        raise ValueError(value)
+    return last_event_id
+
+
+# Cambios de las estaciones en tiempo real (Server-Sent Events): ?station=<id>&island=<isla>
+@events.route('/stations')
+@login_required
+def station_changes():
+    try:
+        last_event_id = _last_event_id()
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID no válido'}), 400
+    station_ids = request.args.getlist('station', type=int)
+    islands = [island for island in request.args.getlist('island') if island]
+
+    broadcaster = change_broadcaster()
+    if len(broadcaster) >= current_app.config['FEED_MAX_SUBSCRIBERS']:
+        return jsonify({'error': 'Demasiados clientes conectados'}), 503
+    subscription, reset = broadcaster.subscribe(station_ids, islands, last_event_id)
+    # La respuesta se envía fuera del contexto de la aplicación: sin conexión a la base de datos
+    db.session.remove()
+    keepalive = current_app.config['FEED_KEEPALIVE_SECONDS']
+    retry = current_app.config['FEED_RETRY_MS']
+
+    def stream():
+        try:
+            yield f'retry: {retry}\n\n'
+            if reset:
+                # Faltan eventos desde Last-Event-ID: el cliente debe recargar el estado completo
+                yield 'event: reset\ndata: {}\n\n'
+            while not subscription.overflowed:
+                change = subscription.get(keepalive)
+                # Los comentarios mantienen abierta la conexión y detectan los clientes desconectados
+                yield change.message if change is not None else ': keepalive\n\n'
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: sin buffer en el proxy
+    })
@@ -0,0 +1,136 @@
+import csv
+import heapq
+import io
+import json
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from . import db
+from .models import User
+from .station_models import StationHistory, Breakdown, Intervention
+from .history import iter_archived_rows
+
+# Filas que se leen del cursor en cada lote
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _history_query(station_id):
+    user = aliased(User)
+    return select(
+        StationHistory.id,
+        StationHistory.created_at,
+        StationHistory.action,
+        StationHistory.field_changed,
+        StationHistory.old_value,
+        StationHistory.new_value,
+        StationHistory.description,
+        user.username.label('changed_by')
+    ).outerjoin(user, user.id == StationHistory.changed_by).where(
+        StationHistory.station_id == station_id
+    ).order_by(StationHistory.created_at, StationHistory.id)
+
+
+def _breakdowns_query(station_id):
+    reporter = aliased(User)
+    resolver = aliased(User)
+    return select(
+        Breakdown.id,
+        Breakdown.reported_date,
+        Breakdown.title,
+        Breakdown.description,
+        Breakdown.severity,
+        Breakdown.resolved,
+        Breakdown.resolved_date,
+        Breakdown.resolution_notes,
+        reporter.username.label('reported_by'),
+        resolver.username.label('resolved_by')
+    ).outerjoin(reporter, reporter.id == Breakdown.reported_by).outerjoin(
+        resolver, resolver.id == Breakdown.resolved_by
+    ).where(
+        Breakdown.station_id == station_id
+    ).order_by(Breakdown.reported_date, Breakdown.id)
+
+
+def _interventions_query(station_id):
+    user = aliased(User)
+    return select(
+        Intervention.id,
+        Intervention.created_at,
+        Intervention.intervention_type,
+        Intervention.title,
+        Intervention.description,
+        Intervention.intervention_date,
+        Intervention.technician_name,
+        user.username.label('performed_by')
+    ).outerjoin(user, user.id == Intervention.performed_by).where(
+        Intervention.station_id == station_id
+    ).order_by(Intervention.created_at, Intervention.id)
+
+
+EXPORT_QUERIES = {
+    'history': _history_query,
+    'breakdowns': _breakdowns_query,
+    'interventions': _interventions_query,
+}
+
+
+def _archived_history_rows(station_id):
+    # Mismas columnas que _history_query; el usuario se busca una vez por id
+    usernames = {}
+    for record in iter_archived_rows(station_id):
+        user_id = record['changed_by']
+        if user_id not in usernames:
+            user = db.session.get(User, user_id) if user_id else None
+            usernames[user_id] = user.username if user else None
+        yield (record['id'], record['created_at'], record['action'], record['field_changed'],
+               record['old_value'], record['new_value'], record['description'], usernames[user_id])
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_rows(kind, station_id, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """Genera la exportación en trozos de texto, leyendo del cursor por lotes.
+
+    La memoria usada depende del tamaño del lote, no del tamaño del historial.
+    El historial archivado se mezcla en orden con los registros recientes.
+    """
+    statement = EXPORT_QUERIES[kind](station_id).execution_options(yield_per=batch_size)
+    result = db.session.execute(statement)
+    columns = list(result.keys())
+    rows = result
+    if kind == 'history':
+        rows = heapq.merge(_archived_history_rows(station_id), result, key=lambda row: (row[1], row[0]))
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+
+    for batch in _batches(rows, batch_size):
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([[_plain(value) for value in row] for row in batch])
+            yield buffer.getvalue()
+        else:
+            yield ''.join(
+                json.dumps({column: _plain(value) for column, value in zip(columns, row)}, ensure_ascii=False) + '\n'
+                for row in batch
+            )
@@ -0,0 +1,273 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from . import db
+from .station_models import Station, StationHistory
+
+
+class ChangeEvent:
+    """Cambio del historial ya preparado como mensaje SSE (se serializa una vez para todos)."""
+
+    __slots__ = ('id', 'station_id', 'island', 'created_at', 'message')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.station_id = row.station_id
+        self.island = row.island
+        self.created_at = row.created_at
+        data = {
+            'station_id': row.station_id,
+            'island': row.island,
+            'action': row.action,
+            'field': row.field_changed,
+            'old': row.old_value,
+            'new': row.new_value,
+            'at': row.created_at.isoformat(),
+        }
+        payload = json.dumps({key: value for key, value in data.items() if value is not None}, ensure_ascii=False)
+        self.message = f'id: {row.id}\nevent: change\ndata: {payload}\n\n'
+
+
+def load_events(after_id, limit):
+    """Cambios del historial posteriores a after_id, en orden de id."""
+    query = select(
+        StationHistory.id, StationHistory.station_id, StationHistory.action, StationHistory.field_changed,
+        StationHistory.old_value, StationHistory.new_value, StationHistory.created_at, Station.island
+    ).join(Station, Station.id == StationHistory.station_id).where(StationHistory.id > after_id)
+    return [ChangeEvent(row) for row in db.session.execute(query.order_by(StationHistory.id).limit(limit))]
+
+
+def settled_id(last_id, settle_seconds):
+    """Id desde el que releer el historial para no perder los cambios confirmados tarde.
+
+    Los ids se asignan al insertar pero se ven al confirmar: en PostgreSQL una
+    transacción puede confirmar un id menor que otro ya leído. Se relee lo creado
+    en los settle_seconds anteriores a last_id (en SQLite, 0: se confirma en orden de id).
+    """
+    if not settle_seconds:
+        return last_id
+    created_at = db.session.scalar(select(StationHistory.created_at).where(StationHistory.id == last_id))
+    if created_at is None:
+        return last_id
+    return db.session.scalar(select(func.max(StationHistory.id)).where(
+        StationHistory.id <= last_id, StationHistory.created_at < created_at - timedelta(seconds=settle_seconds)
+    )) or 0
+
+
+class Subscription:
+    """Cola de eventos de un cliente con sus filtros (estaciones e islas)."""
+
+    def __init__(self, station_ids=None, islands=None, size=1000):
+        self.station_ids = set(station_ids or ())
+        self.islands = set(islands or ())
+        self.queue = queue.Queue(size)
+        # El cliente no lee a tiempo: se cierra su conexión y vuelve con Last-Event-ID
+        self.overflowed = False
+
+    def matches(self, change):
+        return ((not self.station_ids or change.station_id in self.station_ids)
+                and (not self.islands or change.island in self.islands))
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Siguiente evento, o None si no llega ninguno en timeout segundos."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ChangeBroadcaster:
+    """Difunde los cambios del historial a los clientes conectados al proceso.
+
+    Un solo hilo lee los registros nuevos del historial (por id) y los reparte a
+    las colas de los suscriptores, sea cual sea su número. El hilo se despierta al
+    confirmar una transacción del proceso y, para los cambios de otros procesos,
+    cada FEED_POLL_SECONDS; termina cuando no quedan suscriptores. Los últimos
+    FEED_BACKLOG eventos se guardan, en el orden en que se repartieron, para
+    reanudar sin consultar la base de datos.
+
+    En SQLite el orden de id es el de confirmación y la difusión es exacta. En otras
+    bases de datos se releen los ids de los últimos FEED_SETTLE_SECONDS (sin repetir
+    los ya repartidos): sólo se pierden los cambios de transacciones que tardan más
+    en confirmarse, y al reanudar desde la base de datos pueden repetirse eventos.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._subscribers = set()
+        self._backlog = deque()
+        self._backlog_ids = set()
+        self._floor = None  # ids ya repartidos y asentados; None mientras no hay suscriptores
+        self._recent = {}  # ids repartidos por encima de _floor, con su fecha de creación
+        self._covered_from = None  # el backlog tiene todos los eventos repartidos después de este id
+        self._thread = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _settle_seconds(self):
+        return 0 if db.engine.dialect.name == 'sqlite' else self.app.config['FEED_SETTLE_SECONDS']
+
+    def _covers(self, last_event_id):
+        return last_event_id in self._backlog_ids or (
+            self._covered_from is not None and last_event_id == self._covered_from)
+
+    def _replay_backlog(self, subscription, last_event_id, sent=()):
+        # Los eventos repartidos después de last_event_id (no necesariamente con id mayor)
+        found = last_event_id not in self._backlog_ids
+        for change in self._backlog:
+            if found and change.id not in sent and subscription.matches(change):
+                subscription.put(change)
+            found = found or change.id == last_event_id
+
+    def subscribe(self, station_ids=None, islands=None, last_event_id=None):
+        """Registra un suscriptor. Devuelve (suscripción, reset).
+
+        Con last_event_id se envían antes los eventos posteriores, del backlog o de
+        la base de datos. reset indica que faltan eventos (hay más de los que se
+        reenvían): el cliente debe recargar el estado completo.
+        """
+        config = self.app.config
+        settle = self._settle_seconds()
+        subscription = Subscription(station_ids, islands, config['FEED_QUEUE_SIZE'])
+        reset = False
+        sent = set()
+        with self._lock:
+            resumable = last_event_id is not None and self._covers(last_event_id)
+        if last_event_id is not None and not resumable:
+            # Se filtra aquí y no en la consulta: el último id leído marca hasta dónde se ha reenviado
+            replay = load_events(settled_id(last_event_id, settle), config['FEED_BACKLOG'])
+            reset = len(replay) >= config['FEED_BACKLOG']
+            for change in replay:
+                if subscription.matches(change):
+                    subscription.put(change)
+            sent = {change.id for change in replay}
+            if replay:
+                last_event_id = replay[-1].id
+
+        with self._lock:
+            if self._floor is None:
+                # Sin suscriptores no se lee el historial: se empieza por el último
+                # registro reenviado o, si faltan eventos, por el último que existe
+                if last_event_id is None or reset:
+                    start = db.session.scalar(select(func.max(StationHistory.id))) or 0
+                else:
+                    start = last_event_id
+                self._floor = settled_id(start, settle)
+                # Los registros entre _floor y start ya existen: sólo se releen por si
+                # aparecen otros confirmados tarde
+                self._recent = dict(db.session.execute(select(StationHistory.id, StationHistory.created_at).where(
+                    StationHistory.id > self._floor, StationHistory.id <= start
+                )).all())
+                self._covered_from = start
+                self._backlog.clear()
+                self._backlog_ids.clear()
+            if last_event_id is not None:
+                if self._covers(last_event_id):
+                    self._replay_backlog(subscription, last_event_id, sent)
+                else:
+                    reset = True
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+                self._thread.start()
+        return subscription, reset
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+        self.wake()
+
+    def _publish(self, changes):
+        with self._lock:
+            for change in changes:
+                if change.id <= self._floor or change.id in self._recent:
+                    continue
+                if len(self._backlog) >= self.app.config['FEED_BACKLOG']:
+                    self._covered_from = self._backlog.popleft().id
+                    self._backlog_ids.discard(self._covered_from)
+                self._backlog.append(change)
+                self._backlog_ids.add(change.id)
+                for subscription in self._subscribers:
+                    if subscription.matches(change):
+                        subscription.put(change)
+                self._recent[change.id] = change.created_at
+            overflowed = [subscription for subscription in self._subscribers if subscription.overflowed]
+            self._subscribers.difference_update(overflowed)
+
+    def _settle(self, settle_seconds):
+        # Los ids creados hace más de settle_seconds ya no se releen
+        cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+        with self._lock:
+            settled = [change_id for change_id, created_at in self._recent.items() if created_at <= cutoff]
+            if settled:
+                self._floor = max(self._floor, *settled)
+                self._recent = {change_id: created_at for change_id, created_at in self._recent.items()
+                                if change_id > self._floor}
+
+    def _poll(self):
+        with self.app.app_context():
+            try:
+                cursor = self._floor
+                while True:
+                    changes = load_events(cursor, self.app.config['FEED_BACKLOG'])
+                    self._publish(changes)
+                    if len(changes) < self.app.config['FEED_BACKLOG']:
+                        break
+                    cursor = changes[-1].id
+                self._settle(self._settle_seconds())
+            except Exception:
+                self.app.logger.exception('Error al leer los cambios del historial')
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.app.config['FEED_POLL_SECONDS'])
+            self._wakeup.clear()
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._floor = self._covered_from = None
+                    self._recent = {}
+                    self._backlog.clear()
+                    self._backlog_ids.clear()
+                    return
+            self._poll()
+            # Las confirmaciones seguidas se agrupan en una sola lectura
+            time.sleep(self.app.config['FEED_BATCH_SECONDS'])
+
+
+def change_broadcaster(app=None):
+    """Difusor de cambios de la aplicación (uno por app y proceso)."""
+    app = app or current_app._get_current_object()
+    broadcaster = app.extensions.get('change_feed')
+    if broadcaster is None:
+        broadcaster = app.extensions.setdefault('change_feed', ChangeBroadcaster(app))
+    return broadcaster
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_broadcaster(session):
+    # Sólo si hay un difusor en marcha en este proceso
+    if has_app_context():
+        broadcaster = current_app.extensions.get('change_feed')
+        if broadcaster is not None and len(broadcaster):
+            broadcaster.wake()
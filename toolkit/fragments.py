@@ -0,0 +1,60 @@
+import os
+from flask_login import current_user
+from markupsafe import Markup
+from .cache import LRUCache, FileCache
+
+# Caché de fragmentos HTML de las páginas de estación; None si está desactivada
+fragment_cache = None
+
+
+def init_fragment_cache(app):
+    global fragment_cache
+    backend = app.config.get('FRAGMENT_CACHE')
+    size = app.config.get('FRAGMENT_CACHE_SIZE', 2048)
+    ttl = app.config.get('FRAGMENT_CACHE_TTL', 3600)
+    if backend == 'local':
+        fragment_cache = LRUCache(size, ttl)
+    elif backend == 'file':
+        path = app.config.get('FRAGMENT_CACHE_PATH') or os.path.join(app.instance_path, 'fragments')
+        fragment_cache = FileCache(path, size, ttl)
+    else:
+        fragment_cache = None
+    app.add_template_global(cached_fragment)
+
+
+def _station_prefix(station_id):
+    return f'station:{station_id}:'
+
+
+def fragment_key(name, station):
+    """Clave de un fragmento de la estación.
+
+    Incluye la versión del resumen (log_change la incrementa en cada cambio), la
+    fecha de creación (por si se reutiliza el id de una estación borrada) y la
+    variante del usuario, porque los administradores ven botones adicionales.
+    """
+    variant = 'admin' if current_user.is_admin else 'user'
+    created = int(station.created_at.timestamp()) if station.created_at else 0
+    return f'{_station_prefix(station.id)}{created}:{station.summary.version}:{name}:{variant}'
+
+
+def cached_fragment(name, station, caller):
+    """Bloque de plantilla cacheado: {% call cached_fragment('nombre', station) %}...{% endcall %}.
+
+    El contenido del bloque sólo se renderiza (y sus consultas sólo se ejecutan)
+    cuando el fragmento no está en la caché.
+    """
+    if fragment_cache is None or station.summary is None or station.summary.version is None:
+        return caller()
+    key = fragment_key(name, station)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = str(caller())
+        fragment_cache.set(key, html)
+    return Markup(html)
+
+
+def invalidate_station(station_id):
+    """Elimina todos los fragmentos de la estación (al borrarla)."""
+    if fragment_cache is not None:
+        fragment_cache.delete_prefix(_station_prefix(station_id))
@@ -0,0 +1,335 @@
+import math
+import re
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, column, event, inspect, select, table, text, update
+from sqlalchemy.orm import Session
+from . import db
+from .station_models import Station
+
+# Radio medio de la Tierra (esfera de igual volumen)
+EARTH_RADIUS_KM = 6371.0088
+
+# Radio inicial de la búsqueda de las estaciones más cercanas; se multiplica por
+# NEAREST_GROWTH hasta que el círculo contiene k estaciones
+NEAREST_START_KM = 5.0
+NEAREST_GROWTH = 4
+
+MAX_NEAREST = 100
+MAX_RADIUS_KM = 1000.0
+
+BACKFILL_BATCH_SIZE = 1000
+
+# Índice espacial R*Tree (SQLite): una caja de un punto por estación
+_rtree = table('station_rtree', column('id'), column('min_lat'), column('max_lat'), column('min_lon'), column('max_lon'))
+
+_rtree_support = {}
+
+_SEPARATOR = re.compile(r'\s*[,;]\s*|\s+')
+_HEMISPHERE = re.compile(r'^(\d+(?:\.\d+)?)([NSEOW])$', re.IGNORECASE)
+
+# Grados y minutos, con segundos opcionales: 28°27'49"N 16°15'07"W, 28° 27.8' N, 16° 15.1' W
+_DMS_PART = (r'(?P<{0}sign>-)?(?P<{0}deg>\d+)\s*°\s*(?P<{0}min>\d+(?:\.\d+)?)\s*[\'′’]\s*'
+             r'(?:(?P<{0}sec>\d+(?:\.\d+)?)\s*(?:"|″|”|\'\')\s*)?(?P<{0}hem>[NSEOW])?')
+_DMS = re.compile(r'^' + _DMS_PART.format('lat_') + r'\s*[,;]?\s*' + _DMS_PART.format('lon_') + r'$', re.IGNORECASE)
+
+
+def _coordinate(value, negative):
+    match = _HEMISPHERE.match(value)
+    if match:
+        number, hemisphere = float(match.group(1)), match.group(2).upper()
+        return -number if hemisphere in negative else number
+    return float(value)
+
+
+def _dms_coordinate(match, prefix, positive, negative):
+    minutes, seconds = float(match[prefix + 'min']), float(match[prefix + 'sec'] or 0)
+    hemisphere = (match[prefix + 'hem'] or '').upper()
+    if minutes >= 60 or seconds >= 60 or (hemisphere and hemisphere not in positive + negative):
+        raise ValueError(prefix)
+    number = int(match[prefix + 'deg']) + minutes / 60 + seconds / 3600
+    if match[prefix + 'sign'] or (hemisphere and hemisphere in negative):
+        return -number
+    return number
+
+
+def parse_coordinates(value):
+    """Convierte el texto de las coordenadas en (latitud, longitud) en grados decimales.
+
+    Admite 'lat, lon', 'lat; lon', 'lat lon', los sufijos N/S/E/O(W) y grados con
+    minutos (y segundos): 28°27'49"N 16°15'07"W.
+    Devuelve None si el texto está vacío; lanza ValueError si no es válido.
+    """
+    if value is None or not value.strip():
+        return None
+    match = _DMS.match(value.strip())
+    if match:
+        try:
+            latitude = _dms_coordinate(match, 'lat_', 'N', 'S')
+            longitude = _dms_coordinate(match, 'lon_', 'E', 'OW')
+        except ValueError:
+            raise ValueError(f'Coordenadas no válidas: {value!r} (formato: latitud, longitud)') from None
+        return _check_range(latitude, longitude)
+    # '28,4636 -16,2518': comas decimales con las coordenadas separadas por espacios
+    text_value = value.strip()
+    if text_value.count(',') == 2 and ' ' in text_value and ';' not in text_value:
+        text_value = text_value.replace(',', '.')
+    text_value = re.sub(r'(\d)\s+([NSEOW])\b', r'\1\2', text_value.replace('°', ''), flags=re.IGNORECASE)
+    parts = [part for part in _SEPARATOR.split(text_value) if part]
+    if len(parts) != 2:
+        raise ValueError(f'Coordenadas no válidas: {value!r} (formato: latitud, longitud)')
+    try:
+        latitude = _coordinate(parts[0], 'S')
+        longitude = _coordinate(parts[1], 'OW')
+    except ValueError:
+        raise ValueError(f'Coordenadas no válidas: {value!r} (formato: latitud, longitud)') from None
+    return _check_range(latitude, longitude)
+
+
+def _check_range(latitude, longitude):
+    if not -90 <= latitude <= 90:
+        raise ValueError(f'Latitud fuera de rango: {latitude} (entre -90 y 90)')
+    if not -180 <= longitude <= 180:
+        raise ValueError(f'Longitud fuera de rango: {longitude} (entre -180 y 180)')
+    return latitude, longitude
+
+
+def location_fields(coordinates):
+    """Valores de latitude y longitude para el texto de las coordenadas (ValueError si no es válido)."""
+    location = parse_coordinates(coordinates)
+    latitude, longitude = location if location else (None, None)
+    return {'latitude': latitude, 'longitude': longitude}
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Distancia de círculo máximo (haversine) en kilómetros."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_boxes(latitude, longitude, radius_km):
+    """Cajas (min_lat, max_lat, min_lon, max_lon) que contienen el círculo.
+
+    Son dos si el círculo cruza el antimeridiano. Si contiene un polo, la caja
+    abarca todas las longitudes.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angle)
+    min_lat, max_lat = latitude - delta_lat, latitude + delta_lat
+    if min_lat <= -90 or max_lat >= 90 or angle >= math.pi / 2:
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+    # Mayor diferencia de longitud de los puntos del círculo
+    delta_lon = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+    min_lon, max_lon = longitude - delta_lon, longitude + delta_lon
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+
+# Índice espacial
+
+def rtree_available(connection):
+    """¿La base de datos es SQLite compilado con R*Tree?"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    url = str(connection.engine.url)
+    if url not in _rtree_support:
+        options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+        _rtree_support[url] = 'ENABLE_RTREE' in options
+    return _rtree_support[url]
+
+
+def create_spatial_index(connection):
+    if rtree_available(connection):
+        connection.exec_driver_sql(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS station_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)'
+        )
+
+
+def index_locations(connection, locations):
+    """Indexa (o reindexa) estaciones dadas como (station_id, latitud, longitud).
+
+    Las estaciones sin coordenadas (latitud None) se quitan del índice. Sin
+    R*Tree no hay nada que hacer: las consultas usan ix_station_lat_lon.
+    """
+    if not locations or not rtree_available(connection):
+        return
+    remove_locations(connection, [station_id for station_id, latitude, _ in locations if latitude is None])
+    rows = [
+        {'id': station_id, 'min_lat': latitude, 'max_lat': latitude, 'min_lon': longitude, 'max_lon': longitude}
+        for station_id, latitude, longitude in locations if latitude is not None
+    ]
+    if rows:
+        connection.execute(text(
+            'INSERT OR REPLACE INTO station_rtree (id, min_lat, max_lat, min_lon, max_lon) '
+            'VALUES (:id, :min_lat, :max_lat, :min_lon, :max_lon)'
+        ), rows)
+
+
+def remove_locations(connection, station_ids):
+    """Quita estaciones del índice espacial con una sola sentencia."""
+    station_ids = list(station_ids)
+    if station_ids and rtree_available(connection):
+        connection.execute(
+            text('DELETE FROM station_rtree WHERE id IN :ids').bindparams(bindparam('ids', expanding=True)),
+            {'ids': station_ids}
+        )
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_spatial_index(session, flush_context):
+    """Mantiene el índice espacial al día en la misma transacción que los cambios."""
+    removed = [record.id for record in session.deleted if isinstance(record, Station)]
+    changed = []
+    for record in list(session.new) + list(session.dirty):
+        if not isinstance(record, Station):
+            continue
+        if record in session.new:
+            moved = record.latitude is not None
+        else:
+            state = inspect(record)
+            moved = state.attrs.latitude.history.has_changes() or state.attrs.longitude.history.has_changes()
+        if moved:
+            changed.append((record.id, record.latitude, record.longitude))
+    if removed or changed:
+        connection = session.connection()
+        remove_locations(connection, removed)
+        index_locations(connection, changed)
+
+
+def backfill_locations():
+    """Rellena latitude y longitude a partir del texto de las coordenadas, por lotes.
+
+    Devuelve las estaciones con coordenadas no válidas como (id, nombre, coordenadas);
+    se quedan sin posición.
+    """
+    invalid = []
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(Station.id, Station.name, Station.coordinates, Station.latitude, Station.longitude)
+            .where(Station.id > last_id).order_by(Station.id).limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        updates = []
+        for row in batch:
+            try:
+                fields = location_fields(row.coordinates)
+            except ValueError:
+                invalid.append((row.id, row.name, row.coordinates))
+                fields = {'latitude': None, 'longitude': None}
+            if (fields['latitude'], fields['longitude']) != (row.latitude, row.longitude):
+                updates.append(dict(fields, station_id=row.id))
+        if updates:
+            # UPDATE sin pasar por la sesión (no cambia updated_at): el índice se reconstruye después
+            db.session.connection().execute(
+                update(Station.__table__).where(Station.__table__.c.id == bindparam('station_id'))
+                .values(latitude=bindparam('latitude'), longitude=bindparam('longitude')),
+                updates
+            )
+        last_id = batch[-1].id
+    return invalid
+
+
+def rebuild_spatial_index():
+    """Vacía y vuelve a llenar el índice espacial. Devuelve las estaciones indexadas."""
+    connection = db.session.connection()
+    if not rtree_available(connection):
+        return db.session.scalar(select(db.func.count()).where(Station.latitude.isnot(None)))
+    connection.exec_driver_sql('DROP TABLE IF EXISTS station_rtree')
+    create_spatial_index(connection)
+    total = 0
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(Station.id, Station.latitude, Station.longitude)
+            .where(Station.id > last_id, Station.latitude.isnot(None))
+            .order_by(Station.id).limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        index_locations(connection, [tuple(row) for row in batch])
+        last_id = batch[-1].id
+        total += len(batch)
+    return total
+
+
+# Consultas
+
+def candidates_query(box, exclude=None):
+    """Estaciones no eliminadas dentro de la caja, resueltas con el índice espacial."""
+    min_lat, max_lat, min_lon, max_lon = box
+    query = select(
+        Station.id, Station.name, Station.island, Station.municipality, Station.status,
+        Station.latitude, Station.longitude
+    ).where(Station.deleted_at.is_(None))
+    if rtree_available(db.session.connection()):
+        query = query.where(Station.id.in_(select(_rtree.c.id).where(
+            _rtree.c.max_lat >= min_lat, _rtree.c.min_lat <= max_lat,
+            _rtree.c.max_lon >= min_lon, _rtree.c.min_lon <= max_lon
+        )))
+    else:
+        query = query.where(Station.latitude.between(min_lat, max_lat), Station.longitude.between(min_lon, max_lon))
+    if exclude is not None:
+        query = query.where(Station.id != exclude)
+    return query
+
+
+def _candidates(boxes, exclude=None):
+    rows = []
+    for box in boxes:
+        rows += db.session.execute(candidates_query(box, exclude)).all()
+    return rows
+
+
+def _by_distance(rows, latitude, longitude):
+    return sorted(
+        ((distance_km(latitude, longitude, row.latitude, row.longitude), row) for row in rows),
+        key=lambda item: (item[0], item[1].id)
+    )
+
+
+def stations_within(latitude, longitude, radius_km, limit=None, exclude=None):
+    """Estaciones a menos de radius_km km, de la más cercana a la más lejana.
+
+    Devuelve una lista de (distancia_km, fila); la caja que contiene el círculo
+    se resuelve con el índice y la distancia exacta se calcula en Python.
+    """
+    results = [
+        (distance, row) for distance, row in _by_distance(
+            _candidates(bounding_boxes(latitude, longitude, radius_km), exclude), latitude, longitude
+        ) if distance <= radius_km
+    ]
+    return results[:limit] if limit is not None else results
+
+
+def nearest_stations(latitude, longitude, k, exclude=None):
+    """Las k estaciones más cercanas como lista de (distancia_km, fila).
+
+    Se busca en círculos cada vez mayores hasta que uno contiene k estaciones
+    (o abarca toda la Tierra).
+    """
+    radius = NEAREST_START_KM
+    while True:
+        results = stations_within(latitude, longitude, radius, exclude=exclude)
+        if len(results) >= k or radius >= math.pi * EARTH_RADIUS_KM:
+            return results[:k]
+        radius *= NEAREST_GROWTH
+
+
+geo_cli = AppGroup('geo', help='Posición de las estaciones e índice espacial.')
+
+
+@geo_cli.command('rebuild')
+def rebuild_command():
+    """Vuelve a leer las coordenadas de todas las estaciones y reconstruye el índice espacial."""
+    invalid = backfill_locations()
+    total = rebuild_spatial_index()
+    db.session.commit()
+    for station_id, name, coordinates in invalid:
+        click.echo(f'  {name} (estación {station_id}): coordenadas no válidas {coordinates!r}')
+    click.echo(f'{total} estación(es) con posición; {len(invalid)} con coordenadas no válidas')
@@ -0,0 +1,323 @@
+import gzip
+import heapq
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, func, insert, select
+from sqlalchemy.orm import Session
+from . import db
+from .cache import LRUCache
+from .models import User
+from .station_models import StationHistory, HistorySegment
+
+# Registros pendientes de escribir en session.info (se insertan al confirmar)
+HISTORY_BUFFER_KEY = 'history_buffer'
+
+# Registros por segmento archivado
+SEGMENT_ROWS = 5000
+
+# Columnas que se guardan en los segmentos
+ARCHIVE_FIELDS = ['id', 'station_id', 'action', 'field_changed', 'old_value', 'new_value',
+                  'description', 'changed_by', 'created_at']
+
+# Segmentos ya descomprimidos (son inmutables: no caducan)
+_segments = LRUCache(64, ttl=0)
+
+
+# Buffer de escritura
+
+def buffer_change(session, **values):
+    """Añade un registro de historial al buffer de la sesión.
+
+    Los registros se insertan con un único INSERT justo antes de confirmar la
+    transacción y se descartan si se deshace.
+    """
+    session.info.setdefault(HISTORY_BUFFER_KEY, []).append(values)
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_history_buffer(session):
+    rows = session.info.pop(HISTORY_BUFFER_KEY, None)
+    if rows:
+        session.execute(insert(StationHistory), rows)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_history_buffer(session, previous_transaction):
+    session.info.pop(HISTORY_BUFFER_KEY, None)
+
+
+# Segmentos
+
+def archive_root():
+    return current_app.config.get('HISTORY_ARCHIVE_PATH') or os.path.join(current_app.instance_path, 'history')
+
+
+def _segment_path(segment):
+    return os.path.join(archive_root(), segment.path)
+
+
+def _encode(row):
+    record = {field: getattr(row, field) for field in ARCHIVE_FIELDS}
+    record['created_at'] = record['created_at'].isoformat()
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def _write_segment(relative_path, rows):
+    """Escribe el segmento de forma atómica: fichero temporal, fsync y rename."""
+    path = os.path.join(archive_root(), relative_path)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as stream:
+            for row in rows:
+                stream.write(_encode(row).encode('utf-8'))
+        with open(temp_path, 'rb') as written:
+            os.fsync(written.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _iter_segment(segment):
+    """Registros del segmento en orden ascendente, leídos línea a línea."""
+    with gzip.open(_segment_path(segment), 'rt', encoding='utf-8') as stream:
+        for line in stream:
+            record = json.loads(line)
+            record['created_at'] = datetime.fromisoformat(record['created_at'])
+            yield record
+
+
+def read_segment(segment):
+    """Registros del segmento en orden ascendente (con caché). No deben modificarse."""
+    records = _segments.get(segment.path)
+    if records is None:
+        records = list(_iter_segment(segment))
+        _segments.set(segment.path, records)
+    return records
+
+
+class ArchivedHistory:
+    """Registro de historial leído de un segmento; se usa igual que StationHistory."""
+    archived = True
+
+    def __init__(self, record):
+        self.__dict__.update(record)
+        self.user = None
+
+
+def history_key(record):
+    return record.created_at, record.id
+
+
+def _record_key(record):
+    return record['created_at'], record['id']
+
+
+def station_segments(station_id):
+    return HistorySegment.query.filter(
+        HistorySegment.station_id == station_id
+    ).order_by(HistorySegment.last_created_at.desc(), HistorySegment.sequence.desc()).all()
+
+
+def archived_records(station_id, position=None, limit=None):
+    """Registros archivados de la estación (ArchivedHistory), de más reciente a más antiguo.
+
+    position es (fecha, id) del último registro visto. Los segmentos se leen de
+    más reciente a más antiguo y se deja de leer cuando los que quedan no pueden
+    contener registros de la página.
+    """
+    records = []
+    for segment in station_segments(station_id):
+        if position is not None and segment.first_created_at > position[0]:
+            continue
+        if limit is not None and len(records) >= limit:
+            records.sort(key=_record_key, reverse=True)
+            del records[limit:]
+            if segment.last_created_at < records[-1]['created_at']:
+                break
+        records.extend(
+            record for record in read_segment(segment)
+            if position is None or _record_key(record) < position
+        )
+    records.sort(key=_record_key, reverse=True)
+    if limit is not None:
+        records = records[:limit]
+    return [ArchivedHistory(record) for record in records]
+
+
+def load_users(records):
+    """Asigna el usuario a los registros archivados con una sola consulta."""
+    archived = [record for record in records if record.archived]
+    user_ids = {record.changed_by for record in archived if record.changed_by}
+    if not user_ids:
+        return
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+    for record in archived:
+        record.user = users.get(record.changed_by)
+
+
+def merge_history(hot, archived, limit):
+    """Mezcla registros recientes y archivados (ambos de más reciente a más antiguo)."""
+    records = []
+    for record in heapq.merge(hot, archived, key=history_key, reverse=True):
+        if len(records) == limit:
+            break
+        records.append(record)
+    return records
+
+
+def iter_archived_rows(station_id):
+    """Registros archivados de la estación en orden ascendente, en streaming.
+
+    Devuelve diccionarios con las columnas de ARCHIVE_FIELDS.
+    """
+    segments = HistorySegment.query.filter(HistorySegment.station_id == station_id).all()
+    return heapq.merge(*[_iter_segment(segment) for segment in segments], key=_record_key)
+
+
+# Archivado y retención
+
+def archive_station(station_id, cutoff, segment_rows=SEGMENT_ROWS):
+    """Pasa a segmentos los registros de la estación anteriores a cutoff.
+
+    Cada segmento se escribe y se confirma por separado. Devuelve los registros archivados.
+    """
+    archived = 0
+    while True:
+        rows = db.session.execute(
+            select(StationHistory)
+            .where(StationHistory.station_id == station_id, StationHistory.created_at < cutoff)
+            .order_by(StationHistory.created_at, StationHistory.id)
+            .limit(segment_rows)
+        ).scalars().all()
+        if not rows:
+            return archived
+
+        sequence = (db.session.scalar(
+            select(func.max(HistorySegment.sequence)).where(HistorySegment.station_id == station_id)
+        ) or 0) + 1
+        relative_path = os.path.join(str(station_id), f'{sequence:06d}-{uuid.uuid4().hex[:8]}.jsonl.gz')
+        _write_segment(relative_path, rows)
+        try:
+            db.session.add(HistorySegment(
+                station_id=station_id,
+                sequence=sequence,
+                path=relative_path,
+                rows=len(rows),
+                first_created_at=rows[0].created_at,
+                last_created_at=rows[-1].created_at
+            ))
+            db.session.execute(
+                delete(StationHistory).where(StationHistory.id.in_([row.id for row in rows]))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            os.remove(os.path.join(archive_root(), relative_path))
+            raise
+        db.session.expunge_all()
+        archived += len(rows)
+
+
+def archive_history(older_than_days, segment_rows=SEGMENT_ROWS, progress=None):
+    """Archiva el historial anterior a older_than_days días de todas las estaciones.
+
+    progress(station_id, registros) se llama después de cada estación.
+    Devuelve el total de registros archivados.
+    """
+    from . import summary
+    from .station_queries import deleted_station_ids
+
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    station_ids = db.session.scalars(
+        select(StationHistory.station_id).distinct()
+        .where(StationHistory.created_at < cutoff, StationHistory.station_id.notin_(deleted_station_ids()))
+        .order_by(StationHistory.station_id)
+    ).all()
+    total = 0
+    for station_id in station_ids:
+        archived = archive_station(station_id, cutoff, segment_rows)
+        # El historial reciente de la ficha está en caché
+        summary.bump(station_id)
+        db.session.commit()
+        total += archived
+        if progress:
+            progress(station_id, archived)
+    return total
+
+
+def apply_retention(days):
+    """Elimina los segmentos cuyos registros son todos anteriores a days días.
+
+    Devuelve el número de segmentos eliminados.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    paths = list(db.session.scalars(
+        delete(HistorySegment).where(HistorySegment.last_created_at < cutoff)
+        .returning(HistorySegment.path)
+        .execution_options(synchronize_session=False)
+    ))
+    db.session.commit()
+    # Los ficheros se borran cuando la base de datos ya no los referencia
+    for path in paths:
+        _segments.delete(path)
+        try:
+            os.remove(os.path.join(archive_root(), path))
+        except FileNotFoundError:
+            pass
+    return len(paths)
+
+
+def remove_station_archive(station_id):
+    """Borra los ficheros archivados de una estación eliminada."""
+    shutil.rmtree(os.path.join(archive_root(), str(station_id)), ignore_errors=True)
+
+
+history_cli = AppGroup('history', help='Archivado del historial de las estaciones.')
+
+
+@history_cli.command('archive')
+@click.option('--older-than', type=int, default=None, help='Días (por defecto HISTORY_ARCHIVE_AFTER_DAYS)')
+@click.option('--segment-rows', default=SEGMENT_ROWS, show_default=True, help='Registros por segmento')
+def archive_command(older_than, segment_rows):
+    """Archiva el historial antiguo y aplica la retención configurada."""
+    older_than = older_than if older_than is not None else current_app.config['HISTORY_ARCHIVE_AFTER_DAYS']
+    retention = current_app.config.get('HISTORY_RETENTION_DAYS')
+    if retention is not None and retention < older_than:
+        raise click.UsageError('HISTORY_RETENTION_DAYS no puede ser menor que la antigüedad de archivado')
+
+    total = archive_history(older_than, segment_rows, progress=lambda station_id, archived: click.echo(
+        f'  estación {station_id}: {archived} registros'
+    ))
+    click.echo(f'{total} registros archivados (anteriores a {older_than} días)')
+    if retention is not None:
+        click.echo(f'{apply_retention(retention)} segmentos eliminados (anteriores a {retention} días)')
+
+
+@history_cli.command('stats')
+def stats_command():
+    """Muestra el tamaño del historial reciente y del archivado."""
+    hot_rows = db.session.scalar(select(func.count()).select_from(StationHistory))
+    segments, archived_rows, oldest = db.session.execute(select(
+        func.count(HistorySegment.id), func.coalesce(func.sum(HistorySegment.rows), 0),
+        func.min(HistorySegment.first_created_at)
+    )).one()
+    size = 0
+    for directory, _, files in os.walk(archive_root()):
+        size += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+    click.echo(f'Historial reciente: {hot_rows} registros')
+    click.echo(f'Historial archivado: {archived_rows} registros en {segments} segmentos '
+               f'({size / 1024 / 1024:.1f} MB en {archive_root()})')
+    if oldest:
+        click.echo(f'Registro archivado más antiguo: {oldest:%Y-%m-%d}')
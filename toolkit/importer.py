@@ -0,0 +1,333 @@
+import csv
+import io
+import ipaddress
+import json
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert
+from . import db
+from .models import User
+from .station_models import Station, Sensor, Router, TechnicalDetail, StationHistory, SENSOR_STATUSES
+from .summary import refresh_summaries
+from .search_index import index_documents
+from .geo import location_fields, index_locations
+from .changelog import log_sync_changes
+
+# Filas por sentencia INSERT
+IMPORT_BATCH_SIZE = 500
+
+# Campos de cada tipo de registro: (obligatorios, opcionales)
+RECORD_FIELDS = {
+    'station': (
+        ['name', 'island', 'municipality', 'location'],
+        ['coordinates', 'contact', 'how_to_get', 'required_vehicle', 'measurement_type', 'status'],
+    ),
+    'sensor': (
+        ['station', 'sensor_type'],
+        ['model', 'serial_number', 'status', 'installation_date', 'last_calibration'],
+    ),
+    'router': (
+        ['station', 'model'],
+        ['ip_address', 'mac_address', 'serial_number', 'firmware_version', 'status'],
+    ),
+    'detail': (
+        ['station', 'detail_type', 'key', 'value'],
+        [],
+    ),
+}
+
+# Valores permitidos en los campos de tipo lista
+CHOICES = {
+    ('station', 'status'): ['activa', 'inactiva', 'mantenimiento', 'averiada'],
+    ('station', 'required_vehicle'): ['normal', '4x4'],
+    ('sensor', 'status'): SENSOR_STATUSES,
+    ('router', 'status'): ['online', 'offline', 'mantenimiento'],
+}
+
+DEFAULTS = {
+    'station': {'status': 'activa'},
+    'sensor': {'status': 'operativo'},
+    'router': {'status': 'online'},
+    'detail': {},
+}
+
+DATE_FIELDS = {'installation_date', 'last_calibration'}
+
+
+class ImportResult:
+    """Resultado de una importación: errores por fila y registros creados por tipo."""
+
+    def __init__(self):
+        self.errors = []  # (línea, mensaje)
+        self.created = {kind: 0 for kind in RECORD_FIELDS}
+        self.stations_touched = 0
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+def parse_import(content, filename):
+    """Lee un fichero CSV o JSON y devuelve una lista de (línea, registro).
+
+    CSV: una fila por registro con la columna 'type' (station, sensor, router, detail).
+    JSON: una lista de objetos con 'type', o un objeto {"stations": [...], "sensors": [...], ...}.
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    if filename.lower().endswith('.json'):
+        data = json.loads(content)
+        if isinstance(data, dict):
+            data = [
+                dict(record, type=kind)
+                for kind in RECORD_FIELDS
+                for record in data.get(f'{kind}s', [])
+            ]
+        return [(number, record) for number, record in enumerate(data, start=1)]
+
+    reader = csv.DictReader(io.StringIO(content))
+    # La línea 1 es la cabecera
+    return [(number, record) for number, record in enumerate(reader, start=2)]
+
+
+def _clean(record):
+    return {
+        key.strip(): value.strip() if isinstance(value, str) else value
+        for key, value in record.items() if key
+    }
+
+
+def validate_import(rows, result):
+    """Valida todas las filas antes de escribir nada.
+
+    Devuelve {tipo: [(línea, valores)]} con los valores ya convertidos.
+    """
+    plan = {kind: [] for kind in RECORD_FIELDS}
+    station_names = set()
+    router_stations = set()
+
+    for line, record in rows:
+        if not isinstance(record, dict):
+            result.error(line, 'El registro no es un objeto')
+            continue
+        record = _clean(record)
+        kind = record.get('type')
+        if kind not in RECORD_FIELDS:
+            result.error(line, f'Tipo de registro desconocido: {kind!r}')
+            continue
+
+        required, optional = RECORD_FIELDS[kind]
+        values = dict(DEFAULTS[kind])
+        for field in required + optional:
+            if record.get(field) not in (None, ''):
+                values[field] = record[field]
+
+        missing = [field for field in required if field not in values]
+        if missing:
+            result.error(line, f'Faltan campos obligatorios: {", ".join(missing)}')
+            continue
+
+        valid = True
+        for field, value in values.items():
+            choices = CHOICES.get((kind, field))
+            if choices and value not in choices:
+                result.error(line, f'Valor no válido para {field}: {value!r} (permitidos: {", ".join(choices)})')
+                valid = False
+            if field in DATE_FIELDS:
+                try:
+                    values[field] = datetime.strptime(value, '%Y-%m-%d')
+                except (TypeError, ValueError):
+                    result.error(line, f'Fecha no válida en {field}: {value!r} (formato AAAA-MM-DD)')
+                    valid = False
+        if kind == 'router' and values.get('ip_address'):
+            try:
+                ipaddress.ip_address(values['ip_address'])
+            except ValueError:
+                result.error(line, f'Dirección IP no válida: {values["ip_address"]!r}')
+                valid = False
+
+        if kind == 'station' and values.get('coordinates'):
+            try:
+                values.update(location_fields(values['coordinates']))
+            except ValueError as e:
+                result.error(line, str(e))
+                valid = False
+
+        if kind == 'station':
+            if values['name'] in station_names:
+                result.error(line, f'Estación repetida en el fichero: {values["name"]}')
+                valid = False
+            station_names.add(values['name'])
+        if kind == 'router':
+            if values['station'] in router_stations:
+                result.error(line, f'Más de un router para la estación {values["station"]}')
+                valid = False
+            router_stations.add(values['station'])
+
+        if valid:
+            plan[kind].append((line, values))
+
+    # Comprobaciones contra la base de datos, con una consulta por tipo
+    referenced = {values['station'] for kind in ('sensor', 'router', 'detail') for _, values in plan[kind]}
+    existing = _station_ids(station_names | referenced)
+
+    for line, values in plan['station']:
+        if values['name'] in existing:
+            result.error(line, f'Ya existe una estación con el nombre {values["name"]}')
+
+    for kind in ('sensor', 'router', 'detail'):
+        for line, values in plan[kind]:
+            if values['station'] not in existing and values['station'] not in station_names:
+                result.error(line, f'Estación desconocida: {values["station"]}')
+
+    existing_routers = {
+        station_id for (station_id,) in db.session.query(Router.station_id).filter(
+            Router.station_id.in_([existing[name] for name in router_stations if name in existing])
+        )
+    } if router_stations else set()
+    for line, values in plan['router']:
+        if existing.get(values['station']) in existing_routers:
+            result.error(line, f'La estación {values["station"]} ya tiene un router configurado')
+
+    return plan
+
+
+def _station_ids(names):
+    ids = {}
+    names = list(names)
+    for start in range(0, len(names), IMPORT_BATCH_SIZE):
+        chunk = names[start:start + IMPORT_BATCH_SIZE]
+        ids.update(db.session.query(Station.name, Station.id).filter(Station.name.in_(chunk)))
+    return ids
+
+
+def _bulk_insert(model, rows):
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + IMPORT_BATCH_SIZE])
+
+
+def apply_import(plan, user_id, result):
+    """Inserta todos los registros validados en una sola transacción."""
+    now = datetime.utcnow()
+
+    station_rows = [dict(values, created_by=user_id) for _, values in plan['station']]
+    _bulk_insert(Station, station_rows)
+
+    names = {values['station'] for kind in ('sensor', 'router', 'detail') for _, values in plan[kind]}
+    names |= {values['name'] for values in station_rows}
+    station_ids = _station_ids(names)
+
+    children = {'sensor': Sensor, 'router': Router, 'detail': TechnicalDetail}
+    counts = {}
+    for kind, model in children.items():
+        rows = []
+        for _, values in plan[kind]:
+            row = dict(values, station_id=station_ids[values['station']])
+            del row['station']
+            rows.append(row)
+            counts.setdefault(row['station_id'], {}).setdefault(kind, 0)
+            counts[row['station_id']][kind] += 1
+        _bulk_insert(model, rows)
+        result.created[kind] = len(rows)
+    result.created['station'] = len(station_rows)
+
+    # Una única entrada de historial por estación
+    labels = {'sensor': 'sensor(es)', 'router': 'router', 'detail': 'detalle(s) técnico(s)'}
+    new_station_ids = {station_ids[values['name']] for values in station_rows}
+    touched = new_station_ids | set(counts)
+    history_rows = []
+    for station_id in touched:
+        parts = [f'{count} {labels[kind]}' for kind, count in counts.get(station_id, {}).items()]
+        action = 'created' if station_id in new_station_ids else 'bulk_import'
+        prefix = 'Estación creada por importación' if station_id in new_station_ids else 'Importación masiva'
+        history_rows.append({
+            'station_id': station_id,
+            'action': action,
+            'description': f'{prefix}: {", ".join(parts)}' if parts else prefix,
+            'changed_by': user_id,
+            'created_at': now,
+        })
+    _bulk_insert(StationHistory, history_rows)
+    result.stations_touched = len(touched)
+
+    # Los INSERT masivos no pasan por la sesión: resúmenes, índices y registro de cambios a mano
+    refresh_summaries(touched)
+    connection = db.session.connection()
+    index_documents(connection, 'station', [(
+        station_ids[values['name']], station_ids[values['name']], values['name'],
+        '\n'.join(values.get(field) or '' for field in ('location', 'how_to_get'))
+    ) for values in station_rows])
+    detail_ids = db.session.query(
+        TechnicalDetail.id, TechnicalDetail.station_id, TechnicalDetail.key, TechnicalDetail.value
+    ).filter(TechnicalDetail.station_id.in_(touched), TechnicalDetail.created_at >= now).all() if counts else []
+    index_documents(connection, 'detail', [tuple(row) for row in detail_ids])
+    log_sync_changes(connection, 'station', [(station_id, station_id) for station_id in new_station_ids])
+    log_sync_changes(connection, 'technical_detail', [(row.id, row.station_id) for row in detail_ids])
+    for kind, model in (('sensor', Sensor), ('router', Router)):
+        if any(kind in station_counts for station_counts in counts.values()):
+            log_sync_changes(connection, kind, db.session.query(model.id, model.station_id).filter(
+                model.station_id.in_(touched), model.created_at >= now
+            ).all())
+    index_locations(connection, [
+        (station_ids[values['name']], values['latitude'], values['longitude'])
+        for values in station_rows if values.get('latitude') is not None
+    ])
+
+
+def import_records(content, filename, user_id, dry_run=False):
+    """Valida e importa un fichero. Si hay algún error no se escribe nada."""
+    result = ImportResult()
+    try:
+        rows = parse_import(content, filename)
+    except (ValueError, UnicodeDecodeError) as e:
+        result.error(0, f'No se pudo leer el fichero: {e}')
+        return result
+
+    plan = validate_import(rows, result)
+    if not result.ok or dry_run:
+        return result
+
+    try:
+        apply_import(plan, user_id, result)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+
+import_cli = AppGroup('fleet', help='Importación masiva de estaciones.')
+
+
+@import_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', help='Usuario al que se atribuyen los cambios (por defecto, el primer admin)')
+@click.option('--dry-run', is_flag=True, help='Sólo validar, sin escribir nada')
+def import_command(path, username, dry_run):
+    """Importa estaciones, sensores, routers y detalles técnicos desde CSV o JSON."""
+    if username:
+        user = User.query.filter_by(username=username).first()
+    else:
+        user = User.query.filter_by(is_admin=True).order_by(User.id).first()
+    if user is None:
+        raise click.ClickException('No se encontró el usuario para atribuir la importación')
+
+    with open(path, 'rb') as f:
+        result = import_records(f.read(), path, user.id, dry_run=dry_run)
+
+    for line, message in result.errors:
+        click.echo(f'Línea {line}: {message}')
+    if not result.ok:
+        raise SystemExit(1)
+    if dry_run:
+        click.echo('Fichero válido (no se ha importado nada)')
+    else:
+        click.echo(
+            f'Importados: {result.created["station"]} estaciones, {result.created["sensor"]} sensores, '
+            f'{result.created["router"]} routers, {result.created["detail"]} detalles técnicos'
+        )
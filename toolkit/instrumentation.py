@@ -0,0 +1,118 @@
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask.logging import default_handler
+from sqlalchemy import event
+from . import db
+
+logger = logging.getLogger('toolkit.sql')
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class RequestStats:
+    """Consultas SQL ejecutadas durante una petición."""
+    __slots__ = ('started', 'queries', 'sql_time', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = {}
+
+    def record(self, statement, duration):
+        self.queries += 1
+        self.sql_time += duration
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+
+    def repeated(self, threshold):
+        """Consultas con la misma forma ejecutadas más de threshold veces (posible N+1)."""
+        return {statement: count for statement, count in self.statements.items() if count > threshold}
+
+
+def init_instrumentation(app):
+    """Activa la instrumentación SQL si la configuración lo pide.
+
+    Si SQL_INSTRUMENTATION es False no se registra ningún evento, así que no
+    tiene coste alguno.
+    """
+    if not app.config.get('SQL_INSTRUMENTATION'):
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if not logger.handlers:
+        logger.addHandler(default_handler)
+    logger.setLevel(logging.INFO)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def _origin():
+    # Primer marco de la pila (desde el más reciente) que pertenece a la aplicación
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(PACKAGE_DIR) and not frame.filename.endswith('instrumentation.py'):
+            return f'{os.path.relpath(frame.filename, os.path.dirname(PACKAGE_DIR))}:{frame.lineno} en {frame.name}'
+    return '-'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+
+    if has_request_context() and 'sql_stats' in g:
+        g.sql_stats.record(_WHITESPACE.sub(' ', statement).strip(), duration)
+
+    threshold = current_app.config.get('SQL_SLOW_QUERY_MS') if has_app_context() else None
+    if threshold is not None and duration * 1000 >= threshold:
+        logger.warning(
+            'Consulta lenta (%.1f ms) desde %s: %s',
+            duration * 1000, _origin(), _WHITESPACE.sub(' ', statement).strip()
+        )
+
+
+def _start_request():
+    g.sql_stats = RequestStats()
+
+
+def _finish_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    sql_ms = stats.sql_time * 1000
+    response.headers.add(
+        'Server-Timing',
+        f'sql;dur={sql_ms:.1f};desc="{stats.queries} consultas", app;dur={total_ms:.1f}'
+    )
+
+    repeated = stats.repeated(current_app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 10))
+    for statement, count in repeated.items():
+        logger.warning('Posible N+1 en %s %s: %d ejecuciones de %s', request.method, request.path, count, statement)
+
+    logger.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'queries': stats.queries,
+        'sql_ms': round(sql_ms, 1),
+        'total_ms': round(total_ms, 1),
+        'n_plus_one': len(repeated),
+    }))
+    return response
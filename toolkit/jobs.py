@@ -0,0 +1,108 @@
+import json
+import os
+from flask import Blueprint, request, jsonify, url_for, send_file, abort
+from flask_login import login_required, current_user
+from . import db
+from .station_models import Job
+from .runner import JOB_TYPES, SUCCEEDED, FINISHED, enqueue, cancel_job, job_to_dict, job_path, wake_runner
+
+jobs = Blueprint('jobs', __name__)
+
+# Trabajos por página en el listado
+JOBS_PER_PAGE = 50
+
+
+def _job_or_404(job_id):
+    # Cada usuario ve sus trabajos; los administradores, todos
+    record = db.session.get(Job, job_id)
+    if record is None or not (current_user.is_admin or record.created_by == current_user.id):
+        abort(404)
+    return record
+
+
+def job_response(record, status=200):
+    """Estado del trabajo con las URL para consultarlo, descargar el resultado y cancelarlo."""
+    return jsonify(dict(
+        job_to_dict(record),
+        status_url=url_for('jobs.job_status', job_id=record.id),
+        result_url=url_for('jobs.job_result', job_id=record.id),
+        cancel_url=url_for('jobs.cancel', job_id=record.id),
+    )), status
+
+
+# Encolar un trabajo: {"kind": "...", "params": {...}}
+@jobs.route('/', methods=['POST'])
+@login_required
+def create():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('params', {}), dict):
+        return jsonify({'error': 'Se esperaba {"kind": "...", "params": {...}}'}), 400
+    job_type = JOB_TYPES.get(data.get('kind'))
+    if job_type is None:
+        return jsonify({'error': f'Tipo de trabajo desconocido: {data.get("kind")}'}), 400
+    if job_type.admin_only and not current_user.is_admin:
+        abort(403)
+    try:
+        record = enqueue(job_type.name, data.get('params') or {}, current_user.id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    wake_runner()
+    return job_response(record, 202)
+
+
+# Últimos trabajos (?status=pending|running|...)
+@jobs.route('/')
+@login_required
+def list_jobs():
+    wake_runner()
+    query = Job.query.order_by(Job.id.desc())
+    if not current_user.is_admin:
+        query = query.filter(Job.created_by == current_user.id)
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    return jsonify({
+        'jobs': [job_to_dict(record) for record in query.limit(JOBS_PER_PAGE)],
+        'kinds': sorted(
+            name for name, job_type in JOB_TYPES.items() if current_user.is_admin or not job_type.admin_only
+        ),
+    })
+
+
+# Estado y progreso
+@jobs.route('/<int:job_id>')
+@login_required
+def job_status(job_id):
+    # Los trabajos pendientes de un proceso anterior se reanudan al consultarlos
+    wake_runner()
+    return job_response(_job_or_404(job_id))
+
+
+# Resultado: el fichero generado (exportaciones) o el resultado en JSON
+@jobs.route('/<int:job_id>/result')
+@login_required
+def job_result(job_id):
+    record = _job_or_404(job_id)
+    if record.status != SUCCEEDED:
+        return jsonify({'error': f'El trabajo no ha terminado correctamente ({record.status})',
+                        'job': job_to_dict(record)}), 409
+    result = json.loads(record.result) if record.result else None
+    if isinstance(result, dict) and result.get('file'):
+        path = job_path(record.id, os.path.splitext(result['file'])[1].lstrip('.'))
+        if not os.path.exists(path):
+            return jsonify({'error': 'El fichero del resultado ya no existe'}), 410
+        return send_file(path, mimetype=result.get('mimetype'), as_attachment=True,
+                         download_name=result.get('filename') or result['file'])
+    return jsonify({'job': job_to_dict(record), 'result': result})
+
+
+# Cancelar: los pendientes se cancelan ya; los que se ejecutan, en su siguiente aviso de progreso
+@jobs.route('/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel(job_id):
+    record = _job_or_404(job_id)
+    if record.status in FINISHED:
+        return jsonify({'error': f'El trabajo ya ha terminado ({record.status})', 'job': job_to_dict(record)}), 409
+    cancel_job(record)
+    db.session.commit()
+    return job_response(record)
@@ -0,0 +1,266 @@
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect
+from sqlalchemy.schema import AddConstraint
+from . import db
+
+# Migraciones del esquema, aplicadas en orden de versión.
+# Cada migración debe poder ejecutarse sobre una base de datos recién creada
+# con db.create_all() (comprobando antes lo que ya existe).
+MIGRATIONS = []
+
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+
+def migration(version, description):
+    """Registra una función como migración de la versión indicada."""
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return decorator
+
+
+def current_version():
+    return db.session.query(db.func.max(SchemaVersion.version)).scalar() or 0
+
+
+def upgrade():
+    """Aplica las migraciones pendientes. Devuelve la lista de versiones aplicadas."""
+    applied = []
+    version = current_version()
+    for number, description, f in MIGRATIONS:
+        if number <= version:
+            continue
+        f()
+        db.session.add(SchemaVersion(version=number, description=description))
+        db.session.commit()
+        applied.append(number)
+    return applied
+
+
+def _create_indexes(*names):
+    """Crea, si todavía no existen, los índices indicados con la definición de los modelos.
+
+    Cada migración enumera sus propios índices: los que se declaran más tarde pueden
+    usar columnas que todavía no existen en ese punto de la actualización.
+    """
+    connection = db.session.connection()
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(bind=connection, checkfirst=True)
+
+
+def _add_column(model, name):
+    """Añade a una tabla existente una columna declarada en el modelo, si no existe."""
+    connection = db.session.connection()
+    table = model.__table__
+    if name in {column['name'] for column in inspect(connection).get_columns(table.name)}:
+        return
+    column = table.c[name]
+    ddl = f'ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(connection.dialect)}'
+    if column.server_default is not None:
+        ddl += f" DEFAULT '{column.server_default.arg}'"
+    if not column.nullable:
+        ddl += ' NOT NULL'
+    connection.exec_driver_sql(ddl)
+
+
+def _cascade_foreign_keys(*models):
+    """Recrea con ON DELETE CASCADE las claves foráneas hacia Station que no lo tengan."""
+    for model in models:
+        table = model.__table__
+        connection = db.session.connection()
+        station_keys = [
+            fk for fk in inspect(connection).get_foreign_keys(table.name) if fk['referred_table'] == 'Station'
+        ]
+        if all((fk['options'].get('ondelete') or '').upper() == 'CASCADE' for fk in station_keys):
+            continue
+        if connection.dialect.name == 'sqlite':
+            _rebuild_sqlite_table(table)
+            continue
+        for fk in station_keys:
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} DROP CONSTRAINT "{fk["name"]}"')
+        for constraint in table.foreign_key_constraints:
+            if constraint.referred_table.name == 'Station':
+                connection.execute(AddConstraint(constraint))
+
+
+def _rebuild_sqlite_table(table):
+    # SQLite no permite modificar una clave foránea: se copia la tabla a una nueva
+    # con el esquema del modelo. Se hace en una conexión aparte con las claves
+    # foráneas desactivadas (el PRAGMA no tiene efecto dentro de una transacción)
+    db.session.commit()
+    old = f'{table.name}_old'
+    with db.engine.connect() as connection:
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        connection.commit()
+        try:
+            with connection.begin():
+                # pysqlite no abre la transacción antes de las sentencias DDL: se abre a mano
+                connection.exec_driver_sql('BEGIN')
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {old}')
+                for index in inspect(connection).get_indexes(old):
+                    connection.exec_driver_sql(f'DROP INDEX {index["name"]}')
+                table.create(bind=connection)
+                columns = ', '.join(column.name for column in table.columns)
+                connection.exec_driver_sql(f'INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old}')
+                connection.exec_driver_sql(f'DROP TABLE {old}')
+        finally:
+            connection.exec_driver_sql('PRAGMA foreign_keys=ON')
+
+
+@migration(1, 'Índices compuestos y parciales de las consultas frecuentes')
+def _indexes():
+    _create_indexes(
+        'ix_station_island_municipality', 'ix_station_status',
+        'ix_sensor_station_id', 'ix_router_station_id', 'ix_technical_detail_station_id',
+        'ix_breakdown_station_reported', 'ix_breakdown_open',
+        'ix_intervention_station_created', 'ix_intervention_pending',
+        'ix_station_history_station_created',
+    )
+
+
+@migration(2, 'Resúmenes de estaciones para bases de datos existentes')
+def _summaries():
+    from .summary import rebuild_summaries
+    # Station.deleted_at no existe hasta la migración 7
+    rebuild_summaries(exclude_deleted=False)
+
+
+@migration(3, 'Índice de búsqueda de texto (FTS5 o índice invertido)')
+def _search_index():
+    from .search_index import rebuild_search_index
+    rebuild_search_index()
+
+
+@migration(4, 'Versión de cada estación para la caché de fragmentos')
+def _summary_version():
+    from .station_models import StationSummary
+    _add_column(StationSummary, 'version')
+
+
+@migration(5, 'Índices de la cola de trabajo de averías e intervenciones')
+def _triage_indexes():
+    _create_indexes('ix_breakdown_queue', 'ix_intervention_queue')
+
+
+@migration(6, 'Agregados diarios de los indicadores de fiabilidad')
+def _reliability_rollups():
+    from .reliability import rebuild_rollups
+    # Station.deleted_at no existe hasta la migración 7
+    rebuild_rollups(exclude_deleted=False)
+
+
+@migration(7, 'Borrado en cascada en la base de datos y borrado lógico de estaciones')
+def _station_cascades():
+    from .station_models import (
+        Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, StationHistory,
+        StationSummary, ReliabilityRollup
+    )
+    _add_column(Station, 'deleted_at')
+    _create_indexes('ix_station_deleted')
+    _cascade_foreign_keys(Sensor, Router, TechnicalDetail, Breakdown, Intervention, StationHistory,
+                          StationSummary, ReliabilityRollup)
+
+
+@migration(8, 'Índice de calibraciones pendientes de los sensores')
+def _calibration_index():
+    _create_indexes('ix_sensor_calibration')
+
+
+@migration(9, 'Posición numérica de las estaciones e índice espacial')
+def _station_locations():
+    from flask import current_app
+    from .station_models import Station
+    from .geo import backfill_locations, rebuild_spatial_index
+    _add_column(Station, 'latitude')
+    _add_column(Station, 'longitude')
+    _create_indexes('ix_station_lat_lon')
+    invalid = backfill_locations()
+    if invalid:
+        current_app.logger.warning(
+            '%d estación(es) con coordenadas no válidas se quedan sin posición '
+            "(se corrigen editándolas; 'flask geo rebuild' las lista)", len(invalid)
+        )
+    rebuild_spatial_index()
+
+
+@migration(10, 'Registro de cambios para la sincronización de clientes sin conexión')
+def _sync_change_log():
+    from .changelog import rebuild_change_log
+    rebuild_change_log()
+
+
+@migration(11, 'Estado de sensor en calibración sin tilde (el del formulario)')
+def _sensor_calibrating_status():
+    from sqlalchemy import update
+    from .station_models import Sensor, SENSOR_CALIBRATING
+    from .summary import rebuild_summaries
+    # La importación masiva aceptaba 'en_calibración', que el resumen no contaba
+    db.session.execute(update(Sensor).where(Sensor.status == 'en_calibración').values(status=SENSOR_CALIBRATING))
+    rebuild_summaries()
+
+
+@migration(12, 'Agregados de fiabilidad por tipo de intervención')
+def _intervention_type_rollups():
+    from .reliability import rebuild_rollups
+    # Los agregados por tipo buscaban los tipos con tilde y se quedaban a cero
+    rebuild_rollups()
+
+
+@migration(13, 'Índices en las claves foráneas hacia user')
+def _user_foreign_key_indexes():
+    # Sin ellos, borrar un usuario recorre el historial entero para comprobar que nadie lo referencia
+    _create_indexes('ix_user_created_by', 'ix_station_created_by', 'ix_breakdown_reported_by',
+                    'ix_breakdown_resolved_by', 'ix_intervention_performed_by', 'ix_station_history_changed_by')
+
+
+@migration(14, 'Posición de las estaciones con coordenadas en grados y minutos')
+def _station_dms_locations():
+    from .geo import backfill_locations, rebuild_spatial_index
+    # parse_coordinates no entendía 28°27'49"N 16°15'07"W: esas estaciones se quedaron sin posición
+    backfill_locations()
+    rebuild_spatial_index()
+
+
+schema_cli = AppGroup('schema', help='Versiones y migraciones del esquema de la base de datos.')
+
+
+@schema_cli.command('upgrade')
+def upgrade_command():
+    """Aplica las migraciones pendientes."""
+    applied = upgrade()
+    if applied:
+        click.echo(f'Migraciones aplicadas: {", ".join(str(v) for v in applied)}')
+    click.echo(f'Versión del esquema: {current_version()}')
+
+
+@schema_cli.command('version')
+def version_command():
+    """Muestra la versión actual del esquema."""
+    click.echo(f'Versión del esquema: {current_version()} (última disponible: {MIGRATIONS[-1][0]})')
+
+
+@schema_cli.command('explain')
+def explain_command():
+    """Comprueba con EXPLAIN que las consultas principales usan índices."""
+    from .query_plans import check_query_plans
+    failures = 0
+    for name, ok, plan in check_query_plans():
+        click.echo(f'[{"OK" if ok else "SCAN"}] {name}')
+        for line in plan:
+            click.echo(f'    {line}')
+        failures += not ok
+    if failures:
+        raise SystemExit(1)
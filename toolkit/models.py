@@ -1,11 +1,62 @@
+import os
 from . import db, login_manager
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from .cache import LRUCache, SharedLRUCache
+
+# Caché de identidad de usuarios (id, username, is_admin); None si está desactivada
+user_cache = None
+
+
+class CachedUser(UserMixin):
+    """Identidad del usuario guardada en caché; suficiente para current_user."""
+
+    def __init__(self, id, username, is_admin):
+        self.id = id
+        self.username = username
+        self.is_admin = is_admin
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+def init_user_cache(app):
+    global user_cache
+    backend = app.config.get('USER_CACHE')
+    size = app.config.get('USER_CACHE_SIZE', 1024)
+    ttl = app.config.get('USER_CACHE_TTL', 300)
+    if backend == 'local':
+        user_cache = LRUCache(size, ttl)
+    elif backend == 'shared':
+        path = app.config.get('USER_CACHE_PATH') or os.path.join(app.instance_path, 'user_cache.stamp')
+        user_cache = SharedLRUCache(path, size, ttl)
+    else:
+        user_cache = None
+
+
+def invalidate_user(user_id):
+    """Elimina de la caché la identidad del usuario (tras crearlo, borrarlo o cambiar sus permisos)."""
+    if user_cache is not None:
+        user_cache.delete(int(user_id))
+
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    if user_cache is None:
+        return db.session.get(User, user_id)
+
+    identity = user_cache.get(user_id)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = (user.id, user.username, bool(user.is_admin))
+        user_cache.set(user_id, identity)
+    return CachedUser(*identity)
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,7 +65,7 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(200), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)  # NUEVO: campo admin
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # NUEVO: quién lo creó
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)  # NUEVO: quién lo creó
     
     
     def set_password(self, password):
@@ -25,6 +76,22 @@ class User(UserMixin, db.Model):
     
     def __repr__(self):
         return f'<User {self.username}>'
-    
 
-    
\ No newline at end of file
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    # Usuarios modificados o borrados en esta transacción; se invalidan al confirmar
+    for record in list(session.dirty) + list(session.deleted):
+        if isinstance(record, User):
+            session.info.setdefault('changed_users', set()).add(record.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('changed_users', None)
@@ -0,0 +1,211 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, or_, select, update
+from . import db
+from .models import User
+from .station_models import Station, Router, StationHistory
+from .summary import refresh_summaries
+from .changelog import log_sync_changes
+
+ONLINE = 'online'
+OFFLINE = 'offline'
+# Los routers en mantenimiento (estado puesto a mano) no se sondean
+MAINTENANCE = 'mantenimiento'
+
+# Ids por sentencia UPDATE
+UPDATE_CHUNK = 500
+
+
+class PollResult:
+    """Resultado de un sondeo: routers sondeados, alcanzables, caídos y cambios de estado."""
+
+    def __init__(self, checked=0, elapsed=0.0):
+        self.checked = checked
+        self.online = 0
+        self.offline = 0
+        self.changed = 0
+        self.elapsed = elapsed  # segundos de sondeo (sin la escritura)
+
+
+def poll_settings(**overrides):
+    """Parámetros del sondeo: configuración de la app con los valores indicados por encima."""
+    config = current_app.config
+    settings = {
+        'port': config['ROUTER_POLL_PORT'],
+        'timeout': config['ROUTER_POLL_TIMEOUT'],
+        'concurrency': config['ROUTER_POLL_CONCURRENCY'],
+    }
+    settings.update({name: value for name, value in overrides.items() if value is not None})
+    return settings
+
+
+def poll_targets():
+    """(id, station_id, ip_address, status) de los routers a sondear."""
+    return db.session.execute(
+        select(Router.id, Router.station_id, Router.ip_address, Router.status)
+        .join(Station, Station.id == Router.station_id)
+        .where(
+            Station.deleted_at.is_(None),
+            Router.ip_address.isnot(None),
+            Router.ip_address != '',
+            or_(Router.status.is_(None), Router.status != MAINTENANCE)
+        )
+        .order_by(Router.id)
+    ).all()
+
+
+async def probe(host, port, timeout):
+    """True si el host acepta una conexión TCP en el puerto antes del timeout."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def probe_all(hosts, port, timeout, concurrency):
+    """Sondea los hosts con como mucho concurrency conexiones abiertas a la vez.
+
+    Devuelve {host: alcanzable}; cada dirección se sondea una sola vez.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(host):
+        async with semaphore:
+            return await probe(host, port, timeout)
+
+    hosts = list(dict.fromkeys(hosts))
+    results = await asyncio.gather(*[bounded(host) for host in hosts])
+    return dict(zip(hosts, results))
+
+
+def apply_results(targets, reachable, user_id):
+    """Guarda los cambios de estado con UPDATEs por lotes (sin confirmar).
+
+    Sólo se escribe en los routers cuyo estado cambia, y cada transición deja
+    un registro en el historial de la estación. Devuelve el número de cambios.
+    """
+    now = datetime.utcnow()
+    previous = {target.id: target.status for target in targets}
+    pending = {ONLINE: [], OFFLINE: []}
+    for target in targets:
+        status = ONLINE if reachable[target.ip_address] else OFFLINE
+        if target.status != status:
+            pending[status].append(target.id)
+
+    changed = []
+    for status, router_ids in pending.items():
+        for start in range(0, len(router_ids), UPDATE_CHUNK):
+            # La condición sobre el estado evita pisar un cambio manual hecho durante el sondeo
+            changed += db.session.execute(
+                update(Router)
+                .where(
+                    Router.id.in_(router_ids[start:start + UPDATE_CHUNK]),
+                    or_(Router.status.is_(None), Router.status.notin_([status, MAINTENANCE]))
+                )
+                .values(status=status, updated_at=now)
+                .returning(Router.id, Router.station_id, Router.status)
+                .execution_options(synchronize_session=False)
+            ).all()
+    if not changed:
+        return 0
+
+    db.session.execute(insert(StationHistory), [{
+        'station_id': row.station_id,
+        'action': 'router_status_changed',
+        'field_changed': 'router.status',
+        'old_value': previous[row.id],
+        'new_value': row.status,
+        'description': f'Router {row.status} (sondeo automático)',
+        'changed_by': user_id,
+        'created_at': now,
+    } for row in changed])
+    refresh_summaries({row.station_id for row in changed})
+    log_sync_changes(db.session.connection(), 'router', [(row.id, row.station_id) for row in changed])
+    return len(changed)
+
+
+def poll_routers(user_id, **overrides):
+    """Sondea todos los routers y confirma los cambios de estado. Devuelve un PollResult."""
+    settings = poll_settings(**overrides)
+    targets = poll_targets()
+    # La conexión no se usa mientras se sondea
+    db.session.commit()
+
+    started = time.perf_counter()
+    reachable = asyncio.run(probe_all(
+        [target.ip_address for target in targets], settings['port'], settings['timeout'], settings['concurrency']
+    ))
+    result = PollResult(checked=len(targets), elapsed=time.perf_counter() - started)
+    for target in targets:
+        if reachable[target.ip_address]:
+            result.online += 1
+        else:
+            result.offline += 1
+
+    result.changed = apply_results(targets, reachable, user_id)
+    db.session.commit()
+    return result
+
+
+def next_delay(interval, jitter):
+    """Espera hasta el siguiente sondeo: interval ± jitter (fracción), para no sincronizar procesos."""
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+
+def _poll_user(username):
+    if username:
+        user = User.query.filter_by(username=username).first()
+    else:
+        user = User.query.filter_by(is_admin=True).order_by(User.id).first()
+    if user is None:
+        raise click.ClickException('No se encontró el usuario al que atribuir los cambios de estado')
+    return user.id
+
+
+def _report(result):
+    click.echo(f'{result.checked} routers en {result.elapsed:.2f} s: {result.online} online, '
+               f'{result.offline} offline, {result.changed} cambio(s) de estado')
+
+
+routers_cli = AppGroup('routers', help='Sondeo de la conectividad de los routers.')
+
+
+@routers_cli.command('poll')
+@click.option('--user', 'username', help='Usuario al que se atribuyen los cambios (por defecto, el primer admin)')
+@click.option('--port', type=int, help='Puerto TCP (por defecto ROUTER_POLL_PORT)')
+@click.option('--timeout', type=float, help='Segundos por host (por defecto ROUTER_POLL_TIMEOUT)')
+@click.option('--concurrency', type=int, help='Conexiones simultáneas (por defecto ROUTER_POLL_CONCURRENCY)')
+def poll_command(username, port, timeout, concurrency):
+    """Sondea todos los routers una vez."""
+    _report(poll_routers(_poll_user(username), port=port, timeout=timeout, concurrency=concurrency))
+
+
+@routers_cli.command('watch')
+@click.option('--user', 'username', help='Usuario al que se atribuyen los cambios (por defecto, el primer admin)')
+@click.option('--port', type=int, help='Puerto TCP (por defecto ROUTER_POLL_PORT)')
+@click.option('--timeout', type=float, help='Segundos por host (por defecto ROUTER_POLL_TIMEOUT)')
+@click.option('--concurrency', type=int, help='Conexiones simultáneas (por defecto ROUTER_POLL_CONCURRENCY)')
+@click.option('--interval', type=float, help='Segundos entre sondeos (por defecto ROUTER_POLL_INTERVAL)')
+def watch_command(username, port, timeout, concurrency, interval):
+    """Sondea los routers periódicamente hasta que se interrumpe."""
+    user_id = _poll_user(username)
+    interval = interval or current_app.config['ROUTER_POLL_INTERVAL']
+    jitter = current_app.config['ROUTER_POLL_JITTER']
+    while True:
+        try:
+            _report(poll_routers(user_id, port=port, timeout=timeout, concurrency=concurrency))
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Error en el sondeo de routers')
+        time.sleep(next_delay(interval, jitter))
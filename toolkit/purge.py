@@ -0,0 +1,157 @@
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, select, tuple_
+from . import db
+from .station_models import (
+    Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, StationHistory,
+    StationSummary, ReliabilityRollup, StationPurge, SensorReading, SensorRollup, SensorRollupPending
+)
+from .search_index import remove_document, remove_documents, remove_station_documents
+from .history import remove_station_archive
+from .fragments import invalidate_station
+from .geo import remove_locations
+
+# Registros borrados por lote; cada lote es una transacción corta
+PURGE_BATCH_SIZE = 1000
+
+# Tablas dependientes en el orden de purga, con su tipo en el índice de búsqueda
+PURGE_TABLES = [
+    (SensorReading, None),
+    (SensorRollup, None),
+    (SensorRollupPending, None),
+    (StationHistory, None),
+    (Breakdown, 'breakdown'),
+    (Intervention, 'intervention'),
+    (TechnicalDetail, 'detail'),
+    (Sensor, None),
+    (Router, None),
+]
+
+
+def soft_delete_station(station, user_id):
+    """Oculta la estación y registra su purga (sin confirmar). Devuelve el StationPurge.
+
+    El resumen y los agregados de fiabilidad se borran ya: compute_summaries y
+    compute_rollups no incluyen las estaciones eliminadas.
+    """
+    counts = db.session.execute(select(*[
+        select(func.count()).select_from(model).where(model.station_id == station.id).scalar_subquery()
+        for model, _ in PURGE_TABLES
+    ])).one()
+    station.deleted_at = datetime.utcnow()
+    db.session.execute(delete(StationSummary).where(StationSummary.station_id == station.id))
+    db.session.execute(delete(ReliabilityRollup).where(ReliabilityRollup.station_id == station.id))
+    purge = StationPurge(
+        station_id=station.id,
+        station_name=station.name,
+        requested_by=user_id,
+        total_rows=sum(counts)
+    )
+    db.session.add(purge)
+    # El id hace falta para encolar el trabajo de purga en la misma transacción
+    db.session.flush()
+    return purge
+
+
+def delete_station_now(station):
+    """Borrado inmediato de la estación y confirma: los registros dependientes los
+    borra la base de datos (ON DELETE CASCADE)."""
+    station_id = station.id
+    remove_station_documents(db.session.connection(), station_id)
+    db.session.delete(station)
+    db.session.commit()
+    remove_station_archive(station_id)
+    invalidate_station(station_id)
+
+
+def purge_batch(purge, batch_size=PURGE_BATCH_SIZE):
+    """Borra el siguiente lote de registros de la estación (sin confirmar).
+
+    Cuando ya no quedan registros borra la estación y da la purga por terminada
+    (los segmentos del historial archivado se borran en cascada; sus ficheros,
+    en run_purge después de confirmar). Devuelve el número de registros borrados.
+    """
+    connection = db.session.connection()
+    for model, kind in PURGE_TABLES:
+        # Las lecturas y sus agregados no tienen id: el lote se elige por la clave primaria
+        columns = list(model.__table__.primary_key.columns)
+        key = columns[0] if len(columns) == 1 else tuple_(*columns)
+        batch = select(*columns).where(model.station_id == purge.station_id).limit(batch_size)
+        record_ids = list(db.session.execute(
+            delete(model).where(key.in_(batch)).returning(columns[0])
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        if record_ids:
+            if kind:
+                remove_documents(connection, kind, record_ids)
+            purge.purged_rows += len(record_ids)
+            return len(record_ids)
+
+    remove_document(connection, 'station', purge.station_id)
+    remove_locations(connection, [purge.station_id])
+    db.session.execute(
+        delete(Station).where(Station.id == purge.station_id).execution_options(synchronize_session=False)
+    )
+    purge.finished_at = datetime.utcnow()
+    return 0
+
+
+def run_purge(purge_id, batch_size=PURGE_BATCH_SIZE, progress=None):
+    """Purga una estación lote a lote, confirmando cada lote.
+
+    progress(purge) se llama después de cada lote. Devuelve el StationPurge.
+    """
+    purge = db.session.get(StationPurge, purge_id)
+    while purge is not None and purge.finished_at is None:
+        purge_batch(purge, batch_size)
+        db.session.commit()
+        if purge.finished_at is not None:
+            remove_station_archive(purge.station_id)
+        if progress:
+            progress(purge)
+    return purge
+
+
+def pending_purges():
+    return StationPurge.query.filter(StationPurge.finished_at.is_(None)).order_by(StationPurge.id).all()
+
+
+def purge_to_dict(purge):
+    return {
+        'id': purge.id,
+        'station_id': purge.station_id,
+        'station_name': purge.station_name,
+        'requested_at': purge.requested_at.isoformat() if purge.requested_at else None,
+        'total_rows': purge.total_rows,
+        'purged_rows': purge.purged_rows,
+        'progress': round(purge.progress, 1),
+        'finished_at': purge.finished_at.isoformat() if purge.finished_at else None,
+    }
+
+
+purge_cli = AppGroup('purge', help='Purga de las estaciones eliminadas.')
+
+
+@purge_cli.command('run')
+@click.option('--batch-size', default=PURGE_BATCH_SIZE, show_default=True, help='Registros por lote')
+def run_command(batch_size):
+    """Termina las purgas pendientes."""
+    purges = pending_purges()
+    for purge in purges:
+        click.echo(f'Purgando {purge.station_name} (estación {purge.station_id})')
+        run_purge(purge.id, batch_size, progress=lambda p: click.echo(
+            f'  {p.purged_rows}/{p.total_rows} registros ({p.progress:.0f} %)'
+        ))
+    click.echo(f'{len(purges)} purga(s) terminada(s)')
+
+
+@purge_cli.command('status')
+def status_command():
+    """Muestra el progreso de las purgas pendientes."""
+    purges = pending_purges()
+    for purge in purges:
+        click.echo(f'{purge.station_name} (estación {purge.station_id}): '
+                   f'{purge.purged_rows}/{purge.total_rows} registros ({purge.progress:.0f} %)')
+    if not purges:
+        click.echo('No hay purgas pendientes')
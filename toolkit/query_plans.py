@@ -0,0 +1,83 @@
+import re
+from datetime import datetime
+from sqlalchemy.orm import joinedload
+from . import db
+from .station_models import Station, Sensor, Breakdown, Intervention, StationHistory, HistorySegment
+from .calibration import due_sensors_query, calibration_settings
+from .geo import candidates_query, bounding_boxes
+from .station_queries import (
+    station_counts_query, keyset_query, encode_cursor,
+    history_query, breakdowns_query, interventions_query, HISTORY_PER_PAGE,
+    open_breakdowns_query, pending_interventions_query, TRIAGE_PER_PAGE
+)
+
+# Una línea 'SCAN <tabla>' sin 'USING ...' es un recorrido completo de la tabla
+FULL_SCAN = re.compile(r'^SCAN (\S+)$')
+
+
+def route_queries(station_id=1):
+    """Consulta principal de cada ruta, con valores representativos."""
+    cursor = encode_cursor(datetime.utcnow(), 1)
+    return [
+        ('list_stations (filtro por isla)',
+         station_counts_query().filter(Station.island == 'Tenerife').order_by(Station.id)),
+        ('view_station: averías activas',
+         Breakdown.query.options(joinedload(Breakdown.reporter))
+         .filter(Breakdown.station_id == station_id, Breakdown.resolved.is_(False)).order_by(Breakdown.id)),
+        ('view_station: intervenciones pendientes',
+         Intervention.query.filter(Intervention.station_id == station_id, Intervention.technician_name.is_(None))
+         .order_by(Intervention.id)),
+        ('view_station: historial reciente',
+         history_query(station_id).order_by(StationHistory.created_at.desc()).limit(5)),
+        ('view_station: averías recientes',
+         Breakdown.query.filter_by(station_id=station_id).order_by(Breakdown.reported_date.desc()).limit(3)),
+        ('view_station: intervenciones recientes',
+         Intervention.query.filter(
+             Intervention.station_id == station_id,
+             Intervention.technician_name.isnot(None)
+         ).order_by(Intervention.created_at.desc()).limit(3)),
+        ('view_station_details: sensores',
+         Sensor.query.filter_by(station_id=station_id)),
+        ('view_history',
+         keyset_query(history_query(station_id), StationHistory.created_at, StationHistory.id, cursor)
+         .limit(HISTORY_PER_PAGE + 1)),
+        ('view_history: segmentos archivados',
+         HistorySegment.query.filter(HistorySegment.station_id == station_id)
+         .order_by(HistorySegment.last_created_at.desc(), HistorySegment.sequence.desc())),
+        ('view_breakdowns_history',
+         keyset_query(breakdowns_query(station_id), Breakdown.reported_date, Breakdown.id, cursor)
+         .limit(HISTORY_PER_PAGE + 1)),
+        ('view_interventions_history',
+         keyset_query(interventions_query(station_id), Intervention.created_at, Intervention.id, cursor)
+         .limit(HISTORY_PER_PAGE + 1)),
+        ('triage: averías activas por severidad',
+         open_breakdowns_query('crítica', island='Tenerife')
+         .order_by(Breakdown.reported_date, Breakdown.id).limit(TRIAGE_PER_PAGE + 1)),
+        ('triage: intervenciones pendientes',
+         pending_interventions_query(required_vehicle='4x4')
+         .order_by(Intervention.created_at, Intervention.id).limit(TRIAGE_PER_PAGE + 1)),
+        ('calibraciones pendientes',
+         due_sensors_query(*calibration_settings())),
+        ('estaciones cercanas',
+         candidates_query(bounding_boxes(28.3, -16.5, 25)[0])),
+    ]
+
+
+def explain(query):
+    """Devuelve las líneas de EXPLAIN QUERY PLAN de una consulta (sólo SQLite)."""
+    # Consultas del ORM (Query) o sentencias select() de Core
+    sql = getattr(query, 'statement', query).compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')).fetchall()
+    return [row[-1] for row in rows]
+
+
+def check_query_plans():
+    """Genera (nombre, usa_índices, plan) para cada consulta principal."""
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('La comprobación de planes sólo está disponible para SQLite')
+
+    tables = set(db.metadata.tables)
+    for name, query in route_queries():
+        plan = explain(query)
+        scans = [m.group(1) for m in map(FULL_SCAN.match, plan) if m and m.group(1) in tables]
+        yield name, not scans, plan
@@ -0,0 +1,430 @@
+from datetime import date, datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, delete, distinct, event, func, insert, inspect, select, tuple_, update
+from sqlalchemy.orm import Session
+from . import db
+from .station_models import Station, Breakdown, Intervention, ReliabilityRollup
+from .station_queries import deleted_station_ids, hours_between
+
+# Columna del agregado que corresponde a cada severidad / tipo de intervención
+SEVERITY_COLUMNS = {
+    'baja': 'breakdowns_low',
+    'media': 'breakdowns_medium',
+    'alta': 'breakdowns_high',
+    'crítica': 'breakdowns_critical',
+}
+
+# Los tipos son los valores de los formularios de intervenciones (sin tilde)
+INTERVENTION_TYPE_COLUMNS = {
+    'mantenimiento': 'interventions_maintenance',
+    'reparacion': 'interventions_repair',
+    'calibracion': 'interventions_calibration',
+    'instalacion': 'interventions_installation',
+}
+
+ROLLUP_COLUMNS = (
+    ['breakdowns_reported'] + list(SEVERITY_COLUMNS.values()) +
+    ['breakdowns_resolved', 'repair_hours', 'interventions'] + list(INTERVENTION_TYPE_COLUMNS.values())
+)
+
+# Columnas de agrupación de los indicadores
+GROUPINGS = {
+    'fleet': [],
+    'island': [Station.island],
+    'municipality': [Station.island, Station.municipality],
+    'station': [Station.id, Station.name, Station.island, Station.municipality],
+}
+
+# Campos que determinan la contribución de cada registro a los agregados
+BREAKDOWN_FIELDS = ('station_id', 'severity', 'reported_date', 'resolved', 'resolved_date')
+INTERVENTION_FIELDS = ('station_id', 'intervention_type', 'created_at')
+
+INSERT_BATCH_SIZE = 1000
+
+# Filas por página del panel agrupado por estación
+KPI_STATIONS_PER_PAGE = 100
+
+# Diferencia admitida en las horas de reparación al verificar (redondeos de coma flotante)
+HOURS_TOLERANCE = 0.01
+
+
+def _day(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _breakdown_contribution(deltas, values, sign):
+    station_id, severity, reported_date, resolved, resolved_date = values
+    if station_id is None or reported_date is None:
+        return
+    reported = deltas.setdefault((station_id, _day(reported_date)), {})
+    reported['breakdowns_reported'] = reported.get('breakdowns_reported', 0) + sign
+    if severity in SEVERITY_COLUMNS:
+        column = SEVERITY_COLUMNS[severity]
+        reported[column] = reported.get(column, 0) + sign
+    if resolved and resolved_date is not None:
+        closed = deltas.setdefault((station_id, _day(resolved_date)), {})
+        closed['breakdowns_resolved'] = closed.get('breakdowns_resolved', 0) + sign
+        hours = (resolved_date - reported_date).total_seconds() / 3600
+        closed['repair_hours'] = closed.get('repair_hours', 0) + sign * hours
+
+
+def _intervention_contribution(deltas, values, sign):
+    station_id, intervention_type, created_at = values
+    if station_id is None or created_at is None:
+        return
+    counters = deltas.setdefault((station_id, _day(created_at)), {})
+    counters['interventions'] = counters.get('interventions', 0) + sign
+    if intervention_type in INTERVENTION_TYPE_COLUMNS:
+        column = INTERVENTION_TYPE_COLUMNS[intervention_type]
+        counters[column] = counters.get(column, 0) + sign
+
+
+TRACKED = {
+    Breakdown: (BREAKDOWN_FIELDS, _breakdown_contribution),
+    Intervention: (INTERVENTION_FIELDS, _intervention_contribution),
+}
+
+
+def _values(record, fields, previous=False):
+    if not previous:
+        return tuple(getattr(record, field) for field in fields)
+    state = inspect(record)
+    values = []
+    for field in fields:
+        history = state.attrs[field].history
+        values.append(history.deleted[0] if history.deleted else getattr(record, field))
+    return tuple(values)
+
+
+def _changed(record, fields):
+    state = inspect(record)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+def _ignore(target, value, oldvalue, initiator):
+    return value
+
+
+# Con active_history el valor anterior se carga antes de modificarse, aunque el
+# atributo estuviera caducado, para poder restarlo de los agregados
+for _model, (_fields, _) in TRACKED.items():
+    for _field in _fields:
+        event.listen(getattr(_model, _field), 'set', _ignore, active_history=True, retval=True)
+
+
+def _apply(connection, deltas):
+    table = ReliabilityRollup.__table__
+    for (station_id, day), counters in deltas.items():
+        counters = {name: delta for name, delta in counters.items() if delta}
+        if not counters:
+            continue
+        key = and_(table.c.station_id == station_id, table.c.day == day)
+        result = connection.execute(
+            update(table).where(key).values({name: table.c[name] + delta for name, delta in counters.items()})
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(station_id=station_id, day=day, **counters))
+
+
+def _apply_many(connection, deltas):
+    # Versión por lotes de _apply: un SELECT de las claves existentes, un UPDATE
+    # executemany y un INSERT executemany, sea cual sea el número de días afectados
+    deltas = {key: counters for key, counters in deltas.items() if any(counters.values())}
+    if not deltas:
+        return
+    table = ReliabilityRollup.__table__
+    names = sorted({name for counters in deltas.values() for name in counters})
+    existing = set(connection.execute(
+        select(table.c.station_id, table.c.day).where(tuple_(table.c.station_id, table.c.day).in_(list(deltas)))
+    ).all())
+
+    updates = [
+        dict({f'd_{name}': counters.get(name, 0) for name in names}, b_station_id=station_id, b_day=day)
+        for (station_id, day), counters in deltas.items() if (station_id, day) in existing
+    ]
+    if updates:
+        connection.execute(
+            update(table)
+            .where(table.c.station_id == bindparam('b_station_id'), table.c.day == bindparam('b_day'))
+            .values({name: table.c[name] + bindparam(f'd_{name}') for name in names}),
+            updates
+        )
+    inserts = [
+        dict({name: counters.get(name, 0) for name in names}, station_id=station_id, day=day)
+        for (station_id, day), counters in deltas.items() if (station_id, day) not in existing
+    ]
+    if inserts:
+        connection.execute(insert(table), inserts)
+
+
+def record_changes(model, changes):
+    """Aplica a los agregados cambios hechos con sentencias masivas, que no pasan por la sesión.
+
+    changes es una lista de (valores_antes, valores_después) con los campos de
+    BREAKDOWN_FIELDS / INTERVENTION_FIELDS; None si el registro no existía o ya no existe.
+    """
+    fields, contribution = TRACKED[model]
+    deltas = {}
+    for before, after in changes:
+        if before is not None:
+            contribution(deltas, before, -1)
+        if after is not None:
+            contribution(deltas, after, 1)
+    _apply_many(db.session.connection(), deltas)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_rollups(session, flush_context):
+    """Actualiza los agregados diarios con los cambios de averías e intervenciones
+    en la misma transacción (report_breakdown, resolve_breakdown, borrados...)."""
+    deleted_stations = {record.id for record in session.deleted if isinstance(record, Station)}
+    deltas = {}
+
+    for record in session.new:
+        tracked = TRACKED.get(type(record))
+        if tracked:
+            fields, contribution = tracked
+            contribution(deltas, _values(record, fields), 1)
+
+    for record in session.dirty:
+        tracked = TRACKED.get(type(record))
+        if tracked and _changed(record, tracked[0]):
+            fields, contribution = tracked
+            contribution(deltas, _values(record, fields, previous=True), -1)
+            contribution(deltas, _values(record, fields), 1)
+
+    for record in session.deleted:
+        tracked = TRACKED.get(type(record))
+        if tracked and record.station_id not in deleted_stations:
+            fields, contribution = tracked
+            contribution(deltas, _values(record, fields, previous=True), -1)
+
+    if deleted_stations:
+        session.connection().execute(
+            delete(ReliabilityRollup.__table__).where(ReliabilityRollup.station_id.in_(deleted_stations))
+        )
+    if any(any(counters.values()) for counters in deltas.values()):
+        # Con varios días o estaciones afectados (altas en lote) se usa la versión por lotes
+        (_apply_many if len(deltas) > 1 else _apply)(session.connection(), deltas)
+
+
+def compute_rollups(station_ids=None, exclude_deleted=True):
+    """Calcula los agregados diarios desde las tablas de averías e intervenciones.
+
+    Devuelve {(station_id, día): {columna: valor}}. Si station_ids es None se calculan todos.
+    Las estaciones eliminadas pendientes de purgar no tienen agregados (exclude_deleted
+    es False sólo en las migraciones anteriores al borrado lógico).
+    """
+    def restrict(query, column):
+        if station_ids is not None:
+            query = query.where(column.in_(station_ids))
+        if exclude_deleted:
+            query = query.where(column.notin_(deleted_station_ids()))
+        return query
+
+    results = {}
+
+    def counters(station_id, day):
+        return results.setdefault((station_id, _day(day)), {name: 0 for name in ROLLUP_COLUMNS})
+
+    reported_day = func.date(Breakdown.reported_date)
+    reported_rows = restrict(select(
+        Breakdown.station_id, reported_day, Breakdown.severity, func.count(Breakdown.id)
+    ).where(Breakdown.reported_date.isnot(None)), Breakdown.station_id).group_by(
+        Breakdown.station_id, reported_day, Breakdown.severity
+    )
+    for station_id, day, severity, total in db.session.execute(reported_rows):
+        values = counters(station_id, day)
+        values['breakdowns_reported'] += total
+        if severity in SEVERITY_COLUMNS:
+            values[SEVERITY_COLUMNS[severity]] += total
+
+    resolved_day = func.date(Breakdown.resolved_date)
+    resolved_rows = restrict(select(
+        Breakdown.station_id, resolved_day, func.count(Breakdown.id),
+        func.sum(hours_between(Breakdown.reported_date, Breakdown.resolved_date))
+    ).where(
+        Breakdown.resolved.is_(True), Breakdown.resolved_date.isnot(None), Breakdown.reported_date.isnot(None)
+    ), Breakdown.station_id).group_by(Breakdown.station_id, resolved_day)
+    for station_id, day, total, hours in db.session.execute(resolved_rows):
+        values = counters(station_id, day)
+        values['breakdowns_resolved'] += total
+        values['repair_hours'] += hours or 0.0
+
+    created_day = func.date(Intervention.created_at)
+    intervention_rows = restrict(select(
+        Intervention.station_id, created_day, Intervention.intervention_type, func.count(Intervention.id)
+    ).where(Intervention.created_at.isnot(None)), Intervention.station_id).group_by(
+        Intervention.station_id, created_day, Intervention.intervention_type
+    )
+    for station_id, day, intervention_type, total in db.session.execute(intervention_rows):
+        values = counters(station_id, day)
+        values['interventions'] += total
+        if intervention_type in INTERVENTION_TYPE_COLUMNS:
+            values[INTERVENTION_TYPE_COLUMNS[intervention_type]] += total
+
+    return results
+
+
+def _insert_rollups(expected):
+    rows = [dict(values, station_id=station_id, day=day) for (station_id, day), values in expected.items()]
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(insert(ReliabilityRollup), rows[start:start + INSERT_BATCH_SIZE])
+
+
+def refresh_rollups(station_ids):
+    """Recalcula desde cero los agregados de las estaciones indicadas (sin confirmar).
+
+    Para escrituras que no pasan por la sesión (INSERT/UPDATE masivos).
+    """
+    station_ids = list(station_ids)
+    if not station_ids:
+        return
+    db.session.execute(delete(ReliabilityRollup).where(ReliabilityRollup.station_id.in_(station_ids)))
+    _insert_rollups(compute_rollups(station_ids))
+
+
+def _matches(stored, expected):
+    return all(
+        abs(stored[name] - value) <= HOURS_TOLERANCE if name == 'repair_hours' else stored[name] == value
+        for name, value in expected.items()
+    )
+
+
+def rebuild_rollups(verify_only=False, exclude_deleted=True):
+    """Compara los agregados guardados con los calculados y, si no es sólo una
+    verificación, los vuelve a generar. Devuelve la lista de (estación, día) que no coincidían."""
+    expected = compute_rollups(exclude_deleted=exclude_deleted)
+    columns = [getattr(ReliabilityRollup, name) for name in ROLLUP_COLUMNS]
+    stored = {
+        (row.station_id, _day(row.day)): dict(zip(ROLLUP_COLUMNS, row[2:]))
+        for row in db.session.execute(select(ReliabilityRollup.station_id, ReliabilityRollup.day, *columns))
+    }
+
+    empty = {name: 0 for name in ROLLUP_COLUMNS}
+    drifted = [key for key, values in expected.items() if not _matches(stored.get(key, empty), values)]
+    # Filas guardadas sin actividad real (p. ej. tras borrar registros) sólo cuentan si no están a cero
+    drifted += [key for key, values in stored.items() if key not in expected and not _matches(values, empty)]
+
+    if not verify_only:
+        db.session.execute(delete(ReliabilityRollup))
+        _insert_rollups(expected)
+        db.session.commit()
+    return sorted(drifted)
+
+
+def parse_range(start=None, end=None, default_days=365):
+    """Convierte las fechas 'AAAA-MM-DD' del formulario en el intervalo [inicio, fin).
+
+    La fecha final es inclusiva; sin fechas se usan los últimos default_days días.
+    Lanza ValueError si las fechas no son válidas.
+    """
+    end_day = date.fromisoformat(end) if end else datetime.utcnow().date()
+    start_day = date.fromisoformat(start) if start else end_day - timedelta(days=default_days - 1)
+    if start_day > end_day:
+        raise ValueError('La fecha inicial es posterior a la final')
+    return start_day, end_day + timedelta(days=1)
+
+
+def _indicators(values, period_hours):
+    # MTTR, MTBF y disponibilidad a partir de las sumas de un grupo
+    resolved, reported, repair_hours = values['breakdowns_resolved'], values['breakdowns_reported'], values['repair_hours']
+    mttr_hours = repair_hours / resolved if resolved else None
+    mtbf_hours = (values['stations'] * period_hours - repair_hours) / reported if reported else None
+    values['mttr_hours'], values['mtbf_hours'] = mttr_hours, mtbf_hours
+    if mtbf_hours is None:
+        # Sin averías en el intervalo
+        values['availability'] = 1.0
+    elif mttr_hours is None:
+        values['availability'] = None
+    else:
+        values['availability'] = mtbf_hours / (mtbf_hours + mttr_hours)
+    values['repair_hours'] = round(repair_hours, 2)
+    return values
+
+
+def _kpi_groups(start, end, group, island=None, after_id=None, limit=None):
+    # Sumas de los agregados por grupo de estaciones, en una consulta
+    columns = GROUPINGS[group]
+    rollup = ReliabilityRollup
+    sums = {name: func.coalesce(func.sum(getattr(rollup, name)), 0) for name in ROLLUP_COLUMNS}
+    # Cada estación lee su rango de días por la clave primaria (station_id, day)
+    query = db.session.query(
+        *columns,
+        func.count(distinct(Station.id)).label('stations'),
+        *[total.label(name) for name, total in sums.items()],
+    ).select_from(Station).outerjoin(
+        rollup, and_(rollup.station_id == Station.id, rollup.day >= start, rollup.day < end)
+    ).filter(Station.deleted_at.is_(None))
+    if island:
+        query = query.filter(Station.island == island)
+    if after_id:
+        query = query.filter(Station.id > after_id)
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+    if limit:
+        query = query.limit(limit)
+    return [values for values in (row._asdict() for row in query) if values['stations']]
+
+
+def reliability_report(start, end, group='island', island=None):
+    """Indicadores de fiabilidad de la flota y por grupo de estaciones en el intervalo [start, end).
+
+    Todo se calcula en una consulta agregada sobre reliability_rollup:
+    - MTTR: horas de reparación de las averías resueltas en el intervalo / averías resueltas.
+    - MTBF: horas de funcionamiento (estaciones × horas del intervalo − horas de
+      reparación) / averías reportadas.
+    - Disponibilidad: MTBF / (MTBF + MTTR).
+    Los grupos reparten las estaciones, así que los totales de la flota son la suma
+    de los grupos. Devuelve (flota, grupos): la flota es una lista con un dict (o
+    vacía si no hay estaciones) y los grupos, una lista de dicts.
+    """
+    period_hours = (end - start).total_seconds() / 3600
+    groups = _kpi_groups(start, end, group, island)
+    fleet = {
+        name: sum(values[name] for values in groups) for name in ['stations'] + list(ROLLUP_COLUMNS)
+    }
+    fleet = [_indicators(fleet, period_hours)] if fleet['stations'] else []
+    return fleet, [_indicators(values, period_hours) for values in groups]
+
+
+def station_kpis_page(start, end, island=None, after_id=None, limit=KPI_STATIONS_PER_PAGE):
+    """Página de los indicadores por estación, paginada por clave (id).
+
+    Devuelve (filas, siguiente_id); siguiente_id es None en la última página.
+    """
+    period_hours = (end - start).total_seconds() / 3600
+    # Se pide una fila de más para saber si hay página siguiente
+    rows = _kpi_groups(start, end, 'station', island, after_id, limit + 1)
+    next_id = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_id = rows[-1]['id']
+    return [_indicators(values, period_hours) for values in rows], next_id
+
+
+reliability_cli = AppGroup('reliability', help='Agregados de los indicadores de fiabilidad.')
+
+
+@reliability_cli.command('rebuild')
+def rebuild_command():
+    """Recalcula los agregados diarios de todas las estaciones."""
+    drifted = rebuild_rollups()
+    click.echo(f'{len(drifted)} agregado(s) diario(s) corregido(s)')
+
+
+@reliability_cli.command('verify')
+def verify_command():
+    """Comprueba los agregados diarios sin modificarlos."""
+    drifted = rebuild_rollups(verify_only=True)
+    if drifted:
+        click.echo(f'Agregados desincronizados: {len(drifted)} (p. ej. estación {drifted[0][0]}, día {drifted[0][1]})')
+        raise SystemExit(1)
+    click.echo('Todos los agregados están sincronizados')
@@ -0,0 +1,173 @@
+from datetime import date, datetime
+from hashlib import sha1
+from sqlalchemy import func, select
+from . import db
+from .station_models import Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, StationSummary
+from .station_queries import keyset_page
+
+# Versión de la API: forma parte de las ETags (un cambio de formato las invalida)
+API_VERSION = 'v1'
+
+# Tipos de recurso de la API (los nombres de fields[tipo])
+RESOURCE_MODELS = {
+    'station': Station,
+    'sensor': Sensor,
+    'router': Router,
+    'technical_detail': TechnicalDetail,
+    'breakdown': Breakdown,
+    'intervention': Intervention,
+    'summary': StationSummary,
+}
+
+# Columnas que no se publican
+HIDDEN_COLUMNS = {'station': {'deleted_at'}, 'summary': {'station_id'}}
+
+# Relaciones que se pueden incluir en una estación: nombre -> (tipo, un solo registro, condición)
+INCLUDES = {
+    'sensors': ('sensor', False, None),
+    'router': ('router', True, None),
+    'technical_details': ('technical_detail', False, None),
+    'open_breakdowns': ('breakdown', False, Breakdown.resolved.is_(False)),
+    'pending_interventions': ('intervention', False, Intervention.technician_name.is_(None)),
+    'summary': ('summary', True, None),
+}
+
+# Historiales de una estación paginados por (fecha, id): nombre -> (tipo, columna de fecha)
+STATION_RECORDS = {
+    'breakdowns': ('breakdown', Breakdown.reported_date),
+    'interventions': ('intervention', Intervention.created_at),
+}
+
+
+def resource_columns(kind):
+    hidden = HIDDEN_COLUMNS.get(kind, ())
+    return [column.key for column in RESOURCE_MODELS[kind].__table__.columns if column.key not in hidden]
+
+
+def parse_fields(args):
+    """{tipo: columnas} de los parámetros fields[tipo]=a,b. El id se incluye siempre."""
+    fields = {}
+    for name, value in args.items():
+        if not (name.startswith('fields[') and name.endswith(']')):
+            continue
+        kind = name[len('fields['):-1]
+        if kind not in RESOURCE_MODELS:
+            raise ValueError(f'Tipo de recurso desconocido en {name}')
+        requested = {field.strip() for field in value.split(',') if field.strip()}
+        columns = resource_columns(kind)
+        unknown = requested - set(columns)
+        if unknown:
+            raise ValueError(f'Campos desconocidos en {name}: {", ".join(sorted(unknown))}')
+        fields[kind] = [column for column in columns if column in requested or column == 'id']
+    return fields
+
+
+def parse_include(value):
+    """Relaciones pedidas en include=a,b, en el orden de INCLUDES."""
+    requested = {name.strip() for name in (value or '').split(',') if name.strip()}
+    unknown = requested - set(INCLUDES)
+    if unknown:
+        raise ValueError(f'No se puede incluir: {", ".join(sorted(unknown))}')
+    return [name for name in INCLUDES if name in requested]
+
+
+def make_etag(*parts):
+    """ETag fuerte a partir de la representación pedida y de las versiones de los datos."""
+    return sha1(repr((API_VERSION,) + parts).encode()).hexdigest()
+
+
+# Versiones: se leen sin cargar los registros para responder 304 con una consulta
+
+def _versions_query():
+    # El resumen se incrementa con cada cambio de la estación o de sus registros
+    # (log_change, refresh_summaries); updated_at cubre los cambios de la propia fila
+    return select(
+        Station.id, Station.created_at, Station.updated_at, func.coalesce(StationSummary.version, 0)
+    ).outerjoin(StationSummary, StationSummary.station_id == Station.id).where(Station.deleted_at.is_(None))
+
+
+def station_version(station_id):
+    """(id, created_at, updated_at, versión) de la estación o None si no existe."""
+    return db.session.execute(_versions_query().where(Station.id == station_id)).first()
+
+
+def station_versions_page(island=None, municipality=None, status=None, after_id=None, limit=100):
+    """Página del listado como filas de versión, paginada por id.
+
+    Devuelve (filas, siguiente_id); siguiente_id es None en la última página.
+    """
+    query = _versions_query()
+    if island:
+        query = query.where(Station.island == island)
+    if municipality:
+        query = query.where(Station.municipality == municipality)
+    if status:
+        query = query.where(Station.status == status)
+    if after_id:
+        query = query.where(Station.id > after_id)
+    rows = db.session.execute(query.order_by(Station.id).limit(limit + 1)).all()
+    next_id = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_id = rows[-1][0]
+    return rows, next_id
+
+
+# Carga de los registros: sólo las columnas pedidas, sin objetos del ORM
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _serialize(columns, row):
+    return {column: _value(value) for column, value in zip(columns, row)}
+
+
+def load_stations(station_ids, fields=None, include=()):
+    """Estaciones serializadas en el orden de station_ids, con las relaciones de include."""
+    fields = fields or {}
+    station_ids = list(station_ids)
+    columns = fields.get('station') or resource_columns('station')
+    query = select(Station.id, *[getattr(Station, column) for column in columns]).where(Station.id.in_(station_ids))
+    stations = {row[0]: _serialize(columns, row[1:]) for row in db.session.execute(query)}
+
+    for name in include:
+        kind, single, condition = INCLUDES[name]
+        model = RESOURCE_MODELS[kind]
+        related = fields.get(kind) or resource_columns(kind)
+        query = select(model.station_id, *[getattr(model, column) for column in related]).where(
+            model.station_id.in_(station_ids)
+        )
+        if condition is not None:
+            query = query.where(condition)
+        if hasattr(model, 'id'):
+            query = query.order_by(model.id)
+        for station in stations.values():
+            station[name] = None if single else []
+        for row in db.session.execute(query):
+            station = stations.get(row[0])
+            if station is None:
+                continue
+            if single:
+                station[name] = _serialize(related, row[1:])
+            else:
+                station[name].append(_serialize(related, row[1:]))
+
+    return [stations[station_id] for station_id in station_ids if station_id in stations]
+
+
+def station_records_page(relation, station_id, fields=None, cursor=None, limit=100):
+    """Página de averías o intervenciones de la estación, de más reciente a más antigua.
+
+    Devuelve (registros, siguiente_cursor).
+    """
+    kind, date_column = STATION_RECORDS[relation]
+    model = RESOURCE_MODELS[kind]
+    columns = (fields or {}).get(kind) or resource_columns(kind)
+    # La fecha y el id se leen siempre: forman el cursor de la página siguiente
+    selected = list(dict.fromkeys(columns + [date_column.key, 'id']))
+    query = db.session.query(*[getattr(model, column) for column in selected]).filter(model.station_id == station_id)
+    rows, next_cursor = keyset_page(query, date_column, model.id, cursor, limit)
+    return [_serialize(columns, row) for row in rows], next_cursor
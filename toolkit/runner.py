@@ -0,0 +1,411 @@
+import inspect
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import OperationalError
+from . import db
+from .station_models import Job
+
+# Tipos de trabajo registrados con @job: nombre -> JobType
+JOB_TYPES = {}
+
+# Estados de un trabajo
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobType:
+    def __init__(self, name, function, max_attempts, admin_only):
+        self.name = name
+        self.function = function
+        self.max_attempts = max_attempts
+        self.admin_only = admin_only
+        # Parámetros del trabajo: los de la función salvo el contexto
+        self.params = list(inspect.signature(function).parameters)[1:]
+
+
+def job(name, max_attempts=None, admin_only=True):
+    """Registra una función como tipo de trabajo: f(ctx, **params) -> resultado (JSON).
+
+    Los ValueError son errores definitivos; cualquier otra excepción se reintenta
+    (hasta max_attempts, por defecto JOB_MAX_ATTEMPTS) con espera exponencial.
+    """
+    def decorator(f):
+        JOB_TYPES[name] = JobType(name, f, max_attempts, admin_only)
+        return f
+    return decorator
+
+
+class JobCancelled(Exception):
+    """Se ha pedido cancelar el trabajo (lo lanza JobContext.progress)."""
+
+
+class JobContext:
+    """Lo que recibe un trabajo: su id, quién lo pidió, el intento y el progreso."""
+
+    def __init__(self, app, job_id, user_id, attempt):
+        self.app = app
+        self.job_id = job_id
+        self.user_id = user_id
+        self.attempt = attempt
+        self._reported = 0
+
+    def path(self, suffix):
+        """Fichero propio del trabajo (entradas subidas o resultados para descargar)."""
+        return job_path(self.job_id, suffix, self.app)
+
+    def progress(self, percent=None, message=None, force=False):
+        """Publica el progreso y lanza JobCancelled si se ha pedido cancelar.
+
+        Se escribe en una transacción aparte (como mucho cada JOB_PROGRESS_SECONDS),
+        así que debe llamarse entre confirmaciones: con SQLite, una transacción de
+        escritura abierta en la sesión del trabajo la bloquearía.
+        """
+        now = time.monotonic()
+        if not force and now - self._reported < self.app.config['JOB_PROGRESS_SECONDS']:
+            return
+        self._reported = now
+        values = {'heartbeat_at': datetime.utcnow()}
+        if percent is not None:
+            values['progress'] = max(0.0, min(100.0, float(percent)))
+        if message is not None:
+            values['message'] = message[:200]
+        try:
+            with db.engine.begin() as connection:
+                cancel = connection.execute(
+                    update(Job).where(Job.id == self.job_id).values(**values).returning(Job.cancel_requested)
+                ).scalar()
+        except OperationalError:
+            # Base de datos bloqueada: el progreso es orientativo, se publica en la siguiente llamada
+            self.app.logger.debug('No se ha podido publicar el progreso del trabajo %s', self.job_id)
+            return
+        if cancel:
+            raise JobCancelled()
+
+
+def job_path(job_id, suffix, app=None):
+    app = app or current_app
+    root = app.config.get('JOB_FILES_PATH') or os.path.join(app.instance_path, 'jobs')
+    os.makedirs(root, exist_ok=True)
+    return os.path.join(root, f'{job_id}.{suffix}')
+
+
+def remove_job_files(job_id, app=None):
+    app = app or current_app
+    root = app.config.get('JOB_FILES_PATH') or os.path.join(app.instance_path, 'jobs')
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        if name.startswith(f'{job_id}.'):
+            os.remove(os.path.join(root, name))
+
+
+def enqueue(kind, params=None, user_id=None, max_attempts=None):
+    """Añade un trabajo pendiente a la sesión (sin confirmar) y lo devuelve.
+
+    Se ejecuta al confirmar: el runner del proceso se despierta con wake_runner().
+    """
+    job_type = JOB_TYPES.get(kind)
+    if job_type is None:
+        raise ValueError(f'Tipo de trabajo desconocido: {kind}')
+    params = params or {}
+    unknown = set(params) - set(job_type.params)
+    if unknown:
+        raise ValueError(f'Parámetros desconocidos para {kind}: {", ".join(sorted(unknown))}')
+    record = Job(
+        kind=kind,
+        params=json.dumps(params),
+        status=PENDING,
+        created_by=user_id,
+        max_attempts=max_attempts or job_type.max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        run_after=datetime.utcnow()
+    )
+    db.session.add(record)
+    db.session.flush()
+    return record
+
+
+def cancel_job(record):
+    """Cancela un trabajo pendiente o pide la cancelación de uno en ejecución (sin confirmar)."""
+    if record.status == PENDING:
+        record.status = CANCELLED
+        record.finished_at = datetime.utcnow()
+    elif record.status == RUNNING:
+        record.cancel_requested = True
+    return record
+
+
+def job_to_dict(record):
+    return {
+        'id': record.id,
+        'kind': record.kind,
+        'status': record.status,
+        'params': json.loads(record.params),
+        'progress': round(record.progress or 0, 1),
+        'message': record.message,
+        'attempts': record.attempts,
+        'max_attempts': record.max_attempts,
+        'cancel_requested': record.cancel_requested,
+        'error': record.error,
+        'created_by': record.created_by,
+        'created_at': record.created_at.isoformat() if record.created_at else None,
+        'started_at': record.started_at.isoformat() if record.started_at else None,
+        'run_after': record.run_after.isoformat() if record.status == PENDING and record.run_after else None,
+        'finished_at': record.finished_at.isoformat() if record.finished_at else None,
+    }
+
+
+def retry_delay(app, attempt):
+    """Espera antes del reintento tras el intento número attempt (exponencial, con tope)."""
+    return min(app.config['JOB_RETRY_BASE_SECONDS'] * 2 ** (attempt - 1), app.config['JOB_RETRY_MAX_SECONDS'])
+
+
+class JobRunner:
+    """Ejecuta los trabajos pendientes en un pool de hilos del proceso.
+
+    Un hilo reparte: reclama los trabajos que tocan (un UPDATE condicionado al
+    estado, así que varios procesos pueden compartir la tabla), actualiza el
+    latido de los que ejecuta y recupera los de procesos que han terminado sin
+    acabarlos. Se despierta con wake() al encolar y cada JOB_POLL_SECONDS.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = set()
+        self._pool = ThreadPoolExecutor(app.config['JOB_WORKERS'], thread_name_prefix='job')
+        self._thread = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='job-runner', daemon=True)
+                self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.dispatch()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Error al repartir los trabajos en segundo plano')
+                finally:
+                    db.session.remove()
+            self._wakeup.wait(self.app.config['JOB_POLL_SECONDS'])
+            self._wakeup.clear()
+
+    def dispatch(self):
+        """Latido, recuperación y reparto de trabajos (dentro de un contexto de aplicación)."""
+        now = datetime.utcnow()
+        with self._lock:
+            running = list(self._running)
+        if running:
+            db.session.execute(update(Job).where(Job.id.in_(running)).values(heartbeat_at=now))
+        recover_stale_jobs(now - timedelta(seconds=self.app.config['JOB_STALE_SECONDS']))
+        db.session.commit()
+
+        free = self.app.config['JOB_WORKERS'] - len(running)
+        for job_id in claim_jobs(free, now) if free > 0 else []:
+            with self._lock:
+                self._running.add(job_id)
+            self._pool.submit(self._execute, job_id)
+
+    def _execute(self, job_id):
+        try:
+            with self.app.app_context():
+                try:
+                    execute_job(self.app, job_id)
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            self.wake()
+
+
+def claim_jobs(limit, now=None):
+    """Marca como en ejecución hasta limit trabajos pendientes que ya tocan. Devuelve sus ids."""
+    now = now or datetime.utcnow()
+    candidates = db.session.scalars(
+        select(Job.id).where(Job.status == PENDING, Job.run_after <= now).order_by(Job.id).limit(limit)
+    ).all()
+    claimed = []
+    for job_id in candidates:
+        # Otro proceso puede haberlo reclamado entre la lectura y la actualización
+        if db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == PENDING)
+            .values(status=RUNNING, attempts=Job.attempts + 1, started_at=now, heartbeat_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+def recover_stale_jobs(cutoff):
+    """Trabajos en ejecución sin latido desde cutoff (su proceso terminó): vuelven a
+    estar pendientes o, sin intentos, fallan. No confirma."""
+    stale = (Job.status == RUNNING) & (Job.heartbeat_at < cutoff)
+    if db.session.scalar(select(Job.id).where(stale).limit(1)) is None:
+        return
+    db.session.execute(
+        update(Job).where(stale, Job.attempts >= Job.max_attempts)
+        .values(status=FAILED, error='El proceso terminó durante la ejecución', finished_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Job).where(stale).values(status=PENDING, run_after=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _finish(job_id, **values):
+    db.session.execute(update(Job).where(Job.id == job_id).values(**values).execution_options(
+        synchronize_session=False
+    ))
+    db.session.commit()
+
+
+def execute_job(app, job_id):
+    """Ejecuta un trabajo ya reclamado y guarda su resultado, su error o su reintento."""
+    record = db.session.get(Job, job_id)
+    job_type = JOB_TYPES.get(record.kind)
+    ctx = JobContext(app, record.id, record.created_by, record.attempts)
+    params = json.loads(record.params)
+    db.session.commit()
+    try:
+        if job_type is None:
+            raise ValueError(f'Tipo de trabajo desconocido: {record.kind}')
+        result = job_type.function(ctx, **params)
+        db.session.commit()
+    except JobCancelled:
+        db.session.rollback()
+        _finish(job_id, status=CANCELLED, finished_at=datetime.utcnow())
+    except Exception as e:
+        db.session.rollback()
+        max_attempts, cancel_requested = db.session.execute(
+            select(Job.max_attempts, Job.cancel_requested).where(Job.id == job_id)
+        ).one()
+        error = f'{type(e).__name__}: {e}'
+        if cancel_requested:
+            _finish(job_id, status=CANCELLED, error=error, finished_at=datetime.utcnow())
+        elif isinstance(e, ValueError) or ctx.attempt >= max_attempts:
+            app.logger.exception('El trabajo %s (%s) ha fallado', job_id, record.kind)
+            _finish(job_id, status=FAILED, error=error, finished_at=datetime.utcnow())
+        else:
+            app.logger.warning('El trabajo %s (%s) se reintentará: %s', job_id, record.kind, error)
+            _finish(job_id, status=PENDING, error=error,
+                    run_after=datetime.utcnow() + timedelta(seconds=retry_delay(app, ctx.attempt)))
+    else:
+        _finish(job_id, status=SUCCEEDED, progress=100, result=json.dumps(result),
+                error=None, finished_at=datetime.utcnow())
+
+
+def job_runner(app=None):
+    """Runner de trabajos de la aplicación (uno por app y proceso)."""
+    app = app or current_app._get_current_object()
+    runner = app.extensions.get('job_runner')
+    if runner is None:
+        runner = app.extensions.setdefault('job_runner', JobRunner(app))
+    return runner
+
+
+def init_job_runner(app):
+    """Con JOB_WORKER, el runner arranca con la primera petición que atiende el proceso.
+
+    No arranca al crear la aplicación: los comandos de flask y los scripts que la
+    crean reclamarían trabajos que se quedarían a medias al terminar el proceso.
+    """
+    if app.config['JOB_WORKER']:
+        app.before_request(_start_runner)
+
+
+def _start_runner():
+    job_runner().start()
+
+
+def wake_runner(app=None):
+    """Arranca (si JOB_WORKER) y despierta el runner del proceso tras encolar un trabajo."""
+    app = app or current_app._get_current_object()
+    if app.config['JOB_WORKER']:
+        runner = job_runner(app)
+        runner.start()
+        runner.wake()
+
+
+def prune_jobs(days):
+    """Elimina los trabajos terminados hace más de days días y sus ficheros. Devuelve cuántos."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    job_ids = db.session.scalars(
+        select(Job.id).where(Job.status.in_(FINISHED), Job.finished_at < cutoff)
+    ).all()
+    for job_id in job_ids:
+        remove_job_files(job_id)
+    db.session.execute(delete(Job).where(Job.id.in_(job_ids)).execution_options(synchronize_session=False))
+    db.session.commit()
+    return len(job_ids)
+
+
+jobs_cli = AppGroup('jobs', help='Trabajos en segundo plano.')
+
+
+@jobs_cli.command('work')
+@click.option('--workers', type=int, default=None, help='Hilos (por defecto JOB_WORKERS)')
+def work_command(workers):
+    """Ejecuta los trabajos pendientes hasta que se interrumpe (para usar sin JOB_WORKER)."""
+    app = current_app._get_current_object()
+    if workers:
+        app.config['JOB_WORKERS'] = workers
+    runner = job_runner(app)
+    click.echo(f'Ejecutando trabajos con {app.config["JOB_WORKERS"]} hilo(s); Ctrl+C para terminar')
+    runner.start().join()
+
+
+@jobs_cli.command('list')
+@click.option('--status', default=None, help='Filtrar por estado')
+@click.option('--limit', type=int, default=20)
+def list_command(status, limit):
+    """Muestra los últimos trabajos."""
+    query = select(Job).order_by(Job.id.desc()).limit(limit)
+    if status:
+        query = query.where(Job.status == status)
+    for record in db.session.scalars(query):
+        click.echo(f'{record.id:6d} {record.kind:20} {record.status:10} {record.progress or 0:5.1f}% '
+                   f'intentos {record.attempts}/{record.max_attempts} {record.error or record.message or ""}')
+
+
+@jobs_cli.command('cancel')
+@click.argument('job_id', type=int)
+def cancel_command(job_id):
+    """Cancela un trabajo pendiente o en ejecución."""
+    record = db.session.get(Job, job_id)
+    if record is None:
+        raise click.ClickException(f'No existe el trabajo {job_id}')
+    cancel_job(record)
+    db.session.commit()
+    click.echo(f'Trabajo {job_id}: {record.status}' + (' (cancelación pedida)' if record.cancel_requested else ''))
+
+
+@jobs_cli.command('prune')
+@click.option('--days', type=int, default=None, help='Días (por defecto JOB_RETENTION_DAYS)')
+def prune_command(days):
+    """Elimina los trabajos terminados antiguos y sus ficheros."""
+    days = days if days is not None else current_app.config['JOB_RETENTION_DAYS']
+    click.echo(f'{prune_jobs(days)} trabajos eliminados (terminados hace más de {days} días)')
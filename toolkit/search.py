@@ -0,0 +1,33 @@
+from flask import Blueprint, render_template, request
+from flask_login import login_required
+from .search_index import search as search_records, SEARCH_FIELDS
+from .station_models import Station
+
+search = Blueprint('search', __name__)
+
+# Búsqueda global
+@search.route('/')
+@login_required
+def index():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') or None
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    results, has_more = search_records(query, kind=kind, page=page) if query else ([], False)
+
+    # Nombres de las estaciones de la página en una sola consulta
+    station_ids = {result['station_id'] for result in results}
+    station_names = dict(
+        Station.query.with_entities(Station.id, Station.name).filter(Station.id.in_(station_ids))
+    ) if station_ids else {}
+
+    return render_template(
+        'search/results.html',
+        query=query,
+        kind=kind,
+        kinds=list(SEARCH_FIELDS),
+        page=page,
+        has_more=has_more,
+        results=results,
+        station_names=station_names
+    )
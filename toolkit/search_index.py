@@ -0,0 +1,318 @@
+import re
+import unicodedata
+import click
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, desc, event, func, inspect, select, text
+from sqlalchemy.orm import Session, load_only
+from . import db
+from .station_models import Station, TechnicalDetail, Breakdown, Intervention
+
+# Campos indexados por tipo de registro: (modelo, campo título, campos del cuerpo)
+SEARCH_FIELDS = {
+    'station': (Station, 'name', ['location', 'how_to_get']),
+    'breakdown': (Breakdown, 'title', ['description', 'resolution_notes']),
+    'intervention': (Intervention, 'title', ['description']),
+    'detail': (TechnicalDetail, 'key', ['value']),
+}
+
+# Código de cada tipo para formar el rowid del índice FTS (id * 4 + código)
+KIND_CODES = {'station': 0, 'breakdown': 1, 'intervention': 2, 'detail': 3}
+
+RESULTS_PER_PAGE = 20
+REBUILD_BATCH_SIZE = 1000
+
+# Peso de las palabras del título frente al cuerpo en el índice alternativo
+TITLE_WEIGHT = 10
+
+_fts5_support = {}
+
+
+class SearchToken(db.Model):
+    """Índice invertido para bases de datos sin FTS5: una fila por palabra y registro."""
+    __tablename__ = 'search_token'
+
+    token = db.Column(db.String(50), primary_key=True)
+    kind = db.Column(db.String(20), primary_key=True)
+    record_id = db.Column(db.Integer, primary_key=True)
+    station_id = db.Column(db.Integer, nullable=True)
+    weight = db.Column(db.Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        db.Index('ix_search_token_record', 'kind', 'record_id'),
+    )
+
+    def __repr__(self):
+        return f'<SearchToken {self.token}>'
+
+
+def fts5_available(connection):
+    """¿La base de datos es SQLite compilado con FTS5?"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    url = str(connection.engine.url)
+    if url not in _fts5_support:
+        options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+        _fts5_support[url] = 'ENABLE_FTS5' in options
+    return _fts5_support[url]
+
+
+def tokenize(value):
+    """Palabras normalizadas (minúsculas y sin tildes) de un texto."""
+    if not value:
+        return []
+    value = unicodedata.normalize('NFKD', value.lower())
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return [token[:50] for token in re.findall(r'\w+', value) if len(token) > 1]
+
+
+def _document(kind, record):
+    _, title_field, body_fields = SEARCH_FIELDS[kind]
+    station_id = record.id if kind == 'station' else record.station_id
+    title = getattr(record, title_field) or ''
+    body = '\n'.join(getattr(record, field) or '' for field in body_fields)
+    return station_id, title, body
+
+
+def _indexed_columns(kind):
+    # Sólo las columnas del documento: la reconstrucción de la migración 3 se ejecuta
+    # antes de que existan las columnas que se añaden a Station más tarde
+    model, title_field, body_fields = SEARCH_FIELDS[kind]
+    fields = [title_field] + body_fields + ([] if kind == 'station' else ['station_id'])
+    return [getattr(model, field) for field in fields]
+
+
+def _kind_of(record):
+    for kind, (model, _, _) in SEARCH_FIELDS.items():
+        if isinstance(record, model):
+            return kind
+    return None
+
+
+def create_search_index(connection):
+    if fts5_available(connection):
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+            "title, body, kind UNINDEXED, station_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def remove_document(connection, kind, record_id):
+    if fts5_available(connection):
+        connection.execute(
+            text('DELETE FROM search_index WHERE rowid = :rowid'),
+            {'rowid': record_id * 4 + KIND_CODES[kind]}
+        )
+    else:
+        connection.execute(
+            SearchToken.__table__.delete().where(
+                SearchToken.kind == kind, SearchToken.record_id == record_id
+            )
+        )
+
+
+def remove_documents(connection, kind, record_ids):
+    """Elimina del índice varios registros del mismo tipo con una sola sentencia."""
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+    if fts5_available(connection):
+        connection.execute(
+            text('DELETE FROM search_index WHERE rowid IN :rowids').bindparams(bindparam('rowids', expanding=True)),
+            {'rowids': [record_id * 4 + KIND_CODES[kind] for record_id in record_ids]}
+        )
+    else:
+        connection.execute(
+            SearchToken.__table__.delete().where(
+                SearchToken.kind == kind, SearchToken.record_id.in_(record_ids)
+            )
+        )
+
+
+def remove_station_documents(connection, station_id):
+    """Elimina del índice la estación y sus registros.
+
+    Se llama antes de borrar la estación: los registros dependientes los borra
+    la base de datos (ON DELETE CASCADE) sin pasar por la sesión.
+    """
+    for kind, (model, _, _) in SEARCH_FIELDS.items():
+        if kind == 'station':
+            remove_document(connection, kind, station_id)
+            continue
+        record_ids = list(connection.execute(select(model.id).where(model.station_id == station_id)).scalars())
+        for start in range(0, len(record_ids), REBUILD_BATCH_SIZE):
+            remove_documents(connection, kind, record_ids[start:start + REBUILD_BATCH_SIZE])
+
+
+def index_documents(connection, kind, documents):
+    """Indexa (o reindexa) documentos dados como (record_id, station_id, título, cuerpo)."""
+    if not documents:
+        return
+    if fts5_available(connection):
+        connection.execute(text(
+            'INSERT OR REPLACE INTO search_index (rowid, title, body, kind, station_id) '
+            'VALUES (:rowid, :title, :body, :kind, :station_id)'
+        ), [
+            {'rowid': record_id * 4 + KIND_CODES[kind], 'title': title, 'body': body,
+             'kind': kind, 'station_id': station_id}
+            for record_id, station_id, title, body in documents
+        ])
+        return
+
+    rows = []
+    for record_id, station_id, title, body in documents:
+        remove_document(connection, kind, record_id)
+        weights = {}
+        for token in tokenize(title):
+            weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+        for token in tokenize(body):
+            weights[token] = weights.get(token, 0) + 1
+        rows.extend(
+            {'token': token, 'kind': kind, 'record_id': record_id, 'station_id': station_id, 'weight': weight}
+            for token, weight in weights.items()
+        )
+    if rows:
+        connection.execute(SearchToken.__table__.insert(), rows)
+
+
+def _search_fields_changed(kind, record):
+    state = inspect(record)
+    _, title_field, body_fields = SEARCH_FIELDS[kind]
+    return any(state.attrs[field].history.has_changes() for field in [title_field] + body_fields)
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_search_index(session, flush_context):
+    """Mantiene el índice de búsqueda al día en la misma transacción que los cambios."""
+    pending = {}
+    connection = None
+
+    for record in session.deleted:
+        kind = _kind_of(record)
+        if kind:
+            connection = connection or session.connection()
+            remove_document(connection, kind, record.id)
+
+    for record in list(session.new) + list(session.dirty):
+        kind = _kind_of(record)
+        if kind and (record in session.new or _search_fields_changed(kind, record)):
+            pending.setdefault(kind, []).append((record.id,) + _document(kind, record))
+
+    for kind, documents in pending.items():
+        connection = connection or session.connection()
+        index_documents(connection, kind, documents)
+
+
+def rebuild_search_index():
+    """Vacía y vuelve a llenar el índice de búsqueda por lotes."""
+    connection = db.session.connection()
+    if fts5_available(connection):
+        connection.exec_driver_sql('DROP TABLE IF EXISTS search_index')
+        create_search_index(connection)
+    else:
+        connection.execute(SearchToken.__table__.delete())
+
+    total = 0
+    for kind, (model, _, _) in SEARCH_FIELDS.items():
+        last_id = 0
+        while True:
+            batch = model.query.options(load_only(*_indexed_columns(kind))).filter(
+                model.id > last_id
+            ).order_by(model.id).limit(REBUILD_BATCH_SIZE).all()
+            if not batch:
+                break
+            index_documents(connection, kind, [(record.id,) + _document(kind, record) for record in batch])
+            last_id = batch[-1].id
+            total += len(batch)
+            db.session.expunge_all()
+    db.session.commit()
+    return total
+
+
+def _highlight(snippet):
+    # El snippet llega con marcadores \x02 ... \x03; se escapa el texto y se marcan las coincidencias
+    return Markup(str(escape(snippet)).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+
+
+def search(query, kind=None, page=1, per_page=RESULTS_PER_PAGE):
+    """Busca en estaciones, averías, intervenciones y detalles técnicos.
+
+    Devuelve (resultados, hay_más). Cada resultado es un dict con kind, record_id,
+    station_id, title y snippet, ordenados por relevancia.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return [], False
+
+    connection = db.session.connection()
+    offset = (page - 1) * per_page
+    params = {'limit': per_page + 1, 'offset': offset}
+
+    if fts5_available(connection):
+        params['match'] = ' '.join(f'"{token}"*' for token in tokens)
+        kind_filter = ''
+        if kind in KIND_CODES:
+            kind_filter = 'AND kind = :kind'
+            params['kind'] = kind
+        # Las estaciones eliminadas pendientes de purgar no aparecen en los resultados
+        rows = connection.execute(text(
+            'SELECT rowid, kind, station_id, title, '
+            "snippet(search_index, 1, char(2), char(3), '…', 16) "
+            'FROM search_index WHERE search_index MATCH :match ' + kind_filter +
+            ' AND station_id NOT IN (SELECT id FROM "Station" WHERE deleted_at IS NOT NULL)'
+            ' ORDER BY bm25(search_index, 10.0, 1.0) LIMIT :limit OFFSET :offset'
+        ), params).fetchall()
+        results = [
+            {'kind': row[1], 'record_id': row[0] // 4, 'station_id': row[2],
+             'title': row[3], 'snippet': _highlight(row[4])}
+            for row in rows
+        ]
+    else:
+        matches = db.session.query(
+            SearchToken.kind,
+            SearchToken.record_id,
+            func.max(SearchToken.station_id),
+            func.sum(SearchToken.weight).label('score')
+        ).filter(
+            SearchToken.token.in_(tokens),
+            SearchToken.station_id.notin_(select(Station.id).where(Station.deleted_at.isnot(None)))
+        )
+        if kind in KIND_CODES:
+            matches = matches.filter(SearchToken.kind == kind)
+        rows = matches.group_by(SearchToken.kind, SearchToken.record_id).having(
+            func.count(SearchToken.token) == len(set(tokens))
+        ).order_by(desc('score')).limit(per_page + 1).offset(offset).all()
+        results = [
+            {'kind': row[0], 'record_id': row[1], 'station_id': row[2]}
+            for row in rows
+        ]
+        _load_titles(results)
+
+    has_more = len(results) > per_page
+    return results[:per_page], has_more
+
+
+def _load_titles(results):
+    # El índice alternativo no guarda el texto: se lee el título del registro original
+    for kind, (model, title_field, body_fields) in SEARCH_FIELDS.items():
+        ids = [result['record_id'] for result in results if result['kind'] == kind]
+        if not ids:
+            continue
+        records = {record.id: record for record in model.query.filter(model.id.in_(ids))}
+        for result in results:
+            record = records.get(result['record_id']) if result['kind'] == kind else None
+            if record is not None:
+                _, title, body = _document(kind, record)
+                result['title'] = title
+                result['snippet'] = body[:160]
+
+
+search_cli = AppGroup('search', help='Índice de búsqueda de texto.')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Reconstruye el índice de búsqueda completo."""
+    total = rebuild_search_index()
+    click.echo(f'{total} registro(s) indexado(s)')
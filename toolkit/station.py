@@ -1,49 +1,97 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, abort, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from . import db
-from .station_models import Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, StationHistory
+from sqlalchemy.orm import defaultload, joinedload, selectinload
+from . import db, summary
+from .station_models import Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, StationHistory, StationPurge
+from .station_queries import list_stations_page, recent_history, history_page, breakdowns_page, interventions_page
+from .exports import EXPORT_QUERIES, EXPORT_FORMATS, export_rows
+from .importer import import_records
+from .fragments import invalidate_station
+from .history import buffer_change
+from .calibration import CALIBRATION_TYPE, mark_calibrated
+from .geo import location_fields, parse_coordinates, stations_within, nearest_stations, MAX_NEAREST, MAX_RADIUS_KM
+from .purge import soft_delete_station, delete_station_now, purge_to_dict
+from .runner import enqueue, job_path, wake_runner
+from .jobs import job_response
+from .bulk import (
+    parse_ids, bulk_resolve_breakdowns, bulk_complete_interventions,
+    bulk_delete_breakdowns, bulk_delete_interventions
+)
 from .utils import admin_required
+from collections import Counter
+from functools import partial
 from datetime import datetime
 
 stations = Blueprint('stations', __name__)
 
+def _station_or_404(station_id, *options):
+    # Las estaciones eliminadas pendientes de purgar no se muestran
+    station = db.session.get(Station, station_id, options=options)
+    if station is None or station.deleted_at is not None:
+        abort(404)
+    return station
+
 # Función auxiliar para registrar cambios
 def log_change(station_id, action, field=None, old_value=None, new_value=None, description=None):
-    history = StationHistory(
+    now = datetime.utcnow()
+    # Se inserta con el resto del historial de la transacción al confirmar
+    buffer_change(
+        db.session,
         station_id=station_id,
         action=action,
         field_changed=field,
         old_value=str(old_value) if old_value else None,
         new_value=str(new_value) if new_value else None,
         description=description,
-        changed_by=current_user.id
+        changed_by=current_user.id,
+        created_at=now
     )
-    db.session.add(history)
+    summary.touch(station_id, now)
 
 # Lista de estaciones
 @stations.route('/')
 @login_required
 def list_stations():
-    stations = Station.query.all()
-    return render_template('stations/list_stations.html', stations=stations)
+    filters = {
+        'island': request.args.get('island') or None,
+        'municipality': request.args.get('municipality') or None,
+        'status': request.args.get('status') or None,
+    }
+    after_id = request.args.get('after', type=int)
+    stations, next_id = list_stations_page(after_id=after_id, **filters)
+    return render_template(
+        'stations/list_stations.html',
+        stations=stations,
+        filters=filters,
+        after_id=after_id,
+        next_id=next_id
+    )
 
 # Ver vista general de una estación
 @stations.route('/<int:station_id>')
 @login_required
 def view_station(station_id):
-    station = Station.query.get_or_404(station_id)
-    recent_history = StationHistory.query.filter_by(station_id=station_id).order_by(StationHistory.created_at.desc()).limit(5).all()
-    recent_breakdowns = Breakdown.query.filter_by(station_id=station_id).order_by(Breakdown.reported_date.desc()).limit(3).all()
+    station = _station_or_404(
+        station_id,
+        joinedload(Station.summary),
+        joinedload(Station.router),
+        # Las averías activas se cargan al usarlas (sólo si el fragmento no está en caché), con su usuario
+        defaultload(Station.active_breakdowns).joinedload(Breakdown.reporter)
+    )
+    # Consultas sin ejecutar: la plantilla sólo las lanza si el fragmento no está en caché
+    # El historial mezcla registros recientes y archivados: se pasa como función
+    history = partial(recent_history, station_id)
+    recent_breakdowns = Breakdown.query.filter_by(station_id=station_id).order_by(Breakdown.reported_date.desc()).limit(3)
     recent_interventions = Intervention.query.filter(
         Intervention.station_id == station_id,
         Intervention.technician_name.isnot(None)
     ).order_by(
         Intervention.created_at.desc()
-    ).limit(3).all()
+    ).limit(3)
     return render_template(
         'stations/view_station.html',
         station=station,
-        recent_history=recent_history,
+        recent_history=history,
         recent_breakdowns=recent_breakdowns,
         recent_interventions=recent_interventions
     )
@@ -52,9 +100,13 @@ def view_station(station_id):
 @stations.route('/<int:station_id>/details')
 @login_required
 def view_station_details(station_id):
-    station = Station.query.get_or_404(station_id)
-    recent_history = StationHistory.query.filter_by(station_id=station_id).order_by(StationHistory.created_at.desc()).limit(5).all()
-    return render_template('stations/view_station_details.html', station=station, recent_history=recent_history)
+    station = _station_or_404(
+        station_id,
+        joinedload(Station.router),
+        selectinload(Station.sensors),
+        selectinload(Station.technical_details)
+    )
+    return render_template('stations/view_station_details.html', station=station)
 
 # Crear nueva estación
 @stations.route('/new', methods=['GET', 'POST'])
@@ -77,6 +129,12 @@ def create_station():
             flash('Ya existe una estación con ese nombre', 'danger')
             return redirect(url_for('stations.create_station'))
         
+        try:
+            position = location_fields(coordinates)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('stations.create_station'))
+        
         # Crear estación
         station = Station(
             name=name,
@@ -89,7 +147,8 @@ def create_station():
             required_vehicle=required_vehicle,
             measurement_type=measurement_type,
             status=status,
-            created_by=current_user.id
+            created_by=current_user.id,
+            **position
         )
         
         db.session.add(station)
@@ -104,20 +163,67 @@ def create_station():
     
     return render_template('stations/create_station.html')
 
+# Importación masiva de estaciones, sensores, routers y detalles técnicos (solo admin)
+@stations.route('/import', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_stations():
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Selecciona un fichero CSV o JSON', 'danger')
+            return redirect(url_for('stations.import_stations'))
+
+        dry_run = request.form.get('dry_run') == 'on'
+        if request.form.get('background') == 'on':
+            # El fichero se guarda con el trabajo y se importa fuera de la petición
+            job = enqueue('import_records', {'filename': upload.filename, 'dry_run': dry_run}, current_user.id)
+            upload.save(job_path(job.id, 'upload'))
+            db.session.commit()
+            wake_runner()
+            flash(f'Importación en segundo plano (trabajo {job.id}): el resultado estará en '
+                  f'{url_for("jobs.job_result", job_id=job.id)}', 'info')
+            return redirect(url_for('stations.import_stations'))
+        result = import_records(upload.read(), upload.filename, current_user.id, dry_run=dry_run)
+        if result.ok and not dry_run:
+            flash(f'Importación completada: {result.created["station"]} estaciones, '
+                  f'{result.created["sensor"]} sensores, {result.created["router"]} routers, '
+                  f'{result.created["detail"]} detalles técnicos', 'success')
+            return redirect(url_for('stations.list_stations'))
+        if result.ok:
+            flash('El fichero es válido. No se ha importado nada (solo validación).', 'info')
+        else:
+            flash(f'El fichero tiene {len(result.errors)} error(es). No se ha importado nada.', 'danger')
+
+    return render_template('stations/import_stations.html', result=result)
+
 # Editar estación
 @stations.route('/<int:station_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_station(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     
     if request.method == 'POST':
+        coordinates = request.form.get('coordinates')
+        # Sólo se validan si cambian: las estaciones antiguas con coordenadas que no se
+        # entienden se pueden seguir editando (se quedan sin posición)
+        if coordinates != station.coordinates:
+            try:
+                position = location_fields(coordinates)
+            except ValueError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('stations.edit_station', station_id=station_id))
+            station.latitude = position['latitude']
+            station.longitude = position['longitude']
+        
         old_status = station.status
         
         station.name = request.form.get('name')
         station.island = request.form.get('island')
         station.municipality = request.form.get('municipality')
         station.location = request.form.get('location')
-        station.coordinates = request.form.get('coordinates')
+        station.coordinates = coordinates
         station.contact = request.form.get('contact')
         station.how_to_get = request.form.get('how_to_get')
         station.required_vehicle = request.form.get('required_vehicle')
@@ -141,18 +247,110 @@ def edit_station(station_id):
 @login_required
 @admin_required
 def delete_station(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     station_name = station.name
-    db.session.delete(station)
-    db.session.commit()
-    flash(f'Estación {station_name} eliminada exitosamente', 'success')
+
+    if current_app.config.get('STATION_SOFT_DELETE'):
+        # Borrado lógico: se oculta ya y los registros se purgan por lotes en un trabajo
+        purge = soft_delete_station(station, current_user.id)
+        job = None
+        if current_app.config.get('STATION_PURGE_WORKER'):
+            job = enqueue('purge_station', {'purge_id': purge.id}, current_user.id)
+        db.session.commit()
+        invalidate_station(station_id)
+        if job is not None:
+            wake_runner()
+        message = f'Estación {station_name} eliminada; sus registros se purgan en segundo plano'
+    elif current_app.config['JOB_WORKER']:
+        # Los registros dependientes los borra la base de datos (ON DELETE CASCADE) en un trabajo
+        job = enqueue('delete_station', {'station_id': station_id}, current_user.id)
+        db.session.commit()
+        wake_runner()
+        message = f'Estación {station_name} eliminándose en segundo plano (trabajo {job.id})'
+    else:
+        # Sin runner en el proceso, el trabajo esperaría a 'flask jobs work': se borra ya
+        job = None
+        delete_station_now(station)
+        message = f'Estación {station_name} eliminada'
+
+    if _wants_json():
+        return job_response(job, 202) if job is not None else (jsonify({'deleted': station_id}), 200)
+    flash(message, 'success')
     return redirect(url_for('stations.list_stations'))
 
+# Progreso de las purgas de estaciones eliminadas
+@stations.route('/purges')
+@login_required
+@admin_required
+def purge_status():
+    purges = StationPurge.query.order_by(StationPurge.id.desc()).limit(50).all()
+    return jsonify({'purges': [purge_to_dict(purge) for purge in purges]})
+
+def _location_arguments():
+    # Centro de la búsqueda: lat y lon, o la posición de una estación (que se excluye)
+    station_id = request.args.get('station_id', type=int)
+    if station_id is not None:
+        station = _station_or_404(station_id)
+        if station.latitude is None:
+            raise ValueError(f'La estación {station.name} no tiene coordenadas válidas')
+        return station.latitude, station.longitude, station_id
+    location = parse_coordinates(f"{request.args.get('lat', '')}, {request.args.get('lon', '')}")
+    return location[0], location[1], None
+
+def _nearby_to_dict(distance, row):
+    return {
+        'id': row.id,
+        'name': row.name,
+        'island': row.island,
+        'municipality': row.municipality,
+        'status': row.status,
+        'latitude': row.latitude,
+        'longitude': row.longitude,
+        'distance_km': round(distance, 3),
+        'url': url_for('stations.view_station', station_id=row.id),
+    }
+
+# Estaciones en un radio (JSON): ?lat=&lon= o ?station_id=, y radius_km
+@stations.route('/nearby')
+@login_required
+def nearby():
+    try:
+        latitude, longitude, exclude = _location_arguments()
+        radius_km = request.args.get('radius_km', 10.0, type=float)
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            raise ValueError(f'radius_km debe estar entre 0 y {MAX_RADIUS_KM:g}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    results = stations_within(latitude, longitude, radius_km, exclude=exclude)
+    return jsonify({
+        'center': {'latitude': latitude, 'longitude': longitude},
+        'radius_km': radius_km,
+        'stations': [_nearby_to_dict(distance, row) for distance, row in results],
+    })
+
+# Las k estaciones más cercanas (JSON): ?lat=&lon= o ?station_id=, y k
+@stations.route('/nearest')
+@login_required
+def nearest():
+    try:
+        latitude, longitude, exclude = _location_arguments()
+        k = request.args.get('k', 5, type=int)
+        if not 0 < k <= MAX_NEAREST:
+            raise ValueError(f'k debe estar entre 1 y {MAX_NEAREST}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    results = nearest_stations(latitude, longitude, k, exclude=exclude)
+    return jsonify({
+        'center': {'latitude': latitude, 'longitude': longitude},
+        'k': k,
+        'stations': [_nearby_to_dict(distance, row) for distance, row in results],
+    })
+
 # Añadir sensor
 @stations.route('/<int:station_id>/sensors/add', methods=['GET', 'POST'])
 @login_required
 def add_sensor(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     
     if request.method == 'POST':
         sensor = Sensor(
@@ -164,6 +362,7 @@ def add_sensor(station_id):
             installation_date=datetime.strptime(request.form.get('installation_date'), '%Y-%m-%d') if request.form.get('installation_date') else None
         )
         
+        summary.sensor_added(station_id, sensor.status)
         db.session.add(sensor)
         log_change(station_id, 'sensor_added', description=f'Sensor {sensor.sensor_type} añadido')
         db.session.commit()
@@ -177,10 +376,11 @@ def add_sensor(station_id):
 @stations.route('/<int:station_id>/sensors/<int:sensor_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_sensor(station_id, sensor_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     sensor = Sensor.query.filter_by(id=sensor_id, station_id=station_id).first_or_404()
 
     if request.method == 'POST':
+        summary.sensor_status_changed(station_id, sensor.status, request.form.get('status', 'operativo'))
         sensor.sensor_type = request.form.get('sensor_type')
         sensor.model = request.form.get('model')
         sensor.serial_number = request.form.get('serial_number')
@@ -201,6 +401,7 @@ def edit_sensor(station_id, sensor_id):
 def delete_sensor(station_id, sensor_id):
     sensor = Sensor.query.filter_by(id=sensor_id, station_id=station_id).first_or_404()
     sensor_label = sensor.model or sensor.sensor_type
+    summary.sensor_removed(station_id, sensor.status)
     db.session.delete(sensor)
     log_change(station_id, 'sensor_deleted', description=f'Sensor {sensor_label} eliminado')
     db.session.commit()
@@ -212,7 +413,7 @@ def delete_sensor(station_id, sensor_id):
 @stations.route('/<int:station_id>/router', methods=['GET', 'POST'])
 @login_required
 def configure_router(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     router = station.router
     
     if request.method == 'POST':
@@ -225,6 +426,7 @@ def configure_router(station_id):
         router.serial_number = request.form.get('serial_number')
         router.firmware_version = request.form.get('firmware_version')
         router.status = request.form.get('status', 'online')
+        summary.router_changed(station_id, router.status)
         
         db.session.add(router)
         log_change(station_id, 'router_configured', description='Router configurado/actualizado')
@@ -239,7 +441,7 @@ def configure_router(station_id):
 @stations.route('/<int:station_id>/details/add', methods=['GET', 'POST'])
 @login_required
 def add_technical_detail(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     
     if request.method == 'POST':
         detail = TechnicalDetail(
@@ -262,7 +464,7 @@ def add_technical_detail(station_id):
 @stations.route('/<int:station_id>/details/<int:detail_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_technical_detail(station_id, detail_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     detail = TechnicalDetail.query.filter_by(id=detail_id, station_id=station_id).first_or_404()
 
     if request.method == 'POST':
@@ -295,7 +497,7 @@ def delete_technical_detail(station_id, detail_id):
 @stations.route('/<int:station_id>/breakdowns/report', methods=['GET', 'POST'])
 @login_required
 def report_breakdown(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     
     if request.method == 'POST':
         breakdown = Breakdown(
@@ -306,6 +508,7 @@ def report_breakdown(station_id):
             reported_by=current_user.id
         )
         
+        summary.breakdown_opened(station_id, breakdown.severity)
         db.session.add(breakdown)
         log_change(station_id, 'breakdown_reported', description=f'Avería reportada: {breakdown.title}')
         db.session.commit()
@@ -322,6 +525,8 @@ def resolve_breakdown(breakdown_id):
     breakdown = Breakdown.query.get_or_404(breakdown_id)
     
     if request.method == 'POST':
+        if not breakdown.resolved:
+            summary.breakdown_closed(breakdown.station_id, breakdown.severity)
         breakdown.resolved = True
         breakdown.resolved_date = datetime.utcnow()
         breakdown.resolved_by = current_user.id
@@ -339,7 +544,7 @@ def resolve_breakdown(breakdown_id):
 @stations.route('/<int:station_id>/interventions/schedule', methods=['GET', 'POST'])
 @login_required
 def schedule_intervention(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
 
     if request.method == 'POST':
         intervention = Intervention(
@@ -352,6 +557,7 @@ def schedule_intervention(station_id):
             performed_by=current_user.id
         )
 
+        summary.intervention_scheduled(station_id)
         db.session.add(intervention)
         log_change(station_id, 'intervention_scheduled', description=f'Intervención programada: {intervention.title}')
         db.session.commit()
@@ -368,19 +574,25 @@ def complete_intervention(intervention_id):
     intervention = Intervention.query.get_or_404(intervention_id)
 
     if request.method == 'POST':
+        if intervention.technician_name is None:
+            summary.intervention_closed(intervention.station_id)
         intervention.intervention_date = datetime.utcnow()
         intervention.technician_name = current_user.username
         intervention.performed_by = current_user.id
+        if intervention.intervention_type == CALIBRATION_TYPE:
+            mark_calibrated([intervention.id], intervention.intervention_date)
 
+        station_id = intervention.station_id
         log_change(
-            intervention.station_id,
+            station_id,
             'intervention_completed',
             description=f'Intervención realizada: {intervention.title}'
         )
         db.session.commit()
 
         flash('Intervención marcada como realizada', 'success')
-        return redirect(url_for('stations.view_station', station_id=intervention.station_id))
+        # station_id leído antes de confirmar: tras el commit la intervención se recargaría
+        return redirect(url_for('stations.view_station', station_id=station_id))
 
     return render_template('stations/complete_intervention.html', intervention=intervention)
 
@@ -388,7 +600,7 @@ def complete_intervention(intervention_id):
 @stations.route('/<int:station_id>/interventions/add', methods=['GET', 'POST'])
 @login_required
 def add_intervention(station_id):
-    station = Station.query.get_or_404(station_id)
+    station = _station_or_404(station_id)
     
     if request.method == 'POST':
         intervention = Intervention(
@@ -414,9 +626,15 @@ def add_intervention(station_id):
 @stations.route('/<int:station_id>/history')
 @login_required
 def view_history(station_id):
-    station = Station.query.get_or_404(station_id)
-    history = StationHistory.query.filter_by(station_id=station_id).order_by(StationHistory.created_at.desc()).all()
-    return render_template('stations/view_history.html', station=station, history=history)
+    station = _station_or_404(station_id)
+    history, next_cursor = history_page(station_id, request.args.get('cursor'))
+    return render_template(
+        'stations/view_history.html',
+        station=station,
+        history=history,
+        cursor=request.args.get('cursor'),
+        next_cursor=next_cursor
+    )
 
 # Eliminar registro de historial (solo admin)
 @stations.route('/history/<int:history_id>/delete', methods=['POST'])
@@ -425,6 +643,7 @@ def view_history(station_id):
 def delete_history_record(history_id):
     history_record = StationHistory.query.get_or_404(history_id)
     station_id = history_record.station_id
+    summary.bump(station_id)
     db.session.delete(history_record)
     db.session.commit()
     flash('Registro de historial eliminado', 'success')
@@ -434,9 +653,15 @@ def delete_history_record(history_id):
 @stations.route('/<int:station_id>/breakdowns/history')
 @login_required
 def view_breakdowns_history(station_id):
-    station = Station.query.get_or_404(station_id)
-    breakdowns = Breakdown.query.filter_by(station_id=station_id).order_by(Breakdown.reported_date.desc()).all()
-    return render_template('stations/view_breakdowns_history.html', station=station, breakdowns=breakdowns)
+    station = _station_or_404(station_id)
+    breakdowns, next_cursor = breakdowns_page(station_id, request.args.get('cursor'))
+    return render_template(
+        'stations/view_breakdowns_history.html',
+        station=station,
+        breakdowns=breakdowns,
+        cursor=request.args.get('cursor'),
+        next_cursor=next_cursor
+    )
 
 # Eliminar avería (solo admin)
 @stations.route('/breakdowns/<int:breakdown_id>/delete', methods=['POST'])
@@ -445,6 +670,9 @@ def view_breakdowns_history(station_id):
 def delete_breakdown(breakdown_id):
     breakdown = Breakdown.query.get_or_404(breakdown_id)
     station_id = breakdown.station_id
+    if not breakdown.resolved:
+        summary.breakdown_closed(station_id, breakdown.severity)
+    summary.bump(station_id)
     db.session.delete(breakdown)
     db.session.commit()
     flash('Avería eliminada', 'success')
@@ -454,11 +682,15 @@ def delete_breakdown(breakdown_id):
 @stations.route('/<int:station_id>/interventions/history')
 @login_required
 def view_interventions_history(station_id):
-    station = Station.query.get_or_404(station_id)
-    interventions = Intervention.query.filter_by(station_id=station_id).order_by(
-        Intervention.created_at.desc()
-    ).all()
-    return render_template('stations/view_interventions_history.html', station=station, interventions=interventions)
+    station = _station_or_404(station_id)
+    interventions, next_cursor = interventions_page(station_id, request.args.get('cursor'))
+    return render_template(
+        'stations/view_interventions_history.html',
+        station=station,
+        interventions=interventions,
+        cursor=request.args.get('cursor'),
+        next_cursor=next_cursor
+    )
 
 # Eliminar intervención (solo admin)
 @stations.route('/interventions/<int:intervention_id>/delete', methods=['POST'])
@@ -467,7 +699,115 @@ def view_interventions_history(station_id):
 def delete_intervention(intervention_id):
     intervention = Intervention.query.get_or_404(intervention_id)
     station_id = intervention.station_id
+    if intervention.technician_name is None:
+        summary.intervention_closed(station_id)
+    summary.bump(station_id)
     db.session.delete(intervention)
     db.session.commit()
     flash('Intervención eliminada', 'success')
     return redirect(url_for('stations.view_interventions_history', station_id=station_id))
+
+# Operaciones masivas: reciben ids[] por formulario o {"ids": [...]} en JSON
+def _wants_json():
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
+
+
+def _bulk_redirect():
+    # Sólo rutas internas, para no redirigir fuera de la aplicación
+    next_page = request.form.get('next', '')
+    if next_page.startswith('/') and not next_page.startswith('//'):
+        return redirect(next_page)
+    return redirect(url_for('triage.index'))
+
+
+def _bulk_action(action, done_message):
+    data = request.get_json(silent=True) if request.is_json else {}
+    try:
+        if not isinstance(data, dict):
+            raise ValueError('Se esperaba {"ids": [...]}')
+        ids = parse_ids(data.get('ids', []) if request.is_json else request.form.getlist('ids'))
+        # La acción valida sus propios campos antes de escribir
+        outcomes = action(ids, data) if ids else {}
+    except ValueError as e:
+        if _wants_json():
+            return jsonify({'error': str(e)}), 400
+        flash(str(e), 'danger')
+        return _bulk_redirect()
+
+    db.session.commit()
+
+    counts = Counter(outcomes.values())
+    if _wants_json():
+        return jsonify({'results': {str(record_id): outcome for record_id, outcome in outcomes.items()},
+                        'counts': counts})
+    done = sum(counts[outcome] for outcome in ('resolved', 'completed', 'deleted'))
+    skipped = len(outcomes) - done
+    flash(done_message.format(done) + (f' ({skipped} sin cambios)' if skipped else ''),
+          'success' if done else 'warning')
+    return _bulk_redirect()
+
+
+@stations.route('/breakdowns/bulk-resolve', methods=['POST'])
+@login_required
+def bulk_resolve_breakdowns_route():
+    def action(ids, data):
+        notes = data.get('resolution_notes') if request.is_json else request.form.get('resolution_notes')
+        if notes is not None and not isinstance(notes, str):
+            raise ValueError('resolution_notes debe ser un texto')
+        return bulk_resolve_breakdowns(ids, current_user.id, notes or None)
+    return _bulk_action(action, '{} avería(s) resuelta(s)')
+
+
+@stations.route('/interventions/bulk-complete', methods=['POST'])
+@login_required
+def bulk_complete_interventions_route():
+    def action(ids, data):
+        return bulk_complete_interventions(ids, current_user.id, current_user.username)
+    return _bulk_action(action, '{} intervención(es) realizada(s)')
+
+
+@stations.route('/breakdowns/bulk-delete', methods=['POST'])
+@login_required
+@admin_required
+def bulk_delete_breakdowns_route():
+    return _bulk_action(lambda ids, data: bulk_delete_breakdowns(ids), '{} avería(s) eliminada(s)')
+
+
+@stations.route('/interventions/bulk-delete', methods=['POST'])
+@login_required
+@admin_required
+def bulk_delete_interventions_route():
+    return _bulk_action(lambda ids, data: bulk_delete_interventions(ids), '{} intervención(es) eliminada(s)')
+
+# Exportar historial, averías o intervenciones (CSV o JSONL, en streaming)
+@stations.route('/<int:station_id>/export/<kind>')
+@login_required
+def export_station_records(station_id, kind):
+    station = _station_or_404(station_id)
+    fmt = request.args.get('format', 'csv')
+    if kind not in EXPORT_QUERIES:
+        abort(404)
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+
+    filename = f'estacion_{station.id}_{kind}.{fmt}'
+    return Response(
+        stream_with_context(export_rows(kind, station_id, fmt)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+# Exportación en segundo plano: devuelve el trabajo; el fichero se descarga de su resultado
+@stations.route('/<int:station_id>/export/<kind>/job', methods=['POST'])
+@login_required
+def export_station_records_job(station_id, kind):
+    _station_or_404(station_id)
+    fmt = request.args.get('format', 'csv')
+    if kind not in EXPORT_QUERIES:
+        abort(404)
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    job = enqueue('export_records', {'station_id': station_id, 'kind': kind, 'fmt': fmt}, current_user.id)
+    db.session.commit()
+    wake_runner()
+    return job_response(job, 202)
@@ -11,63 +11,112 @@ class Station(db.Model):
     municipality = db.Column(db.String(100), nullable=False)
     location = db.Column(db.String(200), nullable=False)
     coordinates = db.Column(db.String(100), nullable=True)
+    # Posición en grados decimales, leída de coordinates (geo.parse_coordinates)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
     contact = db.Column(db.String(200), nullable=True)
     how_to_get = db.Column(db.Text, nullable=True)
     required_vehicle = db.Column(db.String(20), nullable=True)  # normal, 4x4
     measurement_type = db.Column(db.String(50), nullable=True)
     status = db.Column(db.String(20), default='activa')  # activa, inactiva, mantenimiento, averiada
+    # Borrado lógico: la estación deja de mostrarse y sus datos se purgan por lotes
+    deleted_at = db.Column(db.DateTime, nullable=True)
     
-    # Relaciones
-    sensors = db.relationship('Sensor', backref='station', lazy=True, cascade='all, delete-orphan')
-    router = db.relationship('Router', backref='station', uselist=False, cascade='all, delete-orphan')
-    technical_details = db.relationship('TechnicalDetail', backref='station', lazy=True, cascade='all, delete-orphan')
-    breakdowns = db.relationship('Breakdown', backref='station', lazy=True, cascade='all, delete-orphan')
-    interventions = db.relationship('Intervention', backref='station', lazy=True, cascade='all, delete-orphan')
-    history = db.relationship('StationHistory', backref='station', lazy=True, cascade='all, delete-orphan')
+    __table_args__ = (
+        db.Index('ix_station_island_municipality', 'island', 'municipality'),
+        db.Index('ix_station_status', 'status'),
+        db.Index('ix_station_created_by', 'created_by'),
+        # Búsquedas por posición en bases de datos sin R*Tree (geo.py)
+        db.Index('ix_station_lat_lon', 'latitude', 'longitude'),
+        # Índice parcial: sólo las estaciones eliminadas pendientes de purgar
+        db.Index('ix_station_deleted', 'id',
+                 sqlite_where=deleted_at.isnot(None), postgresql_where=deleted_at.isnot(None)),
+    )
+    
+    # Relaciones. Los registros dependientes se borran en la base de datos
+    # (ON DELETE CASCADE): con passive_deletes el ORM no los carga al borrar la estación
+    sensors = db.relationship('Sensor', backref='station', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    router = db.relationship('Router', backref='station', uselist=False, cascade='all, delete-orphan', passive_deletes=True)
+    technical_details = db.relationship('TechnicalDetail', backref='station', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    breakdowns = db.relationship('Breakdown', backref='station', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    interventions = db.relationship('Intervention', backref='station', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    history = db.relationship('StationHistory', backref='station', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    summary = db.relationship('StationSummary', backref='station', uselist=False, cascade='all, delete-orphan', passive_deletes=True)
+    
+    # Relaciones filtradas de sólo lectura: averías activas e intervenciones
+    # pendientes, sin cargar las colecciones completas
+    active_breakdowns = db.relationship(
+        'Breakdown', viewonly=True, order_by='Breakdown.id',
+        primaryjoin='and_(Station.id == foreign(Breakdown.station_id), Breakdown.resolved.is_(False))'
+    )
+    active_interventions = db.relationship(
+        'Intervention', viewonly=True, order_by='Intervention.id',
+        primaryjoin='and_(Station.id == foreign(Intervention.station_id), Intervention.technician_name.is_(None))'
+    )
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     @property
-    def active_breakdowns(self):
-        """Averías activas (no resueltas)"""
-        return [b for b in self.breakdowns if not b.resolved]
-    
+    def active_breakdowns_count(self):
+        """Número de averías activas (leído del resumen)"""
+        if self.summary is None:
+            return Breakdown.query.filter(
+                Breakdown.station_id == self.id,
+                Breakdown.resolved.is_(False)
+            ).count()
+        return self.summary.open_breakdowns
+
     @property
     def has_active_breakdowns(self):
         """¿Tiene averías activas?"""
-        return len(self.active_breakdowns) > 0
+        return self.active_breakdowns_count > 0
 
     @property
-    def active_interventions(self):
-        """Intervenciones programadas pendientes de realizar."""
-        return [i for i in self.interventions if i.technician_name is None]
+    def active_interventions_count(self):
+        """Número de intervenciones programadas pendientes (leído del resumen)"""
+        if self.summary is None:
+            return Intervention.query.filter(
+                Intervention.station_id == self.id,
+                Intervention.technician_name.is_(None)
+            ).count()
+        return self.summary.pending_interventions
 
     @property
     def has_active_interventions(self):
         """¿Tiene intervenciones programadas activas?"""
-        return len(self.active_interventions) > 0
+        return self.active_interventions_count > 0
     
     def __repr__(self):
         return f'<Station {self.name}>'
 
 
+# Estados de los sensores: los valores del formulario de edición (edit_sensor.html)
+SENSOR_CALIBRATING = 'en_calibracion'
+SENSOR_STATUSES = ['operativo', 'averiado', SENSOR_CALIBRATING]
+
+
 class Sensor(db.Model):
     __tablename__ = 'sensor'
     
     id = db.Column(db.Integer, primary_key=True)
-    station_id = db.Column(db.Integer, db.ForeignKey('Station.id'), nullable=False)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False, index=True)
     sensor_type = db.Column(db.String(50), nullable=False)  # temperatura, humedad, presión, viento, lluvia
     model = db.Column(db.String(100), nullable=True)
     serial_number = db.Column(db.String(100), nullable=True)
-    status = db.Column(db.String(20), default='operativo')  # operativo, averiado, en_calibración
+    status = db.Column(db.String(20), default='operativo')  # SENSOR_STATUSES
     installation_date = db.Column(db.DateTime, nullable=True)
     last_calibration = db.Column(db.DateTime, nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Calibraciones pendientes: una condición (tipo, última calibración) por tipo de sensor
+        db.Index('ix_sensor_calibration', 'sensor_type', 'last_calibration'),
+    )
+    
     def __repr__(self):
         return f'<Sensor {self.sensor_type} - {self.model}>'
 
@@ -76,7 +125,7 @@ class Router(db.Model):
     __tablename__ = 'router'
     
     id = db.Column(db.Integer, primary_key=True)
-    station_id = db.Column(db.Integer, db.ForeignKey('Station.id'), nullable=False)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False, index=True)
     model = db.Column(db.String(100), nullable=False)
     ip_address = db.Column(db.String(45), nullable=True)  # IPv4 o IPv6
     mac_address = db.Column(db.String(17), nullable=True)
@@ -95,7 +144,7 @@ class TechnicalDetail(db.Model):
     __tablename__ = 'technical_detail'
     
     id = db.Column(db.Integer, primary_key=True)
-    station_id = db.Column(db.Integer, db.ForeignKey('Station.id'), nullable=False)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False, index=True)
     detail_type = db.Column(db.String(50), nullable=False)  # alimentación, conectividad, estructura, etc.
     key = db.Column(db.String(100), nullable=False)  # ej: "Tipo de alimentación"
     value = db.Column(db.Text, nullable=False)  # ej: "Solar + Batería de respaldo"
@@ -111,7 +160,7 @@ class Breakdown(db.Model):
     __tablename__ = 'breakdown'
     
     id = db.Column(db.Integer, primary_key=True)
-    station_id = db.Column(db.Integer, db.ForeignKey('Station.id'), nullable=False)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     severity = db.Column(db.String(20), default='media')  # baja, media, alta, crítica
@@ -120,8 +169,8 @@ class Breakdown(db.Model):
     resolved = db.Column(db.Boolean, default=False)
     resolution_notes = db.Column(db.Text, nullable=True)
     
-    reported_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    resolved_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    reported_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    resolved_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
     
     # Relación con usuario que reportó
     reporter = db.relationship('User', foreign_keys=[reported_by])
@@ -130,6 +179,16 @@ class Breakdown(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_breakdown_station_reported', 'station_id', 'reported_date', 'id'),
+        # Índice parcial: sólo las averías activas
+        db.Index('ix_breakdown_open', 'station_id', 'severity',
+                 sqlite_where=resolved.is_(False), postgresql_where=resolved.is_(False)),
+        # Cola de trabajo de toda la flota: por severidad y antigüedad
+        db.Index('ix_breakdown_queue', 'severity', 'reported_date', 'id',
+                 sqlite_where=resolved.is_(False), postgresql_where=resolved.is_(False)),
+    )
+    
     @property
     def duration(self):
         """Duración de la avería"""
@@ -145,38 +204,373 @@ class Intervention(db.Model):
     __tablename__ = 'intervention'
     
     id = db.Column(db.Integer, primary_key=True)
-    station_id = db.Column(db.Integer, db.ForeignKey('Station.id'), nullable=False)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False)
     intervention_type = db.Column(db.String(50), nullable=False)  # mantenimiento, reparación, calibración, instalación
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     intervention_date = db.Column(db.DateTime, default=datetime.utcnow)
     technician_name = db.Column(db.String(100), nullable=True)
     
-    performed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    performed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     technician = db.relationship('User', foreign_keys=[performed_by])
     
+    # Sensores a los que se refiere (calibraciones programadas)
+    sensors = db.relationship('Sensor', secondary='intervention_sensor', passive_deletes=True)
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_intervention_station_created', 'station_id', 'created_at', 'id'),
+        # Índice parcial: sólo las intervenciones programadas pendientes
+        db.Index('ix_intervention_pending', 'station_id',
+                 sqlite_where=technician_name.is_(None), postgresql_where=technician_name.is_(None)),
+        db.Index('ix_intervention_queue', 'created_at', 'id',
+                 sqlite_where=technician_name.is_(None), postgresql_where=technician_name.is_(None)),
+    )
+    
     def __repr__(self):
         return f'<Intervention {self.title}>'
 
 
+intervention_sensor = db.Table(
+    'intervention_sensor',
+    db.Column('intervention_id', db.Integer, db.ForeignKey('intervention.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('sensor_id', db.Integer, db.ForeignKey('sensor.id', ondelete='CASCADE'), primary_key=True, index=True),
+)
+
+
 class StationHistory(db.Model):
     __tablename__ = 'station_history'
     
     id = db.Column(db.Integer, primary_key=True)
-    station_id = db.Column(db.Integer, db.ForeignKey('Station.id'), nullable=False)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False)
     action = db.Column(db.String(50), nullable=False)  # created, updated, status_changed, etc.
     field_changed = db.Column(db.String(100), nullable=True)  # Campo que cambió
     old_value = db.Column(db.Text, nullable=True)
     new_value = db.Column(db.Text, nullable=True)
     description = db.Column(db.Text, nullable=True)
     
-    changed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    changed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     user = db.relationship('User', foreign_keys=[changed_by])
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_station_history_station_created', 'station_id', 'created_at', 'id'),
+    )
+    
+    # Los registros archivados (ArchivedHistory) se leen de segmentos comprimidos
+    archived = False
+    
     def __repr__(self):
         return f'<StationHistory {self.action}>'
+
+
+class HistorySegment(db.Model):
+    """Fichero comprimido con registros antiguos del historial de una estación.
+
+    Los segmentos no se modifican nunca: cada archivado escribe ficheros nuevos
+    y la retención borra segmentos completos.
+    """
+    __tablename__ = 'history_segment'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(255), nullable=False)  # relativa al directorio del archivo
+    rows = db.Column(db.Integer, nullable=False)
+    
+    # Rango de fechas de los registros del segmento
+    first_created_at = db.Column(db.DateTime, nullable=False)
+    last_created_at = db.Column(db.DateTime, nullable=False)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('station_id', 'sequence', name='uq_history_segment_station_sequence'),
+        db.Index('ix_history_segment_station_last', 'station_id', 'last_created_at'),
+    )
+    
+    def __repr__(self):
+        return f'<HistorySegment {self.station_id}/{self.sequence}>'
+
+
+class StationSummary(db.Model):
+    """Contadores desnormalizados por estación, mantenidos por las rutas de escritura."""
+    __tablename__ = 'station_summary'
+    
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), primary_key=True)
+    
+    # Averías activas por severidad
+    open_breakdowns = db.Column(db.Integer, nullable=False, default=0)
+    open_breakdowns_low = db.Column(db.Integer, nullable=False, default=0)  # baja
+    open_breakdowns_medium = db.Column(db.Integer, nullable=False, default=0)  # media
+    open_breakdowns_high = db.Column(db.Integer, nullable=False, default=0)  # alta
+    open_breakdowns_critical = db.Column(db.Integer, nullable=False, default=0)  # crítica
+    
+    pending_interventions = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Sensores por estado
+    sensors_total = db.Column(db.Integer, nullable=False, default=0)
+    sensors_operational = db.Column(db.Integer, nullable=False, default=0)  # operativo
+    sensors_faulty = db.Column(db.Integer, nullable=False, default=0)  # averiado
+    sensors_calibrating = db.Column(db.Integer, nullable=False, default=0)  # en_calibracion (SENSOR_CALIBRATING)
+    
+    router_status = db.Column(db.String(20), nullable=True)  # None si no hay router
+    last_activity = db.Column(db.DateTime, nullable=True)
+    
+    # Se incrementa con cada cambio de la estación; forma parte de la clave de la caché de fragmentos
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    def __repr__(self):
+        return f'<StationSummary {self.station_id}>'
+
+
+class ReliabilityRollup(db.Model):
+    """Agregados diarios por estación para los indicadores de fiabilidad.
+
+    Las averías cuentan el día en que se reportan (y, si están resueltas, el día
+    de resolución junto con su tiempo de reparación); las intervenciones, el día
+    en que se registran.
+    """
+    __tablename__ = 'reliability_rollup'
+    
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    
+    # Averías reportadas ese día, en total y por severidad
+    breakdowns_reported = db.Column(db.Integer, nullable=False, default=0)
+    breakdowns_low = db.Column(db.Integer, nullable=False, default=0)  # baja
+    breakdowns_medium = db.Column(db.Integer, nullable=False, default=0)  # media
+    breakdowns_high = db.Column(db.Integer, nullable=False, default=0)  # alta
+    breakdowns_critical = db.Column(db.Integer, nullable=False, default=0)  # crítica
+    
+    # Averías resueltas ese día y suma de sus tiempos de reparación
+    breakdowns_resolved = db.Column(db.Integer, nullable=False, default=0)
+    repair_hours = db.Column(db.Float, nullable=False, default=0.0)
+    
+    # Intervenciones registradas ese día, en total y por tipo
+    interventions = db.Column(db.Integer, nullable=False, default=0)
+    interventions_maintenance = db.Column(db.Integer, nullable=False, default=0)  # mantenimiento
+    interventions_repair = db.Column(db.Integer, nullable=False, default=0)  # reparación
+    interventions_calibration = db.Column(db.Integer, nullable=False, default=0)  # calibración
+    interventions_installation = db.Column(db.Integer, nullable=False, default=0)  # instalación
+    
+    __table_args__ = (
+        # Rangos de fechas de toda la flota
+        db.Index('ix_reliability_rollup_day', 'day', 'station_id'),
+        # En SQLite las filas se guardan ordenadas por (station_id, day): el rango de
+        # días de una estación se lee sin saltar de la clave a la fila
+        {'sqlite_with_rowid': False},
+    )
+    
+    def __repr__(self):
+        return f'<ReliabilityRollup {self.station_id} {self.day}>'
+
+
+class SensorReading(db.Model):
+    """Lecturas de los sensores: una fila por sensor e instante.
+
+    El instante se guarda en segundos Unix (UTC). Sin rowid, las filas se guardan
+    ordenadas por (station_id, sensor_id, ts): la serie de un sensor está contigua
+    y la clave no se repite en un índice aparte.
+    """
+    __tablename__ = 'sensor_reading'
+    
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), primary_key=True)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id', ondelete='CASCADE'), primary_key=True)
+    ts = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    value = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        {'sqlite_with_rowid': False},
+    )
+    
+    def __repr__(self):
+        return f'<SensorReading {self.sensor_id} {self.ts}>'
+
+
+class SensorRollup(db.Model):
+    """Agregados de las lecturas por intervalos de 1 minuto, 1 hora y 1 día.
+
+    resolution es la duración del intervalo en segundos y bucket su inicio (segundos
+    Unix). La media es sum_value / samples.
+    """
+    __tablename__ = 'sensor_rollup'
+    
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), primary_key=True)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id', ondelete='CASCADE'), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bucket = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    samples = db.Column(db.Integer, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    sum_value = db.Column(db.Float, nullable=False)
+    
+    __table_args__ = (
+        {'sqlite_with_rowid': False},
+    )
+    
+    def __repr__(self):
+        return f'<SensorRollup {self.sensor_id} {self.resolution} {self.bucket}>'
+
+
+class SensorRollupPending(db.Model):
+    """Intervalos de lecturas escritas cuyos agregados falta recalcular.
+
+    Se inserta una fila por sensor en la misma transacción que las lecturas y
+    se borra al recalcular los agregados (timeseries.run_rollups).
+    """
+    __tablename__ = 'sensor_rollup_pending'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    station_id = db.Column(db.Integer, db.ForeignKey('Station.id', ondelete='CASCADE'), nullable=False, index=True)
+    sensor_id = db.Column(db.Integer, db.ForeignKey('sensor.id', ondelete='CASCADE'), nullable=False)
+    first_ts = db.Column(db.Integer, nullable=False)
+    last_ts = db.Column(db.Integer, nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_sensor_rollup_pending_sensor', 'sensor_id', 'first_ts'),
+    )
+    
+    def __repr__(self):
+        return f'<SensorRollupPending {self.sensor_id} {self.first_ts}-{self.last_ts}>'
+
+
+class SyncChange(db.Model):
+    """Último cambio de cada registro, para la sincronización incremental (changelog.py).
+
+    seq crece con cada cambio: la fila del registro cambiado se sustituye por
+    una con un seq nuevo, así que hay una sola fila por registro. Los
+    borrados quedan como marcas (deleted). No tiene clave foránea a Station:
+    la marca de una estación eliminada sobrevive a la estación.
+    """
+    __tablename__ = 'sync_change'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # station, sensor, router, technical_detail...
+    record_id = db.Column(db.Integer, nullable=False)
+    station_id = db.Column(db.Integer, nullable=False, index=True)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('entity', 'record_id', name='uq_sync_change_entity_record'),
+        db.Index('ix_sync_change_tombstones', 'changed_at',
+                 sqlite_where=deleted.is_(True), postgresql_where=deleted.is_(True)),
+        # AUTOINCREMENT: SQLite no reutiliza el seq del último registro si se borra
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f'<SyncChange {self.seq} {self.entity} {self.record_id}>'
+
+
+class SyncPrune(db.Model):
+    """Limpieza de marcas de borrado antiguas: los cursores anteriores a
+    pruned_through ya no ven todos los borrados y deben sincronizar desde cero."""
+    __tablename__ = 'sync_prune'
+
+    id = db.Column(db.Integer, primary_key=True)
+    pruned_through = db.Column(db.Integer, nullable=False)
+    tombstones = db.Column(db.Integer, nullable=False, default=0)
+    pruned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SyncPrune {self.pruned_through}>'
+
+
+class SyncClientRecord(db.Model):
+    """Registros creados desde un cliente sin conexión, por su identificador local.
+
+    Si el cliente reenvía un lote (no recibió la respuesta), las altas que ya
+    se aplicaron no se duplican.
+    """
+    __tablename__ = 'sync_client_record'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    client_id = db.Column(db.String(64), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'client_id', name='uq_sync_client_record_user_client'),
+    )
+
+    def __repr__(self):
+        return f'<SyncClientRecord {self.client_id} {self.entity} {self.record_id}>'
+
+
+class StationPurge(db.Model):
+    """Purga por lotes de una estación con borrado lógico.
+
+    Se conserva al terminar como registro de la eliminación; no tiene clave
+    foránea a Station porque la estación se borra al final de la purga.
+    """
+    __tablename__ = 'station_purge'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    station_id = db.Column(db.Integer, nullable=False, index=True)
+    station_name = db.Column(db.String(100), nullable=False)
+    requested_by = db.Column(db.Integer, nullable=True)
+    requested_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Progreso: registros dependientes al eliminar la estación y registros ya borrados
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+    purged_rows = db.Column(db.Integer, nullable=False, default=0)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    @property
+    def progress(self):
+        """Porcentaje purgado (0-100)."""
+        if self.finished_at is not None:
+            return 100.0
+        if not self.total_rows:
+            return 0.0
+        return min(100.0, 100.0 * self.purged_rows / self.total_rows)
+    
+    def __repr__(self):
+        return f'<StationPurge {self.station_id}>'
+
+
+class Job(db.Model):
+    """Trabajo en segundo plano (runner.py): parámetros, estado, progreso y resultado.
+
+    Los parámetros y el resultado se guardan como JSON. Un trabajo fallido vuelve
+    a 'pending' con run_after en el futuro mientras le queden intentos.
+    """
+    __tablename__ = 'job'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, succeeded, failed, cancelled
+    created_by = db.Column(db.Integer, nullable=True, index=True)
+    
+    # Progreso (0-100) y mensaje que publica el propio trabajo
+    progress = db.Column(db.Float, nullable=False, default=0)
+    message = db.Column(db.String(200), nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=1)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    # El proceso que lo ejecuta lo actualiza periódicamente: sin latido, el trabajo se recupera
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # Trabajos pendientes por orden de ejecución
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
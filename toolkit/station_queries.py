@@ -0,0 +1,301 @@
+from datetime import datetime
+from sqlalchemy import Float, func, and_, or_, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import joinedload
+from sqlalchemy.sql.expression import FunctionElement
+from . import db
+from .station_models import Station, StationSummary, StationHistory, Breakdown, Intervention
+from .history import archived_records, load_users, merge_history
+
+# Número de estaciones por página en el listado
+STATIONS_PER_PAGE = 60
+
+# Número de registros por página en los historiales
+HISTORY_PER_PAGE = 50
+
+# Número de registros por página en la cola de trabajo
+TRIAGE_PER_PAGE = 50
+
+# Orden de atención de las averías, de más a menos urgente
+SEVERITY_ORDER = ['crítica', 'alta', 'media', 'baja']
+
+
+class age_hours(FunctionElement):
+    """Horas transcurridas desde una fecha (UTC) hasta ahora, calculadas en la base de datos."""
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(age_hours)
+def _age_hours(element, compiler, **kw):
+    return f"EXTRACT(EPOCH FROM (NOW() AT TIME ZONE 'UTC') - {compiler.process(element.clauses, **kw)}) / 3600.0"
+
+
+@compiles(age_hours, 'sqlite')
+def _age_hours_sqlite(element, compiler, **kw):
+    return f"(julianday('now') - julianday({compiler.process(element.clauses, **kw)})) * 24.0"
+
+
+class hours_between(FunctionElement):
+    """Horas entre dos fechas (hours_between(inicio, fin)), calculadas en la base de datos."""
+    type = Float()
+    inherit_cache = True
+
+
+@compiles(hours_between)
+def _hours_between(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f'EXTRACT(EPOCH FROM ({end} - {start})) / 3600.0'
+
+
+@compiles(hours_between, 'sqlite')
+def _hours_between_sqlite(element, compiler, **kw):
+    start, end = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f'(julianday({end}) - julianday({start})) * 24.0'
+
+
+def deleted_station_ids():
+    """Subconsulta con los ids de las estaciones eliminadas pendientes de purgar."""
+    return select(Station.id).where(Station.deleted_at.isnot(None))
+
+
+def station_counts_query():
+    """Estaciones con sus contadores (sensores, averías activas e
+    intervenciones pendientes) leídos del resumen en una sola consulta.
+    Excluye las estaciones eliminadas pendientes de purgar."""
+    return db.session.query(
+        Station,
+        func.coalesce(StationSummary.sensors_total, 0).label('sensor_count'),
+        func.coalesce(StationSummary.open_breakdowns, 0).label('active_breakdowns'),
+        func.coalesce(StationSummary.pending_interventions, 0).label('active_interventions')
+    ).outerjoin(StationSummary, StationSummary.station_id == Station.id).filter(Station.deleted_at.is_(None))
+
+
+def list_stations_page(island=None, municipality=None, status=None, after_id=None, limit=STATIONS_PER_PAGE):
+    """Página del listado de estaciones filtrada y paginada por clave (id).
+
+    Devuelve (filas, siguiente_id); siguiente_id es None en la última página.
+    """
+    query = station_counts_query()
+
+    if island:
+        query = query.filter(Station.island == island)
+    if municipality:
+        query = query.filter(Station.municipality == municipality)
+    if status:
+        query = query.filter(Station.status == status)
+    if after_id:
+        query = query.filter(Station.id > after_id)
+
+    # Se pide una fila de más para saber si hay página siguiente
+    rows = query.order_by(Station.id).limit(limit + 1).all()
+    next_id = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_id = rows[-1].Station.id
+    return rows, next_id
+
+
+def encode_cursor(timestamp, record_id):
+    """Cursor de paginación por clave (fecha, id) para usar en la URL."""
+    return f'{timestamp.isoformat()}_{record_id}'
+
+
+def decode_cursor(cursor):
+    """Devuelve (fecha, id) o None si el cursor no es válido."""
+    if not cursor:
+        return None
+    try:
+        timestamp, record_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(record_id)
+    except ValueError:
+        return None
+
+
+def keyset_query(query, date_column, id_column, cursor=None):
+    """Ordena la consulta de más reciente a más antigua por (fecha, id) y,
+    si hay cursor, la sitúa justo después de la última fila vista."""
+    position = decode_cursor(cursor)
+    if position:
+        timestamp, record_id = position
+        query = query.filter(or_(
+            date_column < timestamp,
+            and_(date_column == timestamp, id_column < record_id)
+        ))
+    return query.order_by(date_column.desc(), id_column.desc())
+
+
+def keyset_page(query, date_column, id_column, cursor=None, limit=HISTORY_PER_PAGE):
+    """Página de una consulta paginada por (fecha, id).
+
+    Devuelve (registros, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    records = keyset_query(query, date_column, id_column, cursor).limit(limit + 1).all()
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        last = records[-1]
+        next_cursor = encode_cursor(getattr(last, date_column.key), getattr(last, id_column.key))
+    return records, next_cursor
+
+
+def history_query(station_id):
+    return StationHistory.query.options(
+        joinedload(StationHistory.user)
+    ).filter(StationHistory.station_id == station_id)
+
+
+def breakdowns_query(station_id):
+    return Breakdown.query.options(
+        joinedload(Breakdown.reporter),
+        joinedload(Breakdown.resolver)
+    ).filter(Breakdown.station_id == station_id)
+
+
+def interventions_query(station_id):
+    return Intervention.query.options(
+        joinedload(Intervention.technician)
+    ).filter(Intervention.station_id == station_id)
+
+
+def history_page(station_id, cursor=None, limit=HISTORY_PER_PAGE):
+    """Página del historial que mezcla los registros recientes y los archivados."""
+    position = decode_cursor(cursor)
+    hot = keyset_query(
+        history_query(station_id), StationHistory.created_at, StationHistory.id, cursor
+    ).limit(limit + 1).all()
+    records = merge_history(hot, archived_records(station_id, position, limit + 1), limit + 1)
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1].created_at, records[-1].id)
+    load_users(records)
+    return records, next_cursor
+
+
+def recent_history(station_id, limit=5):
+    """Últimos registros del historial, recientes o archivados."""
+    return history_page(station_id, limit=limit)[0]
+
+
+def breakdowns_page(station_id, cursor=None):
+    return keyset_page(breakdowns_query(station_id), Breakdown.reported_date, Breakdown.id, cursor)
+
+
+def interventions_page(station_id, cursor=None):
+    return keyset_page(interventions_query(station_id), Intervention.created_at, Intervention.id, cursor)
+
+
+def _triage_filters(query, island=None, required_vehicle=None):
+    query = query.filter(Station.deleted_at.is_(None))
+    if island:
+        query = query.filter(Station.island == island)
+    if required_vehicle:
+        query = query.filter(Station.required_vehicle == required_vehicle)
+    return query
+
+
+def _after(date_column, id_column, position):
+    # Orden ascendente (las más antiguas primero): filas posteriores a la última vista
+    timestamp, record_id = position
+    return or_(date_column > timestamp, and_(date_column == timestamp, id_column > record_id))
+
+
+def open_breakdowns_query(severity, island=None, required_vehicle=None):
+    """Averías activas de una severidad en toda la flota, de la más antigua a la más reciente.
+
+    Con la severidad fija el orden (reported_date, id) sale del índice parcial
+    ix_breakdown_queue, así que cada página es un recorrido de rango del índice.
+    """
+    query = db.session.query(
+        Breakdown, Station.name, Station.island, age_hours(Breakdown.reported_date).label('age_hours')
+    ).join(Station, Station.id == Breakdown.station_id).options(
+        joinedload(Breakdown.reporter)
+    ).filter(Breakdown.resolved.is_(False))
+    if severity is None:
+        query = query.filter(or_(Breakdown.severity.is_(None), Breakdown.severity.notin_(SEVERITY_ORDER)))
+    else:
+        query = query.filter(Breakdown.severity == severity)
+    return _triage_filters(query, island, required_vehicle)
+
+
+def pending_interventions_query(island=None, required_vehicle=None):
+    """Intervenciones programadas pendientes en toda la flota, de la más antigua a la más reciente."""
+    query = db.session.query(
+        Intervention, Station.name, Station.island, age_hours(Intervention.created_at).label('age_hours')
+    ).join(Station, Station.id == Intervention.station_id).options(
+        joinedload(Intervention.technician)
+    ).filter(Intervention.technician_name.is_(None))
+    return _triage_filters(query, island, required_vehicle)
+
+
+def breakdown_queue_page(island=None, required_vehicle=None, cursor=None, limit=TRIAGE_PER_PAGE):
+    """Página de la cola de averías activas, ordenada por severidad y antigüedad.
+
+    Se recorren las severidades de la más urgente a la menos urgente con una
+    consulta por severidad. El cursor es '<posición de la severidad>:<fecha>_<id>'.
+    Devuelve (filas, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    buckets = SEVERITY_ORDER + [None]
+    start, position = 0, None
+    if cursor:
+        bucket, _, rest = cursor.partition(':')
+        position = decode_cursor(rest)
+        if bucket.isdigit() and int(bucket) < len(buckets) and position:
+            start = int(bucket)
+        else:
+            position = None
+
+    rows = []
+    for index in range(start, len(buckets)):
+        query = open_breakdowns_query(buckets[index], island, required_vehicle)
+        if index == start and position:
+            query = query.filter(_after(Breakdown.reported_date, Breakdown.id, position))
+        page = query.order_by(Breakdown.reported_date, Breakdown.id).limit(limit + 1 - len(rows)).all()
+        for row in page:
+            rows.append((index, row))
+        if len(rows) > limit:
+            break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        index, last = rows[-1]
+        next_cursor = f'{index}:{encode_cursor(last.Breakdown.reported_date, last.Breakdown.id)}'
+    return [row for _, row in rows], next_cursor
+
+
+def intervention_queue_page(island=None, required_vehicle=None, cursor=None, limit=TRIAGE_PER_PAGE):
+    """Página de la cola de intervenciones pendientes, de la más antigua a la más reciente.
+
+    Devuelve (filas, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    query = pending_interventions_query(island, required_vehicle)
+    position = decode_cursor(cursor)
+    if position:
+        query = query.filter(_after(Intervention.created_at, Intervention.id, position))
+    rows = query.order_by(Intervention.created_at, Intervention.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1].Intervention
+        next_cursor = encode_cursor(last.created_at, last.id)
+    return rows, next_cursor
+
+
+def triage_counts(island=None, required_vehicle=None):
+    """Totales de la cola (averías por severidad e intervenciones pendientes) leídos del resumen."""
+    query = _triage_filters(db.session.query(
+        func.coalesce(func.sum(StationSummary.open_breakdowns), 0),
+        func.coalesce(func.sum(StationSummary.open_breakdowns_critical), 0),
+        func.coalesce(func.sum(StationSummary.open_breakdowns_high), 0),
+        func.coalesce(func.sum(StationSummary.open_breakdowns_medium), 0),
+        func.coalesce(func.sum(StationSummary.open_breakdowns_low), 0),
+        func.coalesce(func.sum(StationSummary.pending_interventions), 0),
+    ).join(Station, Station.id == StationSummary.station_id), island, required_vehicle)
+    total, critical, high, medium, low, interventions = query.one()
+    return {
+        'breakdowns': total,
+        'severities': dict(zip(SEVERITY_ORDER, (critical, high, medium, low))),
+        'interventions': interventions,
+    }
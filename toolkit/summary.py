@@ -0,0 +1,270 @@
+import click
+from datetime import datetime
+from flask.cli import AppGroup
+from sqlalchemy import func, union_all, update
+from . import db
+from .station_models import (
+    Station, Sensor, Router, Breakdown, Intervention, StationHistory, StationSummary, HistorySegment,
+    SENSOR_CALIBRATING
+)
+from .station_queries import deleted_station_ids
+
+# Columna del resumen que corresponde a cada severidad / estado de sensor
+SEVERITY_COLUMNS = {
+    'baja': 'open_breakdowns_low',
+    'media': 'open_breakdowns_medium',
+    'alta': 'open_breakdowns_high',
+    'crítica': 'open_breakdowns_critical',
+}
+
+SENSOR_STATUS_COLUMNS = {
+    'operativo': 'sensors_operational',
+    'averiado': 'sensors_faulty',
+    SENSOR_CALIBRATING: 'sensors_calibrating',
+}
+
+COUNTER_COLUMNS = (
+    ['open_breakdowns'] + list(SEVERITY_COLUMNS.values()) +
+    ['pending_interventions', 'sensors_total'] + list(SENSOR_STATUS_COLUMNS.values())
+)
+
+
+def get_summary(station_id):
+    """Devuelve el resumen de la estación, calculándolo desde cero si no existe."""
+    # Sin autoflush: el resumen se calcula sobre el estado previo al cambio en curso,
+    # que después se aplica como incremento. Por eso las rutas lo llaman antes de modificar.
+    with db.session.no_autoflush:
+        # Puede haberse creado antes en la misma transacción sin volcar todavía
+        # (los objetos pendientes no están en el identity map)
+        summary = next((
+            pending for pending in db.session.new
+            if isinstance(pending, StationSummary) and pending.station_id == station_id
+        ), None) or db.session.get(StationSummary, station_id)
+        if summary is None:
+            summary = StationSummary(station_id=station_id)
+            _fill_summary(summary, compute_summaries([station_id]).get(station_id, {}))
+            db.session.add(summary)
+    return summary
+
+
+def _adjust(station_id, **deltas):
+    """Suma los incrementos indicados a los contadores del resumen con un UPDATE atómico."""
+    get_summary(station_id)
+    values = {
+        name: getattr(StationSummary, name) + delta
+        for name, delta in deltas.items() if delta
+    }
+    if values:
+        db.session.execute(
+            update(StationSummary).where(StationSummary.station_id == station_id).values(**values)
+        )
+
+
+def _breakdown_deltas(severity, delta):
+    deltas = {'open_breakdowns': delta}
+    if severity in SEVERITY_COLUMNS:
+        deltas[SEVERITY_COLUMNS[severity]] = delta
+    return deltas
+
+
+def _sensor_deltas(status, delta):
+    deltas = {}
+    if status in SENSOR_STATUS_COLUMNS:
+        deltas[SENSOR_STATUS_COLUMNS[status]] = delta
+    return deltas
+
+
+# Eventos de las rutas de escritura
+def breakdown_opened(station_id, severity):
+    _adjust(station_id, **_breakdown_deltas(severity, 1))
+
+
+def breakdown_closed(station_id, severity):
+    _adjust(station_id, **_breakdown_deltas(severity, -1))
+
+
+def intervention_scheduled(station_id):
+    _adjust(station_id, pending_interventions=1)
+
+
+def intervention_closed(station_id):
+    _adjust(station_id, pending_interventions=-1)
+
+
+def sensor_added(station_id, status):
+    _adjust(station_id, sensors_total=1, **_sensor_deltas(status, 1))
+
+
+def sensor_removed(station_id, status):
+    _adjust(station_id, sensors_total=-1, **_sensor_deltas(status, -1))
+
+
+def sensor_status_changed(station_id, old_status, new_status):
+    if old_status == new_status:
+        return
+    deltas = _sensor_deltas(old_status, -1)
+    for name, delta in _sensor_deltas(new_status, 1).items():
+        deltas[name] = deltas.get(name, 0) + delta
+    _adjust(station_id, **deltas)
+
+
+def router_changed(station_id, status):
+    get_summary(station_id).router_status = status
+
+
+def bump(station_id):
+    """Marca la estación como modificada (invalida sus fragmentos en caché)."""
+    summary = get_summary(station_id)
+    # Un resumen recién creado todavía no tiene versión: se inserta con la inicial
+    if summary.version is not None:
+        summary.version = StationSummary.version + 1
+
+
+def touch(station_id, when=None):
+    """Actualiza la fecha de última actividad de la estación."""
+    bump(station_id)
+    get_summary(station_id).last_activity = when or datetime.utcnow()
+
+
+def compute_summaries(station_ids=None, exclude_deleted=True):
+    """Calcula los resúmenes desde las tablas de detalle con agregaciones SQL.
+
+    Devuelve {station_id: {columna: valor}}. Si station_ids es None se calculan todas.
+    Las estaciones eliminadas pendientes de purgar no tienen resumen (exclude_deleted
+    es False sólo en las migraciones anteriores al borrado lógico).
+    """
+    def restrict(query, column):
+        if station_ids is not None:
+            query = query.filter(column.in_(station_ids))
+        if exclude_deleted:
+            query = query.filter(column.notin_(deleted_station_ids()))
+        return query
+
+    ids_query = restrict(db.session.query(Station.id), Station.id)
+    results = {station_id: {name: 0 for name in COUNTER_COLUMNS} for (station_id,) in ids_query}
+    for values in results.values():
+        values['router_status'] = None
+        values['last_activity'] = None
+
+    breakdown_rows = restrict(db.session.query(
+        Breakdown.station_id, Breakdown.severity, func.count(Breakdown.id)
+    ).filter(Breakdown.resolved.is_(False)), Breakdown.station_id).group_by(
+        Breakdown.station_id, Breakdown.severity
+    )
+    for station_id, severity, total in breakdown_rows:
+        for name, delta in _breakdown_deltas(severity, total).items():
+            results[station_id][name] += delta
+
+    intervention_rows = restrict(db.session.query(
+        Intervention.station_id, func.count(Intervention.id)
+    ).filter(Intervention.technician_name.is_(None)), Intervention.station_id).group_by(Intervention.station_id)
+    for station_id, total in intervention_rows:
+        results[station_id]['pending_interventions'] = total
+
+    sensor_rows = restrict(db.session.query(
+        Sensor.station_id, Sensor.status, func.count(Sensor.id)
+    ), Sensor.station_id).group_by(Sensor.station_id, Sensor.status)
+    for station_id, status, total in sensor_rows:
+        results[station_id]['sensors_total'] += total
+        for name, delta in _sensor_deltas(status, total).items():
+            results[station_id][name] += delta
+
+    router_rows = restrict(db.session.query(Router.station_id, Router.status), Router.station_id)
+    for station_id, status in router_rows:
+        results[station_id]['router_status'] = status
+
+    # Última actividad: historial reciente y segmentos archivados en una sola consulta
+    activity = union_all(
+        restrict(db.session.query(
+            StationHistory.station_id.label('station_id'), func.max(StationHistory.created_at).label('last')
+        ), StationHistory.station_id).group_by(StationHistory.station_id),
+        restrict(db.session.query(
+            HistorySegment.station_id, func.max(HistorySegment.last_created_at)
+        ), HistorySegment.station_id).group_by(HistorySegment.station_id)
+    ).subquery()
+    activity_rows = db.session.query(
+        activity.c.station_id, func.max(activity.c.last, type_=StationHistory.created_at.type)
+    ).group_by(activity.c.station_id)
+    for station_id, last_activity in activity_rows:
+        if station_id in results:
+            results[station_id]['last_activity'] = last_activity
+
+    return results
+
+
+def _fill_summary(summary, values):
+    for name, value in values.items():
+        setattr(summary, name, value)
+
+
+def refresh_summaries(station_ids):
+    """Recalcula desde cero los resúmenes de las estaciones indicadas (sin confirmar)."""
+    station_ids = list(station_ids)
+    if not station_ids:
+        return
+    expected = compute_summaries(station_ids)
+    stored = {
+        summary.station_id: summary
+        for summary in StationSummary.query.filter(StationSummary.station_id.in_(station_ids))
+    }
+    # Las versiones se suben en un solo UPDATE: con una expresión SQL en cada
+    # objeto la sesión emitiría un UPDATE por estación
+    bumped = [station_id for station_id in expected if station_id in stored]
+    if bumped:
+        db.session.execute(
+            update(StationSummary).where(StationSummary.station_id.in_(bumped))
+            .values(version=StationSummary.version + 1)
+        )
+    for station_id, values in expected.items():
+        summary = stored.get(station_id)
+        if summary is None:
+            summary = StationSummary(station_id=station_id)
+            db.session.add(summary)
+        _fill_summary(summary, values)
+
+
+def rebuild_summaries(verify_only=False, exclude_deleted=True):
+    """Compara los resúmenes guardados con los calculados y corrige las diferencias.
+
+    Devuelve la lista de ids de estación cuyo resumen no coincidía.
+    """
+    expected = compute_summaries(exclude_deleted=exclude_deleted)
+    stored = {summary.station_id: summary for summary in StationSummary.query.all()}
+    drifted = []
+
+    for station_id, values in expected.items():
+        summary = stored.get(station_id)
+        if summary is not None and all(getattr(summary, name) == value for name, value in values.items()):
+            continue
+        drifted.append(station_id)
+        if not verify_only:
+            if summary is None:
+                summary = StationSummary(station_id=station_id)
+                db.session.add(summary)
+            else:
+                summary.version = StationSummary.version + 1
+            _fill_summary(summary, values)
+
+    if not verify_only:
+        db.session.commit()
+    return drifted
+
+
+summaries_cli = AppGroup('summaries', help='Mantenimiento de los resúmenes de estaciones.')
+
+
+@summaries_cli.command('rebuild')
+def rebuild_command():
+    """Recalcula y corrige los resúmenes de todas las estaciones."""
+    drifted = rebuild_summaries()
+    click.echo(f'{len(drifted)} resumen(es) corregido(s)')
+
+
+@summaries_cli.command('verify')
+def verify_command():
+    """Comprueba los resúmenes sin modificarlos."""
+    drifted = rebuild_summaries(verify_only=True)
+    if drifted:
+        click.echo(f'Resúmenes desincronizados: {", ".join(str(i) for i in drifted)}')
+        raise SystemExit(1)
+    click.echo('Todos los resúmenes están sincronizados')
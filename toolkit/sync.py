@@ -0,0 +1,446 @@
+from datetime import datetime, timedelta, timezone
+from flask import Blueprint, current_app, request, jsonify
+from flask_login import login_required, current_user
+from . import db, summary
+from .station_models import Station, Sensor, Router, TechnicalDetail, Breakdown, Intervention, SyncClientRecord
+from .changelog import SYNC_MODELS, CHANGES_PER_PAGE, changes_since, record_seqs, record_to_dict
+from .station import log_change
+from .geo import location_fields
+from .calibration import CALIBRATION_TYPE, mark_calibrated
+
+sync = Blueprint('sync', __name__)
+
+# Campos que se pueden escribir desde un cliente, por tipo de registro
+WRITABLE_FIELDS = {
+    'station': ('name', 'island', 'municipality', 'location', 'coordinates', 'contact', 'how_to_get',
+                'required_vehicle', 'measurement_type', 'status'),
+    'sensor': ('sensor_type', 'model', 'serial_number', 'status', 'installation_date'),
+    'router': ('model', 'ip_address', 'mac_address', 'serial_number', 'firmware_version', 'status'),
+    'technical_detail': ('detail_type', 'key', 'value'),
+    # Las averías se crean y se resuelven; las intervenciones se crean y se completan
+    'breakdown': ('title', 'description', 'severity', 'resolved', 'resolution_notes'),
+    'intervention': ('intervention_type', 'title', 'description', 'completed'),
+}
+
+REQUIRED_FIELDS = {
+    'station': ('name', 'island', 'municipality', 'location'),
+    'sensor': ('sensor_type',),
+    'router': ('model',),
+    'technical_detail': ('detail_type', 'key', 'value'),
+    'breakdown': ('title', 'description'),
+    'intervention': ('intervention_type', 'title', 'description'),
+}
+
+# Margen para el instante de una operación (relojes de las tabletas adelantados)
+MAX_FUTURE = timedelta(minutes=5)
+
+# Resultado de cada operación
+APPLIED = 'applied'
+DUPLICATE = 'duplicate'
+CONFLICT = 'conflict'
+ERROR = 'error'
+
+
+class Conflict(Exception):
+    """El registro ha cambiado en el servidor desde la versión que editó el cliente."""
+
+    def __init__(self, entity, record_id, record=None, seq=None):
+        super().__init__(entity)
+        self.entity = entity
+        self.record_id = record_id
+        self.record = record
+        self.seq = seq
+
+
+def _instant(value):
+    # Fecha ISO 8601 de la operación en el cliente (sin zona horaria se entiende UTC)
+    if value is None:
+        return None
+    try:
+        instant = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Fecha no válida: {value!r} (ISO 8601)')
+    if instant.tzinfo is not None:
+        instant = instant.astimezone(timezone.utc).replace(tzinfo=None)
+    if instant > datetime.utcnow() + MAX_FUTURE:
+        raise ValueError(f'Fecha en el futuro: {value}')
+    return instant
+
+
+def _fields(entity, fields, create):
+    if not isinstance(fields, dict):
+        raise ValueError('fields debe ser un objeto')
+    unknown = sorted(set(fields) - set(WRITABLE_FIELDS[entity]))
+    if unknown:
+        raise ValueError(f'Campos no admitidos en {entity}: {", ".join(unknown)}')
+    for name, value in fields.items():
+        expected = bool if name in ('resolved', 'completed') else str
+        if value is not None and not isinstance(value, expected):
+            raise ValueError(f'Valor no válido en {name}: {value!r}')
+    if create:
+        missing = [name for name in REQUIRED_FIELDS[entity] if not fields.get(name)]
+        if missing:
+            raise ValueError(f'Faltan campos obligatorios: {", ".join(missing)}')
+    values = dict(fields)
+    if values.get('installation_date'):
+        try:
+            values['installation_date'] = datetime.strptime(values['installation_date'], '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError('installation_date debe tener el formato AAAA-MM-DD')
+    return values
+
+
+def _unchanged(record, values):
+    # Una operación reenviada que ya se aplicó no es un conflicto
+    for name, value in values.items():
+        if name == 'completed':
+            current = record.technician_name is not None
+        else:
+            current = getattr(record, name)
+        if current != value:
+            return False
+    return True
+
+
+def _station(reference, batch):
+    # La estación de un alta: su id, o el client_id con el que el cliente la creó
+    if isinstance(reference, str):
+        station_id = batch.created.get(('station', reference)) or db.session.scalar(
+            db.select(SyncClientRecord.record_id).where(
+                SyncClientRecord.user_id == current_user.id, SyncClientRecord.client_id == reference,
+                SyncClientRecord.entity == 'station'
+            )
+        )
+    else:
+        station_id = reference
+    if isinstance(station_id, bool) or not isinstance(station_id, int):
+        raise ValueError(f'Estación no válida: {reference!r}')
+    station = db.session.get(Station, station_id)
+    if station is None or station.deleted_at is not None:
+        raise ValueError(f'La estación {reference} no existe')
+    return station
+
+
+# Altas
+
+def _create_station(station, values, at):
+    if Station.query.filter_by(name=values['name']).first():
+        raise ValueError('Ya existe una estación con ese nombre')
+    position = location_fields(values.get('coordinates'))
+    station = Station(created_by=current_user.id, **dict(values, status=values.get('status') or 'activa'), **position)
+    db.session.add(station)
+    db.session.flush()
+    log_change(station.id, 'created', description=f'Estación {station.name} creada')
+    return station
+
+
+def _create_sensor(station, values, at):
+    sensor = Sensor(station_id=station.id, **dict(values, status=values.get('status') or 'operativo'))
+    summary.sensor_added(station.id, sensor.status)
+    db.session.add(sensor)
+    log_change(station.id, 'sensor_added', description=f'Sensor {sensor.sensor_type} añadido')
+    return sensor
+
+
+def _create_router(station, values, at):
+    if station.router is not None:
+        # La estación ya tiene router (configurado por otro técnico): el cliente decide
+        raise Conflict('router', station.router.id, station.router)
+    router = Router(station_id=station.id, **dict(values, status=values.get('status') or 'online'))
+    summary.router_changed(station.id, router.status)
+    db.session.add(router)
+    log_change(station.id, 'router_configured', description='Router configurado/actualizado')
+    return router
+
+
+def _create_technical_detail(station, values, at):
+    detail = TechnicalDetail(station_id=station.id, **values)
+    db.session.add(detail)
+    log_change(station.id, 'detail_added', description=f'Detalle técnico: {detail.key}')
+    return detail
+
+
+def _create_breakdown(station, values, at):
+    if 'resolved' in values or 'resolution_notes' in values:
+        raise ValueError('Una avería se reporta sin resolver (se resuelve con una actualización)')
+    breakdown = Breakdown(
+        station_id=station.id, reported_by=current_user.id, reported_date=at or datetime.utcnow(),
+        **dict(values, severity=values.get('severity') or 'media')
+    )
+    summary.breakdown_opened(station.id, breakdown.severity)
+    db.session.add(breakdown)
+    log_change(station.id, 'breakdown_reported', description=f'Avería reportada: {breakdown.title}')
+    return breakdown
+
+
+def _create_intervention(station, values, at):
+    completed = values.pop('completed', False)
+    intervention = Intervention(
+        station_id=station.id,
+        intervention_date=(at or datetime.utcnow()) if completed else None,
+        technician_name=current_user.username if completed else None,
+        performed_by=current_user.id,
+        **values
+    )
+    db.session.add(intervention)
+    if completed:
+        log_change(station.id, 'intervention_added', description=f'Intervención: {intervention.title}')
+    else:
+        summary.intervention_scheduled(station.id)
+        log_change(station.id, 'intervention_scheduled', description=f'Intervención programada: {intervention.title}')
+    return intervention
+
+
+# Modificaciones
+
+def _update_station(station, values, at):
+    if 'name' in values and values['name'] != station.name and Station.query.filter_by(name=values['name']).first():
+        raise ValueError('Ya existe una estación con ese nombre')
+    if 'coordinates' in values and values['coordinates'] != station.coordinates:
+        values.update(location_fields(values['coordinates']))
+    old_status = station.status
+    for name, value in values.items():
+        setattr(station, name, value)
+    if old_status != station.status:
+        log_change(station.id, 'status_changed', 'status', old_status, station.status)
+    log_change(station.id, 'updated', description='Información de estación actualizada')
+
+
+def _update_sensor(sensor, values, at):
+    if 'status' in values:
+        summary.sensor_status_changed(sensor.station_id, sensor.status, values['status'])
+    for name, value in values.items():
+        setattr(sensor, name, value)
+    log_change(sensor.station_id, 'sensor_updated', description=f'Sensor {sensor.sensor_type} actualizado')
+
+
+def _update_router(router, values, at):
+    for name, value in values.items():
+        setattr(router, name, value)
+    summary.router_changed(router.station_id, router.status)
+    log_change(router.station_id, 'router_configured', description='Router configurado/actualizado')
+
+
+def _update_technical_detail(detail, values, at):
+    for name, value in values.items():
+        setattr(detail, name, value)
+    log_change(detail.station_id, 'detail_updated', description=f'Detalle técnico {detail.key} actualizado')
+
+
+def _update_breakdown(breakdown, values, at):
+    if values.get('resolved') is not True or set(values) - {'resolved', 'resolution_notes'}:
+        raise ValueError('Una avería sólo se puede resolver (resolved: true y resolution_notes)')
+    if not breakdown.resolved:
+        summary.breakdown_closed(breakdown.station_id, breakdown.severity)
+    breakdown.resolved = True
+    breakdown.resolved_date = at or datetime.utcnow()
+    breakdown.resolved_by = current_user.id
+    breakdown.resolution_notes = values.get('resolution_notes')
+    log_change(breakdown.station_id, 'breakdown_resolved', description=f'Avería resuelta: {breakdown.title}')
+
+
+def _update_intervention(intervention, values, at):
+    if values != {'completed': True}:
+        raise ValueError('Una intervención sólo se puede completar (completed: true)')
+    if intervention.technician_name is None:
+        summary.intervention_closed(intervention.station_id)
+    intervention.intervention_date = at or datetime.utcnow()
+    intervention.technician_name = current_user.username
+    intervention.performed_by = current_user.id
+    if intervention.intervention_type == CALIBRATION_TYPE:
+        mark_calibrated([intervention.id], intervention.intervention_date)
+    log_change(intervention.station_id, 'intervention_completed', description=f'Intervención realizada: {intervention.title}')
+
+
+# Bajas
+
+def _delete_sensor(sensor):
+    summary.sensor_removed(sensor.station_id, sensor.status)
+    db.session.delete(sensor)
+    log_change(sensor.station_id, 'sensor_deleted', description=f'Sensor {sensor.model or sensor.sensor_type} eliminado')
+
+
+def _delete_technical_detail(detail):
+    db.session.delete(detail)
+    log_change(detail.station_id, 'detail_deleted', description=f'Detalle técnico {detail.key} eliminado')
+
+
+def _delete_breakdown(breakdown):
+    if not current_user.is_admin:
+        raise ValueError('Sólo un administrador puede eliminar averías')
+    if not breakdown.resolved:
+        summary.breakdown_closed(breakdown.station_id, breakdown.severity)
+    summary.bump(breakdown.station_id)
+    db.session.delete(breakdown)
+
+
+def _delete_intervention(intervention):
+    if not current_user.is_admin:
+        raise ValueError('Sólo un administrador puede eliminar intervenciones')
+    if intervention.technician_name is None:
+        summary.intervention_closed(intervention.station_id)
+    summary.bump(intervention.station_id)
+    db.session.delete(intervention)
+
+
+CREATE = {
+    'station': _create_station,
+    'sensor': _create_sensor,
+    'router': _create_router,
+    'technical_detail': _create_technical_detail,
+    'breakdown': _create_breakdown,
+    'intervention': _create_intervention,
+}
+
+UPDATE = {
+    'station': _update_station,
+    'sensor': _update_sensor,
+    'router': _update_router,
+    'technical_detail': _update_technical_detail,
+    'breakdown': _update_breakdown,
+    'intervention': _update_intervention,
+}
+
+# Las estaciones se eliminan desde la web (purga); los routers no se eliminan
+DELETE = {
+    'sensor': _delete_sensor,
+    'technical_detail': _delete_technical_detail,
+    'breakdown': _delete_breakdown,
+    'intervention': _delete_intervention,
+}
+
+
+class PushBatch:
+    """Estado de un lote de operaciones mientras se aplica."""
+
+    def __init__(self):
+        # Altas del lote: (entity, client_id) -> id
+        self.created = {}
+        # seq de cada registro antes de la primera operación del lote que lo modifica:
+        # las siguientes operaciones del cliente sobre el mismo registro parten de él
+        self.baselines = {}
+        # Registros modificados: (entity, id) -> resultado, para añadir su seq nuevo
+        self.applied = {}
+
+
+def _apply(op, batch):
+    """Aplica una operación. Devuelve su resultado; lanza ValueError o Conflict sin
+    haber modificado nada."""
+    if not isinstance(op, dict):
+        raise ValueError('Se esperaba un objeto')
+    kind, entity = op.get('op'), op.get('entity')
+    if entity not in SYNC_MODELS:
+        raise ValueError(f'Tipo de registro no válido: {entity!r}')
+    at = _instant(op.get('at'))
+
+    if kind == 'create':
+        client_id = op.get('client_id')
+        if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+            raise ValueError('client_id es obligatorio en las altas (texto de hasta 64 caracteres)')
+        values = _fields(entity, op.get('fields', {}), create=True)
+        existing = SyncClientRecord.query.filter_by(user_id=current_user.id, client_id=client_id).first()
+        if existing is not None:
+            batch.created[(existing.entity, client_id)] = existing.record_id
+            return {'status': DUPLICATE, 'entity': existing.entity, 'id': existing.record_id}
+        station = None if entity == 'station' else _station(op.get('station_id'), batch)
+        record = CREATE[entity](station, values, at)
+        db.session.flush()
+        db.session.add(SyncClientRecord(user_id=current_user.id, client_id=client_id, entity=entity, record_id=record.id))
+        batch.created[(entity, client_id)] = record.id
+        result = {'status': APPLIED, 'id': record.id}
+        batch.applied[(entity, record.id)] = result
+        return result
+
+    if kind not in ('update', 'delete'):
+        raise ValueError(f'Operación no válida: {kind!r} (create, update o delete)')
+    if kind == 'delete' and entity not in DELETE:
+        raise ValueError(f'No se pueden eliminar registros de tipo {entity} desde la sincronización')
+    record_id, base_seq = op.get('id'), op.get('base_seq')
+    if isinstance(record_id, bool) or not isinstance(record_id, int):
+        raise ValueError('id es obligatorio en las modificaciones y bajas')
+    if isinstance(base_seq, bool) or not isinstance(base_seq, int):
+        raise ValueError('base_seq (seq de la versión editada) es obligatorio en las modificaciones y bajas')
+    values = _fields(entity, op.get('fields', {}), create=False) if kind == 'update' else {}
+
+    record = db.session.get(SYNC_MODELS[entity], record_id)
+    station_id = None if record is None else (record.id if entity == 'station' else record.station_id)
+    if record is not None and db.session.get(Station, station_id).deleted_at is not None:
+        record = None
+    if record is None:
+        if kind == 'delete':
+            return {'status': APPLIED, 'id': record_id}
+        raise Conflict(entity, record_id)
+
+    seq = record_seqs(entity, [record_id]).get(record_id, 0)
+    if base_seq < batch.baselines.get((entity, record_id), seq):
+        if kind == 'update' and _unchanged(record, values):
+            return {'status': APPLIED, 'id': record_id, 'seq': seq}
+        raise Conflict(entity, record_id, record, seq)
+    batch.baselines.setdefault((entity, record_id), seq)
+
+    if kind == 'update':
+        UPDATE[entity](record, values, at)
+    else:
+        DELETE[entity](record)
+    result = {'status': APPLIED, 'id': record_id}
+    if kind == 'update':
+        batch.applied[(entity, record_id)] = result
+    return result
+
+
+# Cambios desde el cursor del cliente: ?since=<seq>&limit=
+@sync.route('/changes')
+@login_required
+def changes():
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', CHANGES_PER_PAGE, type=int)
+    if since < 0 or not 0 < limit <= CHANGES_PER_PAGE:
+        return jsonify({'error': f'since debe ser >= 0 y limit estar entre 1 y {CHANGES_PER_PAGE}'}), 400
+
+    records, cursor, more, reset = changes_since(since, limit)
+    upserts, deletes = {}, {}
+    for seq, entity, record_id, data in records:
+        if data is None:
+            deletes.setdefault(entity, []).append(record_id)
+        else:
+            upserts.setdefault(entity, []).append(dict(data, seq=seq))
+    return jsonify({'cursor': cursor, 'more': more, 'reset': reset, 'upserts': upserts, 'deletes': deletes})
+
+# Lote de cambios hechos sin conexión: {"operations": [{op, entity, id, base_seq, client_id, station_id, at, fields}]}
+@sync.route('/push', methods=['POST'])
+@login_required
+def push():
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({'error': 'Se esperaba {"operations": [...]}'}), 400
+    if len(operations) > current_app.config['SYNC_MAX_OPERATIONS']:
+        return jsonify({'error': f'Como mucho {current_app.config["SYNC_MAX_OPERATIONS"]} operaciones por lote'}), 413
+
+    # Cada operación se comprueba antes de modificar nada: las que fallan o tienen
+    # conflicto se saltan y el resto se confirma en una sola transacción
+    batch = PushBatch()
+    results = []
+    for index, op in enumerate(operations):
+        try:
+            result = _apply(op, batch)
+        except Conflict as conflict:
+            result = {
+                'status': CONFLICT,
+                'id': conflict.record_id,
+                'seq': conflict.seq,
+                'record': None if conflict.record is None else record_to_dict(conflict.entity, conflict.record),
+            }
+        except ValueError as e:
+            result = {'status': ERROR, 'message': str(e)}
+        result['index'] = index
+        results.append(result)
+
+    # seq nuevo de los registros modificados: el cliente lo usa como base_seq de su próxima edición
+    db.session.flush()
+    for entity in SYNC_MODELS:
+        record_ids = [record_id for kind, record_id in batch.applied if kind == entity]
+        for record_id, seq in record_seqs(entity, record_ids).items():
+            batch.applied[(entity, record_id)]['seq'] = seq
+    db.session.commit()
+    return jsonify({'results': results})
@@ -0,0 +1,115 @@
+import os
+from flask import current_app
+from . import db
+from .station_models import Station
+from .runner import job
+from .purge import PURGE_BATCH_SIZE, run_purge, purge_to_dict, delete_station_now
+from .history import archive_history
+from .exports import EXPORT_QUERIES, EXPORT_FORMATS, EXPORT_BATCH_SIZE, export_rows
+from .importer import import_records
+from .summary import rebuild_summaries
+from .reliability import rebuild_rollups
+
+# Errores de importación que se guardan en el resultado
+MAX_IMPORT_ERRORS = 200
+
+# Diferencias que se guardan en el resultado de una reconstrucción
+MAX_DRIFTED = 100
+
+
+@job('purge_station')
+def purge_station(ctx, purge_id):
+    """Purga por lotes una estación con borrado lógico; un reintento sigue donde se quedó."""
+    batch_size = current_app.config.get('STATION_PURGE_BATCH_SIZE', PURGE_BATCH_SIZE)
+
+    def progress(purge):
+        ctx.progress(purge.progress, f'{purge.purged_rows} de {purge.total_rows} registros')
+
+    purge = run_purge(purge_id, batch_size, progress)
+    if purge is None:
+        raise ValueError(f'No existe la purga {purge_id}')
+    return purge_to_dict(purge)
+
+
+@job('delete_station')
+def delete_station(ctx, station_id):
+    """Borrado inmediato de una estación: los registros dependientes los borra la base de datos."""
+    station = db.session.get(Station, station_id)
+    if station is None:
+        return {'station_id': station_id, 'deleted': False}
+    name = station.name
+    delete_station_now(station)
+    return {'station_id': station_id, 'station_name': name, 'deleted': True}
+
+
+@job('export_records', admin_only=False)
+def export_records(ctx, station_id, kind, fmt='csv'):
+    """Exporta el historial, las averías o las intervenciones a un fichero del trabajo."""
+    if kind not in EXPORT_QUERIES or fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Exportación no válida: {kind} ({fmt})')
+    station = db.session.get(Station, station_id)
+    if station is None or station.deleted_at is not None:
+        raise ValueError(f'No existe la estación {station_id}')
+
+    path = ctx.path(fmt)
+    partial = f'{path}.partial'
+    with open(partial, 'w', encoding='utf-8', newline='') as out:
+        # El primer trozo es la cabecera (CSV) o el primer lote; después, un lote por trozo
+        for number, chunk in enumerate(export_rows(kind, station_id, fmt)):
+            out.write(chunk)
+            ctx.progress(message=f'{number * EXPORT_BATCH_SIZE} registros exportados')
+    os.replace(partial, path)
+    return {
+        'file': os.path.basename(path),
+        'filename': f'estacion_{station_id}_{kind}.{fmt}',
+        'mimetype': EXPORT_FORMATS[fmt],
+        'size': os.path.getsize(path),
+    }
+
+
+@job('import_records', max_attempts=1)
+def import_file(ctx, filename, dry_run=False):
+    """Importa el fichero subido con el trabajo (se guarda como <id>.upload)."""
+    with open(ctx.path('upload'), 'rb') as upload:
+        content = upload.read()
+    result = import_records(content, filename, ctx.user_id, dry_run=dry_run)
+    return {
+        'ok': result.ok,
+        'dry_run': dry_run,
+        'created': result.created,
+        'stations_touched': result.stations_touched,
+        'error_count': len(result.errors),
+        'errors': result.errors[:MAX_IMPORT_ERRORS],
+    }
+
+
+@job('rebuild_summaries')
+def rebuild_summaries_job(ctx, verify_only=False):
+    """Recalcula los resúmenes de las estaciones (flask summaries rebuild|verify)."""
+    drifted = rebuild_summaries(verify_only=verify_only)
+    return {'verify_only': verify_only, 'drifted': len(drifted), 'station_ids': drifted[:MAX_DRIFTED]}
+
+
+@job('rebuild_rollups')
+def rebuild_rollups_job(ctx, verify_only=False):
+    """Recalcula los agregados de fiabilidad (flask reliability rebuild|verify)."""
+    drifted = rebuild_rollups(verify_only=verify_only)
+    return {
+        'verify_only': verify_only,
+        'drifted': len(drifted),
+        'days': [[station_id, str(day)] for station_id, day in drifted[:MAX_DRIFTED]],
+    }
+
+
+@job('archive_history')
+def archive_history_job(ctx, older_than_days=None):
+    """Archiva el historial antiguo estación por estación (flask history archive)."""
+    days = older_than_days or current_app.config['HISTORY_ARCHIVE_AFTER_DAYS']
+    archived = {'stations': 0}
+
+    def progress(station_id, count):
+        archived['stations'] += 1
+        ctx.progress(message=f'{archived["stations"]} estaciones archivadas (última: {station_id})')
+
+    total = archive_history(days, progress=progress)
+    return {'older_than_days': days, 'stations': archived['stations'], 'archived': total}
@@ -0,0 +1,103 @@
+import hmac
+import time
+from flask import Blueprint, current_app, request, jsonify, abort
+from flask_login import login_required, current_user
+from . import db
+from .station_models import Station, Sensor
+from .timeseries import (
+    parse_readings, sensor_stations, ingest_readings, start_telemetry_worker,
+    parse_step, parse_instant, auto_step, sensor_series
+)
+
+telemetry = Blueprint('telemetry', __name__)
+
+# Errores que se devuelven como mucho en la respuesta de un lote rechazado
+MAX_ERRORS = 50
+
+
+def _ingest_allowed():
+    # Los equipos de campo se identifican con TELEMETRY_INGEST_TOKEN; los usuarios, con su sesión
+    token = current_app.config.get('TELEMETRY_INGEST_TOKEN')
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+        return True
+    return current_user.is_authenticated
+
+
+def _rejected(errors, status=400):
+    return jsonify({
+        'error': f'El lote tiene {len(errors)} error(es). No se ha aceptado ninguna lectura.',
+        'errors': [{'position': position, 'message': message} for position, message in errors[:MAX_ERRORS]],
+    }), status
+
+# Lote de lecturas: CSV (sensor_id,ts,value) o JSON ([[sensor_id, ts, value], ...])
+@telemetry.route('/readings', methods=['POST'])
+def ingest():
+    if not _ingest_allowed():
+        abort(401)
+    if request.content_length and request.content_length > current_app.config['TELEMETRY_MAX_BODY_BYTES']:
+        abort(413)
+
+    readings, errors = parse_readings(request.get_data(), request.mimetype)
+    if len(readings) + len(errors) > current_app.config['TELEMETRY_MAX_BATCH']:
+        return _rejected([(0, f'Como mucho {current_app.config["TELEMETRY_MAX_BATCH"]} lecturas por lote')], 413)
+    if not readings and not errors:
+        errors.append((0, 'El lote no tiene lecturas'))
+
+    # El lote se rechaza entero si algún sensor no existe o es de una estación eliminada
+    stations = sensor_stations({sensor_id for _, sensor_id, _, _ in readings})
+    future = time.time() + current_app.config['TELEMETRY_MAX_FUTURE_SECONDS']
+    for position, sensor_id, ts, _ in readings:
+        if sensor_id not in stations:
+            errors.append((position, f'Sensor desconocido: {sensor_id}'))
+        elif ts > future:
+            errors.append((position, f'Instante en el futuro: {ts}'))
+    if errors:
+        return _rejected(sorted(errors))
+
+    buffered = ingest_readings([(stations[sensor_id], sensor_id, ts, value) for _, sensor_id, ts, value in readings])
+    if current_app.config['TELEMETRY_WORKER']:
+        start_telemetry_worker(current_app._get_current_object())
+    return jsonify({'accepted': len(readings), 'buffered': buffered}), 202
+
+# Serie de un sensor: ?start=&end= (segundos Unix o ISO 8601) y step (30s, 5min, 1h, 1d, raw)
+@telemetry.route('/sensors/<int:sensor_id>/series')
+@login_required
+def series(sensor_id):
+    sensor = db.session.execute(
+        db.select(Sensor).join(Station, Station.id == Sensor.station_id)
+        .where(Sensor.id == sensor_id, Station.deleted_at.is_(None))
+    ).scalar_one_or_none()
+    if sensor is None:
+        abort(404)
+
+    max_points = current_app.config['TELEMETRY_MAX_POINTS']
+    try:
+        end = parse_instant(request.args['end']) if request.args.get('end') else int(time.time()) + 1
+        start = parse_instant(request.args['start']) if request.args.get('start') else end - 86400
+        if start >= end:
+            raise ValueError('start debe ser anterior a end')
+        step = request.args.get('step') or None
+        if step == 'raw':
+            step = None
+        elif step is None:
+            step = auto_step(start, end, max_points)
+        else:
+            step = parse_step(step)
+            if (end - start) / step > max_points:
+                raise ValueError(f'Demasiados puntos: como mucho {max_points} (usa un paso mayor)')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    source, points = sensor_series(sensor, start, end, step, max_points=max_points)
+    return jsonify({
+        'sensor_id': sensor.id,
+        'station_id': sensor.station_id,
+        'sensor_type': sensor.sensor_type,
+        'start': start,
+        'end': end,
+        'step': step,
+        'source': source,
+        'columns': ['ts', 'value'] if step is None else ['ts', 'min', 'max', 'mean', 'samples'],
+        'points': points,
+    })
@@ -0,0 +1,497 @@
+import atexit
+import csv
+import io
+import json
+import math
+import threading
+import time
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, func, literal, select
+from . import db
+from .station_models import Station, Sensor, SensorReading, SensorRollup, SensorRollupPending
+
+# Duraciones de los agregados en segundos: 1 minuto, 1 hora y 1 día. Cada nivel
+# se calcula a partir del anterior
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+ROLLUP_NAMES = {60: '1min', 3600: '1h', 86400: '1d'}
+
+# Unidades admitidas en el paso de las series ('30s', '5min', '1h', '1d')
+STEP_UNITS = {'s': 1, 'min': 60, 'h': 3600, 'd': 86400}
+
+# Pasos candidatos cuando no se indica ninguno: el más fino con como mucho TELEMETRY_MAX_POINTS puntos
+AUTO_STEPS = (60, 300, 900, 3600, 6 * 3600, 86400, 7 * 86400)
+
+# Filas por sentencia INSERT y sensores por consulta IN
+INSERT_BATCH_SIZE = 1000
+SENSOR_LOOKUP_CHUNK = 500
+
+# Intervalos pendientes que se agregan en cada transacción
+ROLLUP_BATCH_SIZE = 1000
+
+CSV_COLUMNS = ('sensor_id', 'ts', 'value')
+
+
+# Lectura de los lotes
+
+def _timestamp(value):
+    """Segundos Unix de un número o de una fecha ISO 8601 (sin zona: UTC)."""
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, (int, float)):
+        seconds = value
+    elif isinstance(value, str) and value.strip().lstrip('-').replace('.', '', 1).isdigit():
+        seconds = float(value)
+    elif isinstance(value, str):
+        moment = datetime.fromisoformat(value.strip())
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        seconds = moment.timestamp()
+    else:
+        raise ValueError
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError
+    return int(seconds)
+
+
+def _reading(position, sensor_id, ts, value, errors):
+    try:
+        if isinstance(sensor_id, bool):
+            raise ValueError
+        sensor_id = int(sensor_id)
+    except (TypeError, ValueError):
+        errors.append((position, f'Sensor no válido: {sensor_id!r}'))
+        return None
+    try:
+        ts = _timestamp(ts)
+    except (TypeError, ValueError, OverflowError):
+        errors.append((position, f'Instante no válido: {ts!r} (segundos Unix o fecha ISO 8601)'))
+        return None
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError
+    except (TypeError, ValueError):
+        errors.append((position, f'Valor no válido: {value!r}'))
+        return None
+    return position, sensor_id, ts, value
+
+
+def parse_readings(content, mimetype):
+    """Lee un lote de lecturas en CSV o JSON. Devuelve (lecturas, errores).
+
+    CSV: cabecera sensor_id,ts,value y una fila por lectura.
+    JSON: una lista de [sensor_id, ts, value], o {"readings": [...]} con esa lista.
+    ts son segundos Unix o una fecha ISO 8601. Las lecturas son tuplas
+    (posición, sensor_id, ts, valor) y los errores, (posición, mensaje), con la
+    línea en CSV y el índice en JSON como posición.
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    readings, errors = [], []
+
+    if mimetype == 'text/csv':
+        reader = csv.DictReader(io.StringIO(content))
+        missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            return [], [(1, f'Faltan columnas en la cabecera: {", ".join(missing)}')]
+        for record in reader:
+            reading = _reading(reader.line_num, record['sensor_id'], record['ts'], record['value'], errors)
+            if reading:
+                readings.append(reading)
+        return readings, errors
+
+    try:
+        data = json.loads(content)
+    except ValueError as e:
+        return [], [(0, f'JSON no válido: {e}')]
+    if isinstance(data, dict):
+        data = data.get('readings')
+    if not isinstance(data, list):
+        return [], [(0, 'Se esperaba una lista de [sensor_id, ts, value] o {"readings": [...]}')]
+    for index, item in enumerate(data):
+        if not isinstance(item, list) or len(item) != 3:
+            errors.append((index, 'Se esperaba [sensor_id, ts, value]'))
+            continue
+        reading = _reading(index, *item, errors)
+        if reading:
+            readings.append(reading)
+    return readings, errors
+
+
+def sensor_stations(sensor_ids):
+    """{sensor_id: station_id} de los sensores que existen en estaciones no eliminadas."""
+    sensor_ids = list(sensor_ids)
+    stations = {}
+    for start in range(0, len(sensor_ids), SENSOR_LOOKUP_CHUNK):
+        stations.update(db.session.execute(
+            select(Sensor.id, Sensor.station_id)
+            .join(Station, Station.id == Sensor.station_id)
+            .where(Sensor.id.in_(sensor_ids[start:start + SENSOR_LOOKUP_CHUNK]), Station.deleted_at.is_(None))
+        ).all())
+    return stations
+
+
+# Escritura
+
+def _upsert(model, keys, columns, rows=None):
+    # INSERT que sustituye los valores si la clave ya existe (ON CONFLICT de SQLite y PostgreSQL)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    # Sobre la tabla (Core): executemany directo, sin la capa de inserción masiva del ORM
+    statement = dialect_insert(model.__table__)
+    if rows is not None:
+        statement = statement.from_select(keys + columns, rows)
+    return statement.on_conflict_do_update(
+        index_elements=keys, set_={column: statement.excluded[column] for column in columns}
+    )
+
+
+def write_readings(rows):
+    """Escribe lecturas (station_id, sensor_id, ts, valor) con INSERTs por lotes (sin confirmar).
+
+    Una lectura repetida (mismo sensor e instante) sustituye a la anterior. Cada
+    sensor deja un intervalo pendiente de agregar. Devuelve las lecturas escritas.
+    """
+    if not rows:
+        return 0
+    statement = _upsert(SensorReading, ['station_id', 'sensor_id', 'ts'], ['value'])
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.execute(statement, [
+            {'station_id': station_id, 'sensor_id': sensor_id, 'ts': ts, 'value': value}
+            for station_id, sensor_id, ts, value in rows[start:start + INSERT_BATCH_SIZE]
+        ])
+
+    ranges = {}
+    for station_id, sensor_id, ts, _ in rows:
+        first, last = ranges.get((station_id, sensor_id), (ts, ts))
+        ranges[(station_id, sensor_id)] = (min(first, ts), max(last, ts))
+    db.session.execute(SensorRollupPending.__table__.insert(), [
+        {'station_id': station_id, 'sensor_id': sensor_id, 'first_ts': first, 'last_ts': last}
+        for (station_id, sensor_id), (first, last) in ranges.items()
+    ])
+    return len(rows)
+
+
+class ReadingBuffer:
+    """Lecturas aceptadas que todavía no se han escrito, compartidas por los hilos del proceso.
+
+    Las lecturas se acumulan hasta TELEMETRY_BUFFER_ROWS o TELEMETRY_BUFFER_SECONDS
+    y se escriben juntas: menos transacciones y sentencias más grandes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._since = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, rows):
+        """Añade lecturas (station_id, sensor_id, ts, valor). Devuelve las que hay en el buffer."""
+        with self._lock:
+            for station_id, sensor_id, ts, value in rows:
+                self._rows[(station_id, sensor_id, ts)] = value
+            if self._since is None and self._rows:
+                self._since = time.monotonic()
+            return len(self._rows)
+
+    def due(self, max_rows, max_seconds):
+        with self._lock:
+            return bool(self._rows) and (
+                len(self._rows) >= max_rows or time.monotonic() - self._since >= max_seconds
+            )
+
+    def drain(self):
+        """Vacía el buffer y devuelve sus lecturas."""
+        with self._lock:
+            rows, self._rows, self._since = self._rows, {}, None
+        return [key + (value,) for key, value in rows.items()]
+
+
+def reading_buffer(app=None):
+    """Buffer de lecturas de la aplicación (uno por app y proceso)."""
+    app = app or current_app._get_current_object()
+    return app.extensions.setdefault('telemetry_buffer', ReadingBuffer())
+
+
+def flush_readings():
+    """Escribe y confirma las lecturas del buffer. Devuelve las lecturas escritas."""
+    buffer = reading_buffer()
+    rows = buffer.drain()
+    if not rows:
+        return 0
+    try:
+        # Se descartan las lecturas de sensores o estaciones eliminados mientras estaban en el buffer
+        live = sensor_stations({sensor_id for _, sensor_id, _, _ in rows})
+        rows = [row for row in rows if live.get(row[1]) == row[0]]
+        write_readings(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Se devuelven al buffer para el siguiente intento (una lectura más reciente prevalece)
+        pending = buffer.drain()
+        buffer.add(rows)
+        buffer.add(pending)
+        raise
+    return len(rows)
+
+
+def ingest_readings(rows):
+    """Acepta lecturas (station_id, sensor_id, ts, valor) ya validadas.
+
+    Se añaden al buffer, que se escribe en esta llamada si está lleno o es
+    antiguo. Devuelve las lecturas que quedan en el buffer.
+    """
+    config = current_app.config
+    buffer = reading_buffer()
+    buffer.add(rows)
+    if buffer.due(config['TELEMETRY_BUFFER_ROWS'], config['TELEMETRY_BUFFER_SECONDS']):
+        flush_readings()
+    return len(buffer)
+
+
+# Agregados
+
+def _rollup_level(pending_ids, resolution, source):
+    # Recalcula los intervalos de resolution que cubren los intervalos pendientes, a
+    # partir de las lecturas (source None) o de los agregados de resolución source:
+    # un INSERT ... SELECT con GROUP BY para todos los sensores del lote. El rango se
+    # alinea a intervalos completos por los dos extremos: una lectura atrasada no debe
+    # recalcular su intervalo sólo con las lecturas anteriores a ella
+    ranges = select(
+        SensorRollupPending.station_id,
+        SensorRollupPending.sensor_id,
+        (func.min(SensorRollupPending.first_ts) // resolution * resolution).label('low'),
+        ((func.max(SensorRollupPending.last_ts) // resolution + 1) * resolution).label('high')
+    ).where(SensorRollupPending.id.in_(pending_ids)).group_by(
+        SensorRollupPending.station_id, SensorRollupPending.sensor_id
+    ).subquery()
+
+    if source is None:
+        table = SensorReading
+        ts = SensorReading.ts
+        aggregates = [func.count(), func.min(SensorReading.value), func.max(SensorReading.value),
+                      func.sum(SensorReading.value)]
+        condition = []
+    else:
+        table = SensorRollup
+        ts = SensorRollup.bucket
+        aggregates = [func.sum(SensorRollup.samples), func.min(SensorRollup.min_value),
+                      func.max(SensorRollup.max_value), func.sum(SensorRollup.sum_value)]
+        condition = [SensorRollup.resolution == source]
+    bucket = ts // resolution * resolution
+    rows = select(table.station_id, table.sensor_id, literal(resolution), bucket, *aggregates).join(ranges, and_(
+        table.station_id == ranges.c.station_id,
+        table.sensor_id == ranges.c.sensor_id,
+        ts >= ranges.c.low,
+        ts < ranges.c.high,
+    )).where(*condition).group_by(table.station_id, table.sensor_id, bucket)
+    db.session.execute(_upsert(
+        SensorRollup, ['station_id', 'sensor_id', 'resolution', 'bucket'],
+        ['samples', 'min_value', 'max_value', 'sum_value'], rows
+    ))
+
+
+def run_rollups(batch_size=ROLLUP_BATCH_SIZE):
+    """Recalcula los agregados de los intervalos pendientes, confirmando cada lote.
+
+    Devuelve el número de intervalos procesados.
+    """
+    total = 0
+    while True:
+        pending_ids = db.session.scalars(
+            select(SensorRollupPending.id).order_by(SensorRollupPending.id).limit(batch_size)
+        ).all()
+        if not pending_ids:
+            return total
+        source = None
+        for resolution in ROLLUP_RESOLUTIONS:
+            _rollup_level(pending_ids, resolution, source)
+            source = resolution
+        db.session.execute(delete(SensorRollupPending).where(SensorRollupPending.id.in_(pending_ids)))
+        db.session.commit()
+        total += len(pending_ids)
+
+
+def rebuild_rollups():
+    """Borra los agregados y los recalcula para todas las lecturas. Devuelve los sensores."""
+    db.session.execute(delete(SensorRollup))
+    db.session.execute(delete(SensorRollupPending))
+    ranges = db.session.execute(
+        select(SensorReading.station_id, SensorReading.sensor_id, func.min(SensorReading.ts), func.max(SensorReading.ts))
+        .group_by(SensorReading.station_id, SensorReading.sensor_id)
+    ).all()
+    if ranges:
+        db.session.execute(SensorRollupPending.__table__.insert(), [
+            {'station_id': station_id, 'sensor_id': sensor_id, 'first_ts': first, 'last_ts': last}
+            for station_id, sensor_id, first, last in ranges
+        ])
+    db.session.commit()
+    run_rollups()
+    return len(ranges)
+
+
+def start_telemetry_worker(app):
+    """Lanza (una vez por app y proceso) el hilo que escribe el buffer y recalcula los agregados.
+
+    Se ejecuta cada TELEMETRY_BUFFER_SECONDS; al terminar el proceso se escribe
+    lo que quede en el buffer.
+    """
+    state = app.extensions.setdefault('telemetry_worker', {'lock': threading.Lock(), 'thread': None})
+    with state['lock']:
+        if state['thread'] is not None:
+            return state['thread']
+
+        def work():
+            with app.app_context():
+                try:
+                    flush_readings()
+                    run_rollups()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('Error al escribir las lecturas o recalcular los agregados')
+                finally:
+                    db.session.remove()
+
+        def loop():
+            while True:
+                time.sleep(app.config['TELEMETRY_BUFFER_SECONDS'])
+                work()
+
+        state['thread'] = threading.Thread(target=loop, name='telemetry', daemon=True)
+        state['thread'].start()
+        atexit.register(work)
+        return state['thread']
+
+
+# Consultas
+
+def parse_step(value):
+    """Paso de una serie en segundos: '30s', '5min', '1h', '1d' o un número de segundos."""
+    value = value.strip().lower()
+    for unit in sorted(STEP_UNITS, key=len, reverse=True):
+        if value.endswith(unit):
+            number, factor = value[:-len(unit)], STEP_UNITS[unit]
+            break
+    else:
+        number, factor = value, 1
+    try:
+        step = int(number or 1) * factor
+    except ValueError:
+        raise ValueError(f'Paso no válido: {value!r} (ejemplos: 30s, 5min, 1h, 1d)') from None
+    if step <= 0:
+        raise ValueError(f'Paso no válido: {value!r}')
+    return step
+
+
+def parse_instant(value):
+    """Segundos Unix de un parámetro de consulta (segundos o fecha ISO 8601)."""
+    try:
+        return _timestamp(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f'Instante no válido: {value!r} (segundos Unix o fecha ISO 8601)') from None
+
+
+def auto_step(start, end, max_points):
+    """El paso más fino de AUTO_STEPS con el que la serie no pasa de max_points puntos."""
+    for step in AUTO_STEPS:
+        if (end - start) / step <= max_points:
+            return step
+    return AUTO_STEPS[-1]
+
+
+def series_source(step):
+    """El agregado más grueso con el que se puede calcular un paso (None: las lecturas)."""
+    for resolution in reversed(ROLLUP_RESOLUTIONS):
+        if step % resolution == 0:
+            return resolution
+    return None
+
+
+def _aggregate(station_id, sensor_id, start, end, step, source):
+    if source is None:
+        ts = SensorReading.ts
+        columns = [func.count(), func.min(SensorReading.value), func.max(SensorReading.value),
+                   func.sum(SensorReading.value)]
+        conditions = []
+    else:
+        ts = SensorRollup.bucket
+        columns = [func.sum(SensorRollup.samples), func.min(SensorRollup.min_value),
+                   func.max(SensorRollup.max_value), func.sum(SensorRollup.sum_value)]
+        conditions = [SensorRollup.resolution == source]
+    model = SensorReading if source is None else SensorRollup
+    bucket = (ts // step * step).label('bucket')
+    rows = db.session.execute(
+        select(bucket, *columns).where(
+            model.station_id == station_id, model.sensor_id == sensor_id, *conditions, ts >= start, ts < end
+        ).group_by(bucket).order_by(bucket)
+    ).all()
+    return [[row[0], row[2], row[3], row[4] / row[1], row[1]] for row in rows]
+
+
+def sensor_series(sensor, start, end, step=None, max_points=None):
+    """Serie de un sensor entre start y end (segundos Unix, end excluido).
+
+    Con step devuelve (origen, puntos) con puntos [inicio, mín, máx, media, lecturas]
+    por intervalo de step segundos, leídos del agregado más grueso que lo permite.
+    Los intervalos con agregados pendientes de recalcular se calculan a partir de
+    las lecturas. Sin step devuelve las lecturas [ts, valor] (como mucho max_points).
+    Las lecturas que siguen en el buffer no se incluyen.
+    """
+    if step is None:
+        query = select(SensorReading.ts, SensorReading.value).where(
+            SensorReading.station_id == sensor.station_id, SensorReading.sensor_id == sensor.id,
+            SensorReading.ts >= start, SensorReading.ts < end
+        ).order_by(SensorReading.ts)
+        if max_points is not None:
+            query = query.limit(max_points)
+        return 'raw', [list(row) for row in db.session.execute(query)]
+
+    start = start // step * step
+    source = series_source(step)
+    if source is None:
+        return 'raw', _aggregate(sensor.station_id, sensor.id, start, end, step, None)
+
+    # Desde el primer intervalo pendiente (alineado al paso) se lee de las lecturas
+    pending = db.session.scalar(
+        select(func.min(SensorRollupPending.first_ts)).where(SensorRollupPending.sensor_id == sensor.id)
+    )
+    cut = end if pending is None else min(end, max(start, pending // step * step))
+    points = _aggregate(sensor.station_id, sensor.id, start, cut, step, source) if cut > start else []
+    if cut < end:
+        points += _aggregate(sensor.station_id, sensor.id, cut, end, step, None)
+    return ROLLUP_NAMES[source], points
+
+
+telemetry_cli = AppGroup('telemetry', help='Lecturas de los sensores y sus agregados.')
+
+
+@telemetry_cli.command('rollup')
+@click.option('--rebuild', is_flag=True, help='Borrar los agregados y recalcularlos para todas las lecturas')
+def rollup_command(rebuild):
+    """Recalcula los agregados pendientes (1 min, 1 h y 1 día)."""
+    if rebuild:
+        click.echo(f'Agregados recalculados para {rebuild_rollups()} sensor(es)')
+        return
+    click.echo(f'{run_rollups()} intervalo(s) pendiente(s) agregados')
+
+
+@telemetry_cli.command('stats')
+def stats_command():
+    """Muestra el número de lecturas, agregados e intervalos pendientes."""
+    readings = db.session.scalar(select(func.count()).select_from(SensorReading))
+    click.echo(f'Lecturas: {readings}')
+    for resolution, count in db.session.execute(
+        select(SensorRollup.resolution, func.count()).group_by(SensorRollup.resolution).order_by(SensorRollup.resolution)
+    ):
+        click.echo(f'Agregados de {resolution} s: {count}')
+    pending = db.session.scalar(select(func.count()).select_from(SensorRollupPending))
+    click.echo(f'Intervalos pendientes de agregar: {pending}')
@@ -0,0 +1,30 @@
+from flask import Blueprint, render_template, request
+from flask_login import login_required
+from .station_queries import breakdown_queue_page, intervention_queue_page, triage_counts
+
+triage = Blueprint('triage', __name__)
+
+# Cola de trabajo de toda la flota
+@triage.route('/')
+@login_required
+def index():
+    kind = 'interventions' if request.args.get('kind') == 'interventions' else 'breakdowns'
+    filters = {
+        'island': request.args.get('island') or None,
+        'required_vehicle': request.args.get('required_vehicle') or None,
+    }
+    cursor = request.args.get('cursor')
+    if kind == 'breakdowns':
+        rows, next_cursor = breakdown_queue_page(cursor=cursor, **filters)
+    else:
+        rows, next_cursor = intervention_queue_page(cursor=cursor, **filters)
+
+    return render_template(
+        'triage/index.html',
+        kind=kind,
+        rows=rows,
+        counts=triage_counts(**filters),
+        filters=filters,
+        cursor=cursor,
+        next_cursor=next_cursor
+    )